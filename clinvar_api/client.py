@@ -1,6 +1,11 @@
 """REST API client code for communicating with server endpoints."""
 
+import gzip
+import hashlib
 import json
+import pathlib
+import tempfile
+import time
 import typing
 
 import attrs
@@ -8,8 +13,15 @@ import cattrs
 from jsonschema import ValidationError
 from logzero import logger
 import requests
+import urllib3
 
-from clinvar_api import common, exceptions, models, msg, schemas
+from clinvar_api import common, exceptions, models, msg, schemas, trace
+from clinvar_api.instrumentation import RequestHook, RequestRecord
+
+try:
+    import ijson  # type: ignore
+except ImportError:  # pragma: no cover
+    ijson = None
 
 #: URL of the server endpoint (non-test/production).
 ENDPOINT_URL_PROD = "https://submit.ncbi.nlm.nih.gov/api/v1/submissions/"
@@ -20,6 +32,16 @@ ENDPOINT_URL_TEST = "https://submit.ncbi.nlm.nih.gov/apitest/v1/submissions/"
 #: URL suffix for enabling dry-run.
 SUFFIX_DRYRUN = "?dry-run=true"
 
+#: HTTP status codes that are retried for idempotent requests if ``Config.max_retries`` is set.
+RETRY_STATUS_CODES = (429, 502, 503, 504)
+
+#: HTTP status codes that are retried for non-idempotent requests, where the server has
+#: rejected the request without processing it.
+RETRY_STATUS_CODES_UNSAFE = (429,)
+
+#: HTTP methods that can be repeated without side effects.
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS")
+
 
 def _obfuscate_repr(s):
     """Helper function for obfustating passwords"""
@@ -45,18 +67,179 @@ class Config:
     #: Whether to validate submission payload before posting.
     presubmission_validation: bool = True
 
+    #: Whether to decode status summary files incrementally (requires ``ijson``).
+    stream_summaries: bool = False
+
+    #: Whether to send request bodies with ``Content-Encoding: gzip``.
+    compress_requests: bool = False
+
+    #: The gzip compression level to use for request bodies (1-9).
+    compression_level: int = attrs.field(
+        default=6, validator=[attrs.validators.ge(1), attrs.validators.le(9)]
+    )
+
+    #: Directory to write full request and response bodies to, disabled if ``None``.
+    trace_dir: typing.Optional[str] = None
+
+    #: Override for the submissions endpoint URL, e.g., to use ``clinvar_api.fake_server``.
+    endpoint_url: typing.Optional[str] = None
+
+    #: Number of retries on connection errors and ``RETRY_STATUS_CODES``, submissions are only
+    #: retried if they were not sent or rejected with ``RETRY_STATUS_CODES_UNSAFE``.
+    max_retries: int = 0
+
+    #: Seconds to wait before the first retry, doubled for each further retry.
+    retry_backoff: float = 1.0
+
+
+def _endpoint_url(config: Config) -> str:
+    """Return the submissions endpoint URL to use for ``config``."""
+    if config.endpoint_url:
+        return config.endpoint_url
+    else:
+        return ENDPOINT_URL_TEST if config.use_testing else ENDPOINT_URL_PROD
+
+
+def _failed_before_sending(error: requests.ConnectionError) -> bool:
+    """Return whether ``error`` occured while connecting, before the request was sent."""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(reason, urllib3.exceptions.NewConnectionError)
+
+
+def _request(
+    endpoint: str,
+    method: str,
+    url: str,
+    config: Config,
+    hooks: typing.Sequence[RequestHook] = (),
+    *,
+    headers: typing.Optional[typing.Dict[str, str]] = None,
+    data: typing.Optional[bytes] = None,
+    stream: bool = False,
+    session: typing.Optional[requests.Session] = None,
+) -> requests.Response:
+    """Perform an HTTP request with retries, calling ``hooks`` after each attempt.
+
+    Requests with methods that are not in ``IDEMPOTENT_METHODS`` are only retried if they cannot
+    have been processed by the server, so submissions are never duplicated.  The request is sent
+    through ``session`` if given so that connections are reused.
+
+    :raises requests.ConnectionError: if the last attempt failed to connect.
+    """
+    idempotent = method in IDEMPOTENT_METHODS
+    retry_status_codes = RETRY_STATUS_CODES if idempotent else RETRY_STATUS_CODES_UNSAFE
+    attempt = 0
+    while True:
+        start = time.monotonic()
+        try:
+            response = (session or requests).request(
+                method, url, headers=headers, data=data, stream=stream
+            )
+        except requests.ConnectionError as e:
+            record = RequestRecord(
+                endpoint=endpoint,
+                method=method,
+                url=url,
+                attempt=attempt,
+                request_bytes=len(data or b""),
+                response_bytes=None,
+                ttfb=None,
+                total=time.monotonic() - start,
+                error=str(e),
+            )
+            for hook in hooks:
+                hook(record)
+            if attempt >= config.max_retries or not (idempotent or _failed_before_sending(e)):
+                raise
+        else:
+            if stream:
+                content_length = response.headers.get("Content-Length")
+                response_bytes = int(content_length) if content_length else None
+            else:
+                response_bytes = len(response.content)
+            record = RequestRecord(
+                endpoint=endpoint,
+                method=method,
+                url=url,
+                attempt=attempt,
+                request_bytes=len(data or b""),
+                response_bytes=response_bytes,
+                ttfb=response.elapsed.total_seconds(),
+                total=time.monotonic() - start,
+                status_code=response.status_code,
+            )
+            for hook in hooks:
+                hook(record)
+            if response.status_code not in retry_status_codes or attempt >= config.max_retries:
+                return response
+            response.close()  # release the connection of the discarded response
+        delay = config.retry_backoff * 2**attempt
+        attempt += 1
+        logger.warning(
+            "Retrying %s %s in %.1fs (retry %d of %d)",
+            method,
+            url,
+            delay,
+            attempt,
+            config.max_retries,
+        )
+        time.sleep(delay)
+
+
+def _post_json(
+    url: str,
+    headers: typing.Dict[str, str],
+    data: typing.Any,
+    config: Config,
+    hooks: typing.Sequence[RequestHook] = (),
+    session: typing.Optional[requests.Session] = None,
+) -> requests.Response:
+    """POST ``data`` as JSON to ``url``, gzip-compressing the body if configured."""
+    body = json.dumps(data, separators=(",", ":"), allow_nan=False).encode("utf-8")
+    trace.trace_body(config.trace_dir, "submit-request", body)
+    headers = {**headers, "Content-Type": "application/json"}
+    if config.compress_requests:
+        raw_size = len(body)
+        body = gzip.compress(body, compresslevel=config.compression_level)
+        headers["Content-Encoding"] = "gzip"
+        logger.debug("Compressed request body from %d to %d bytes", raw_size, len(body))
+    return _request(
+        "submit", "POST", url, config, hooks, headers=headers, data=body, session=session
+    )
+
+
+def _decode_json(response: requests.Response) -> typing.Any:
+    """Decode the JSON body of ``response`` exactly once.
+
+    Returns ``None`` if the body is empty or not valid JSON so callers can still build an error
+    message from the status code and reason.
+    """
+    try:
+        return response.json()
+    except ValueError:  # includes ``requests.JSONDecodeError``
+        return None
 
-def submit_data(submission_container: models.SubmissionContainer, config: Config) -> models.Created:
+
+def submit_data(
+    submission_container: models.SubmissionContainer,
+    config: Config,
+    hooks: typing.Sequence[RequestHook] = (),
+    session: typing.Optional[requests.Session] = None,
+) -> models.Created:
     """Submit new data to ClinVar API.
 
     :param payload: The submission data.
     :param config: The connfiguration to use.
+    :param hooks: Hooks to call with a ``RequestRecord`` after each HTTP request attempt.
+    :param session: Optional session to send the requests with.
     :return: The information about the created submission.
     :raises exceptions.SubmissionFailed: on problems with the submission.
     """
     logger.info("Submitting with config %s", config)
 
-    url_prefix = ENDPOINT_URL_TEST if config.use_testing else ENDPOINT_URL_PROD
+    url_prefix = _endpoint_url(config)
     url_suffix = SUFFIX_DRYRUN if config.use_dryrun else ""
     url = f"{url_prefix}{url_suffix}"
     logger.debug("Will submit to URL %s", url)
@@ -65,9 +248,11 @@ def submit_data(submission_container: models.SubmissionContainer, config: Config
     }
 
     payload = cattrs.unstructure(submission_container.to_msg())
-    logger.debug("Payload data is %s", json.dumps(payload, indent=2))
     cleaned_payload = common.clean_for_json(payload)
-    logger.debug("Cleaned payload data is %s", json.dumps(cleaned_payload, indent=2))
+    logger.debug(
+        "Payload has %d clinvar submission records",
+        len(submission_container.clinvar_submission or []),
+    )
     if config.presubmission_validation:
         logger.info("Validating payload...")
         schemas.validate_submission_payload(cleaned_payload)
@@ -80,9 +265,9 @@ def submit_data(submission_container: models.SubmissionContainer, config: Config
             {"type": "AddData", "targetDb": "clinvar", "data": {"content": cleaned_payload}}
         ]
     }
-    logger.debug("Overall POST payload is %s", post_data)
 
-    response = requests.post(url, headers=headers, json=post_data)
+    response = _post_json(url, headers, post_data, config, hooks, session)
+    trace.trace_body(config.trace_dir, "submit-response", response.content)
 
     if response.ok:
         logger.info("API returned OK - %s:  %s", response.status_code, response.reason)
@@ -90,13 +275,18 @@ def submit_data(submission_container: models.SubmissionContainer, config: Config
             logger.info("Server returned '204: No Content', constructing fake created message.")
             return models.Created(id="--NONE--dry-run-result--")
         else:
-            created_msg = common.CONVERTER.structure(response.json(), msg.Created)
+            created_msg = common.CONVERTER.structure(_decode_json(response), msg.Created)
             return models.Created.from_msg(created_msg)
     else:
         logger.warning("API returned an error - %s: %s", response.status_code, response.reason)
-        error_msg = common.CONVERTER.structure(response.json(), msg.Error)
+        response_json = _decode_json(response)
+        logger.debug("Full server response is %s", response_json)
+        if not isinstance(response_json, dict) or "message" not in response_json:
+            raise exceptions.SubmissionFailed(
+                f"ClinVar submission failed: {response.status_code} {response.reason}"
+            )
+        error_msg = common.CONVERTER.structure(response_json, msg.Error)
         error_obj = models.Error.from_msg(error_msg)
-        logger.debug("Full server response is %s", response.json())
         if hasattr(error_obj, "errors"):
             raise exceptions.SubmissionFailed(
                 f"ClinVar submission failed: {error_obj.message}, errors: {error_obj.errors}"
@@ -105,6 +295,16 @@ def submit_data(submission_container: models.SubmissionContainer, config: Config
             raise exceptions.SubmissionFailed(f"ClinVar submission failed: {error_obj.message}")
 
 
+@attrs.define(frozen=True)
+class RawSummary:
+    """Raw body of a summary file, spooled to a temporary file."""
+
+    #: Path to the temporary file, to be moved or removed by the receiver.
+    path: pathlib.Path
+    #: SHA-256 hex digest of the body.
+    digest: str
+
+
 @attrs.define(frozen=True)
 class RetrieveStatusResult:
     """Result type for ``retrieve_status`` function."""
@@ -113,58 +313,171 @@ class RetrieveStatusResult:
     status: models.SubmissionStatus
     #: A dict mapping file URLs to the parsed ``Sum``.
     summaries: typing.Dict[str, models.SummaryResponse]
+    #: A dict mapping file URLs to the raw bodies of the summary files.  The temporary files are
+    #: owned by the caller of ``retrieve_status``.
+    raw_summaries: typing.Dict[str, RawSummary] = attrs.field(factory=dict, repr=False, eq=False)
+
+
+class _SpoolingReader:
+    """Binary file wrapper that hashes the bytes read from ``inputf`` and writes them to
+    ``outputf``."""
+
+    def __init__(self, inputf: typing.BinaryIO, outputf: typing.BinaryIO):
+        self.inputf = inputf
+        self.outputf = outputf
+        self.sha256 = hashlib.sha256()
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.inputf.read(size)
+        self.sha256.update(data)
+        self.outputf.write(data)
+        return data
+
+
+def structure_summary_incrementally(inputf: typing.BinaryIO) -> models.SummaryResponse:
+    """Structure a status summary from ``inputf`` one submission at a time.
+
+    This requires the optional ``ijson`` package.  The top-level fields are collected as they are
+    seen while each element of ``submissions`` and ``deletions`` is built, structured, and then
+    dropped, so the raw document never has to be held in memory as a whole.
+
+    :param inputf: Binary file-like object with the summary JSON.
+    :return: The structured summary response.
+    :raises exceptions.ClinvarApiException: if ``ijson`` is not installed.
+    """
+    if ijson is None:
+        raise exceptions.ClinvarApiException("Incremental JSON decoding requires the ijson package")
+
+    item_types = {
+        "submissions.item": (
+            "submissions",
+            msg.SummaryResponseSubmission,
+            models.SummaryResponseSubmission,
+        ),
+        "deletions.item": (
+            "deletions",
+            msg.SummaryResponseDeletion,
+            models.SummaryResponseDeletion,
+        ),
+    }
+    header: typing.Dict[str, typing.Any] = {}
+    items: typing.Dict[str, typing.List[typing.Any]] = {}
+    builder = None
+    builder_prefix = ""
+    for prefix, event, value in ijson.parse(inputf, use_float=True):
+        if builder is not None:
+            builder.event(event, value)
+            if prefix == builder_prefix and event == "end_map":
+                key, msg_type, model_type = item_types[builder_prefix]
+                item_msg = common.CONVERTER.structure(builder.value, msg_type)
+                items.setdefault(key, []).append(model_type.from_msg(item_msg))
+                builder = None
+        elif prefix in item_types and event == "start_map":
+            builder = ijson.ObjectBuilder()
+            builder_prefix = prefix
+            builder.event(event, value)
+        elif prefix and "." not in prefix and event in ("string", "number", "boolean", "null"):
+            header[prefix] = value
+
+    sr_msg = common.CONVERTER.structure(header, msg.SummaryResponse)
+    return attrs.evolve(
+        models.SummaryResponse.from_msg(sr_msg),
+        submissions=items.get("submissions"),
+        deletions=items.get("deletions"),
+    )
 
 
 def _retrieve_status_summary(
-    url: str, validate_response_json: bool = True
-) -> models.SummaryResponse:
-    """Retrieve status summary from the given URL."""
-    response = requests.get(url)
-    if response.ok:
-        response_json = response.json()
-        if validate_response_json:
-            logger.debug("Validating status summary response ...")
-            try:
-                schemas.validate_status_summary(response_json)
-            except ValidationError as e:
-                logger.warning("Response summary validation JSON is invalid: %s", e)
-            logger.debug("... done validating status summary response")
-        sr_msg = cattrs.structure(response.json(), msg.SummaryResponse)
-        return models.SummaryResponse.from_msg(sr_msg)
-    else:
+    url: str,
+    config: Config,
+    hooks: typing.Sequence[RequestHook] = (),
+    validate_response_json: bool = True,
+    session: typing.Optional[requests.Session] = None,
+    spool_dir: typing.Optional[pathlib.Path] = None,
+) -> typing.Tuple[models.SummaryResponse, RawSummary]:
+    """Retrieve status summary from the given URL.
+
+    With ``config.stream_summaries``, the body is decoded incrementally and schema validation is
+    skipped as it would need the full document.  Streamed bodies are not traced.
+
+    :param spool_dir: Directory for the temporary file with the raw body, the default temporary
+        directory if ``None``.
+    :return: The parsed summary and the raw body.
+    """
+    stream = config.stream_summaries
+    response = _request("summary", "GET", url, config, hooks, stream=stream, session=session)
+    if not response.ok:
         raise exceptions.QueryFailed(
             f"Could not perform query: {response.status_code} {response.reason}"
         )
+    spoolf = tempfile.NamedTemporaryFile(
+        prefix=".tmp-summary-", suffix=".json", dir=spool_dir, delete=False
+    )
+    spool_path = pathlib.Path(spoolf.name)
+    try:
+        with spoolf:
+            if stream:
+                logger.debug("Decoding status summary incrementally, skipping validation")
+                response.raw.decode_content = True
+                reader = _SpoolingReader(
+                    typing.cast(typing.BinaryIO, response.raw), typing.cast(typing.BinaryIO, spoolf)
+                )
+                summary = structure_summary_incrementally(typing.cast(typing.BinaryIO, reader))
+                while reader.read(1 << 16):  # spool anything after the JSON document
+                    pass
+                digest = reader.sha256.hexdigest()
+            else:
+                spoolf.write(response.content)
+                digest = hashlib.sha256(response.content).hexdigest()
+                trace.trace_body(config.trace_dir, "summary-response", response.content)
+                response_json = _decode_json(response)
+                if validate_response_json:
+                    logger.debug("Validating status summary response ...")
+                    try:
+                        schemas.validate_status_summary(response_json)
+                    except ValidationError as e:
+                        logger.warning("Response summary validation JSON is invalid: %s", e)
+                    logger.debug("... done validating status summary response")
+                sr_msg = common.CONVERTER.structure(response_json, msg.SummaryResponse)
+                summary = models.SummaryResponse.from_msg(sr_msg)
+    except BaseException:
+        spool_path.unlink()
+        raise
+    return summary, RawSummary(spool_path, digest)
 
 
 def retrieve_status(
     submission_id: str,
     config: Config,
+    hooks: typing.Sequence[RequestHook] = (),
+    session: typing.Optional[requests.Session] = None,
+    spool_dir: typing.Optional[pathlib.Path] = None,
 ) -> RetrieveStatusResult:
     """Retrieve submission status from API.
 
     :param submission_id: The identifier of the submission as returned earlier from API.
     :param config: The connfiguration to use.
+    :param hooks: Hooks to call with a ``RequestRecord`` after each HTTP request attempt.
+    :param session: Optional session to send the requests with.
+    :param spool_dir: Directory for the temporary files with the raw summaries, see
+        ``RetrieveStatusResult.raw_summaries``.
     :return: The information about the created submission.
     :raises exceptions.QueryFailed: on problems with the communication to the server.
     """
-    url_prefix = ENDPOINT_URL_TEST if config.use_testing else ENDPOINT_URL_PROD
+    url_prefix = _endpoint_url(config)
     url_suffix = SUFFIX_DRYRUN if config.use_dryrun else ""
     url = f"{url_prefix}{submission_id}/actions/{url_suffix}"
     headers = {
         "SP-API-KEY": config.auth_token,
     }
     logger.debug("Will query URL %s", url)
-    response = requests.get(url, headers=headers)
+    response = _request("status", "GET", url, config, hooks, headers=headers, session=session)
+    trace.trace_body(config.trace_dir, "status-response", response.content)
     if response.ok:
         logger.info("API returned OK - %s: %s", response.status_code, response.reason)
         logger.debug("Structuring response ...")
-        status_msg = common.CONVERTER.structure(response.json(), msg.SubmissionStatus)
-        logger.debug(
-            "structured response is %s",
-            json.dumps(common.CONVERTER.unstructure(status_msg), indent=2),
-        )
-        logger.debug("... done structuring response")
+        status_msg = common.CONVERTER.structure(_decode_json(response), msg.SubmissionStatus)
+        logger.debug("... done structuring response with %d actions", len(status_msg.actions))
         status_obj = models.SubmissionStatus.from_msg(status_msg)
         logger.info(
             "Attempting to fetch %d status summary files...",
@@ -178,24 +491,56 @@ def retrieve_status(
             ),
         )
         summaries = {}
-        for action in status_obj.actions:
-            for action_response in action.responses:
-                for file_ in action_response.files:
-                    logger.info(" - fetching %s", file_.url)
-                    summaries[file_.url] = _retrieve_status_summary(file_.url)
+        raw_summaries: typing.Dict[str, RawSummary] = {}
+        try:
+            for action in status_obj.actions:
+                for action_response in action.responses:
+                    for file_ in action_response.files:
+                        logger.info(" - fetching %s", file_.url)
+                        summaries[file_.url], raw_summaries[file_.url] = _retrieve_status_summary(
+                            file_.url, config, hooks, session=session, spool_dir=spool_dir
+                        )
+        except BaseException:
+            for raw_summary in raw_summaries.values():
+                raw_summary.path.unlink()
+            raise
         logger.info("... done fetching status summary files")
-        return RetrieveStatusResult(status=status_obj, summaries=summaries)
+        return RetrieveStatusResult(
+            status=status_obj, summaries=summaries, raw_summaries=raw_summaries
+        )
     else:
         logger.info("API returned an error %s: %s", response.status_code, response.reason)
-        response_json = response.json()
+        response_json = _decode_json(response)
         raise exceptions.QueryFailed(f"ClinVar query failed: {response_json}")
 
 
 class Client:
-    """NCBI ClinVar REST API client."""
+    """NCBI ClinVar REST API client.
 
-    def __init__(self, config: Config):
+    The ``hooks`` are called with a ``instrumentation.RequestRecord`` after each HTTP request
+    attempt, e.g., with an ``instrumentation.StatsCollector``.  All requests are sent through one
+    ``requests.Session`` so that connections are reused, also when the client is shared between
+    threads.  Set ``pool_maxsize`` to the number of threads sharing the client if more than
+    ``requests.adapters.DEFAULT_POOLSIZE``, else connections beyond the pool size are discarded.
+    """
+
+    def __init__(
+        self,
+        config: Config,
+        hooks: typing.Optional[typing.Sequence[RequestHook]] = None,
+        session: typing.Optional[requests.Session] = None,
+        pool_maxsize: typing.Optional[int] = None,
+    ):
         self.config = config
+        self.hooks: typing.List[RequestHook] = list(hooks or [])
+        self.session = session or requests.Session()
+        if pool_maxsize is not None:
+            for prefix in ("https://", "http://"):
+                self.session.mount(prefix, requests.adapters.HTTPAdapter(pool_maxsize=pool_maxsize))
+
+    def add_hook(self, hook: RequestHook):
+        """Register ``hook`` to be called after each HTTP request attempt."""
+        self.hooks.append(hook)
 
     def submit_data(self, payload: models.SubmissionContainer) -> models.Created:
         """Submit new data to ClinVar API.
@@ -204,13 +549,16 @@ class Client:
         :return: The information about the created submission.
         :raises exceptions.SubmissionFailed: on problems with the submission.
         """
-        return submit_data(payload, self.config)
+        return submit_data(payload, self.config, self.hooks, self.session)
 
-    def retrieve_status(self, submission_id: str) -> RetrieveStatusResult:
+    def retrieve_status(
+        self, submission_id: str, spool_dir: typing.Optional[pathlib.Path] = None
+    ) -> RetrieveStatusResult:
         """Retrieve submission status from API.
 
         :param submission_id: The identifier of the submission as returned earlier from API.
+        :param spool_dir: Directory for the temporary files with the raw summaries.
         :return: The information about the created submission.
         :raises exceptions.QueryFailed: on problems with the communication to the server.
         """
-        return retrieve_status(submission_id, self.config)
+        return retrieve_status(submission_id, self.config, self.hooks, self.session, spool_dir)
@@ -0,0 +1,374 @@
+"""Local stand-in for the ClinVar submission API.
+
+The fake server implements enough of the API for end-to-end tests and benchmarks of
+``clinvar_api.client`` without contacting NCBI:
+
+- ``POST .../submissions/`` validates the payload against the bundled submission schema and
+  creates a submission (or returns ``204`` in dry-run mode),
+- ``GET .../submissions/<id>/actions/`` walks the submission through the states ``submitted``,
+  ``processing`` and ``processed``/``error``,
+- ``GET /api/2.0/files/<id>/<name>-summary-report.json/`` returns a summary file that validates
+  against the bundled summary response schema.
+
+Request latency and random ``503`` errors can be injected as well as per-record errors in the
+summary files.  Start it with ``python -m clinvar_api.fake_server --help``.
+"""
+
+import datetime
+import gzip
+import http.server
+import json
+import random
+import re
+import threading
+import time
+import typing
+import urllib.parse
+
+import attrs
+import click
+from jsonschema import ValidationError
+from logzero import logger
+
+from clinvar_api import schemas
+
+#: Pattern for the status action URL.
+_RE_ACTIONS = re.compile(r"^/api(?:test)?/v1/submissions/(?P<id>SUB\d+)/actions/?$")
+#: Pattern for the submission URL.
+_RE_SUBMISSIONS = re.compile(r"^/api(?:test)?/v1/submissions/?$")
+#: Pattern for the summary file URL.
+_RE_FILES = re.compile(r"^/api/2\.0/files/(?P<id>SUB\d+)/[^/]+-summary-report\.json/?$")
+
+
+@attrs.define(frozen=True)
+class FakeServerConfig:
+    """Configuration for the ``FakeServer``."""
+
+    #: Seconds to sleep before answering each request.
+    latency: float = 0.0
+    #: Probability of answering a request with ``503: Service Unavailable``.
+    error_rate: float = 0.0
+    #: Probability of a record being reported with an error in the summary file.
+    record_error_rate: float = 0.0
+    #: Number of status polls a submission stays in ``submitted`` and ``processing`` each.
+    polls_per_state: int = 1
+    #: Whether to validate submission payloads against the schema.
+    validate: bool = True
+    #: Seed for the random number generator, for reproducible error injection.
+    seed: typing.Optional[int] = None
+
+
+@attrs.define
+class _Submission:
+    """Internal state of a submission on the fake server."""
+
+    #: The submission ID.
+    id: str
+    #: The submitted ``SubmissionContainer`` JSON.
+    content: typing.Dict[str, typing.Any]
+    #: Creation time.
+    created: datetime.datetime
+    #: Number of status polls so far.
+    polls: int = 0
+    #: The summary file, generated once processing finished.
+    summary: typing.Optional[typing.Dict[str, typing.Any]] = None
+
+
+class FakeServerState:
+    """Thread-safe state of the fake server."""
+
+    def __init__(self, config: FakeServerConfig):
+        self.config = config
+        self.rng = random.Random(config.seed)
+        self.lock = threading.Lock()
+        self.submissions: typing.Dict[str, _Submission] = {}
+        #: Accessions assigned so far, by local key, so that updates keep their SCV.
+        self.accessions: typing.Dict[str, str] = {}
+        self.next_submission = 1
+        self.next_accession = 1
+
+    def inject_error(self) -> bool:
+        """Return whether to answer the current request with an error."""
+        with self.lock:
+            return self.rng.random() < self.config.error_rate
+
+    def create(self, content: typing.Dict[str, typing.Any]) -> str:
+        """Store a new submission and return its ID."""
+        with self.lock:
+            submission_id = f"SUB{self.next_submission:06d}"
+            self.next_submission += 1
+            self.submissions[submission_id] = _Submission(
+                id=submission_id, content=content, created=datetime.datetime.utcnow()
+            )
+            return submission_id
+
+    def _build_summary(self, submission: _Submission) -> typing.Dict[str, typing.Any]:
+        """Build the summary file for ``submission``, must be called with the lock held."""
+        records = []
+        for record in submission.content.get("clinvarSubmission", []):
+            local_key = record.get("localKey") or record.get("localID") or ""
+            identifiers = {
+                "clinvarLocalKey": local_key,
+                "localID": record.get("localID", local_key),
+                "localKey": local_key,
+            }
+            if self.rng.random() < self.config.record_error_rate:
+                records.append(
+                    {
+                        "identifiers": identifiers,
+                        "processingStatus": "Error",
+                        "errors": [
+                            {
+                                "input": [{"field": "localKey", "value": local_key}],
+                                "output": {
+                                    "errors": [{"userMessage": "Injected error by fake server"}]
+                                },
+                            }
+                        ],
+                    }
+                )
+            else:
+                accession = record.get("clinvarAccession") or self.accessions.get(local_key)
+                if not accession:
+                    accession = f"SCV{self.next_accession:09d}"
+                    self.next_accession += 1
+                self.accessions[local_key] = accession
+                identifiers["clinvarAccession"] = accession
+                records.append({"identifiers": identifiers, "processingStatus": "Success"})
+        total_errors = len([r for r in records if r["processingStatus"] == "Error"])
+        if not total_errors:
+            batch_processing_status = "Success"
+        elif total_errors == len(records):
+            batch_processing_status = "Error"
+        else:
+            batch_processing_status = "Partial success"
+        return {
+            "submissionName": submission.id,
+            "submissionDate": submission.created.strftime("%Y-%m-%d"),
+            "batchProcessingStatus": batch_processing_status,
+            "batchReleaseStatus": "Not released",
+            "totalCount": len(records),
+            "totalErrors": total_errors,
+            "totalSuccess": len(records) - total_errors,
+            "totalPublic": 0,
+            "submissions": records,
+        }
+
+    def status(self, submission_id: str, base_url: str) -> typing.Optional[typing.Dict]:
+        """Advance and return the status of the submission, ``None`` if it does not exist."""
+        with self.lock:
+            submission = self.submissions.get(submission_id)
+            if not submission:
+                return None
+            submission.polls += 1
+            if self.config.polls_per_state > 0:
+                state_idx = (submission.polls - 1) // self.config.polls_per_state
+            else:
+                state_idx = 2  # finished right away
+            updated = datetime.datetime.utcnow().isoformat() + "Z"
+            action: typing.Dict[str, typing.Any] = {
+                "id": f"{submission_id}-1",
+                "targetDb": "clinvar",
+                "updated": updated,
+                "responses": [],
+            }
+            if state_idx == 0:
+                action["status"] = "submitted"
+            elif state_idx == 1:
+                action["status"] = "processing"
+                action["responses"] = [
+                    {
+                        "status": "processing",
+                        "message": None,
+                        "files": [],
+                        "objects": [
+                            {
+                                "accession": None,
+                                "content": {
+                                    "clinvarProcessingStatus": "In processing",
+                                    "clinvarReleaseStatus": "Not released",
+                                },
+                                "targetDb": "clinvar",
+                            }
+                        ],
+                    }
+                ]
+            else:
+                if submission.summary is None:
+                    submission.summary = self._build_summary(submission)
+                processing_status = submission.summary["batchProcessingStatus"]
+                status = "processed" if processing_status == "Success" else "error"
+                action["status"] = status
+                url = (
+                    f"{base_url}/api/2.0/files/{submission_id}/"
+                    f"{submission_id.lower()}-summary-report.json/?format=attachment"
+                )
+                action["responses"] = [
+                    {
+                        "status": status,
+                        "message": {
+                            "errorCode": None if status == "processed" else "1",
+                            "severity": "info" if status == "processed" else "error",
+                            "text": (
+                                f'Your ClinVar submission processing status is "{processing_status}". '
+                                "Please find the details in the file referenced by "
+                                "actions[0].responses[0].files[0].url."
+                            ),
+                        },
+                        "files": [{"url": url}],
+                        "objects": [],
+                    }
+                ]
+            return {"actions": [action]}
+
+    def summary(self, submission_id: str) -> typing.Optional[typing.Dict[str, typing.Any]]:
+        """Return the summary file of the submission if processing has finished."""
+        with self.lock:
+            submission = self.submissions.get(submission_id)
+            return submission.summary if submission else None
+
+
+class _RequestHandler(http.server.BaseHTTPRequestHandler):
+    """Request handler for ``FakeServer``."""
+
+    server: "FakeServer"
+
+    def log_message(self, format: str, *args: typing.Any):
+        logger.debug("fake server: " + format, *args)
+
+    def _send_json(self, status: int, data: typing.Any = None):
+        body = b"" if data is None else json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        if data is not None:
+            self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _prepare(self) -> bool:
+        """Apply latency and error injection, return whether to continue."""
+        state = self.server.state
+        if state.config.latency:
+            time.sleep(state.config.latency)
+        if state.inject_error():
+            self._send_json(503, {"message": "Injected error by fake server"})
+            return False
+        return True
+
+    def _check_auth(self) -> bool:
+        if not self.headers.get("SP-API-KEY"):
+            self._send_json(401, {"message": "No valid API key provided"})
+            return False
+        return True
+
+    def do_POST(self):
+        parsed = urllib.parse.urlparse(self.path)
+        if not _RE_SUBMISSIONS.match(parsed.path):
+            return self._send_json(404, {"message": "Not found"})
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if not self._prepare() or not self._check_auth():
+            return
+        if self.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        try:
+            post_data = json.loads(body)
+            content = post_data["actions"][0]["data"]["content"]
+        except (ValueError, KeyError, IndexError, TypeError):
+            return self._send_json(400, {"message": "Malformed submission request"})
+        if self.server.state.config.validate:
+            try:
+                schemas.validate_submission_payload(content)
+            except ValidationError as e:
+                return self._send_json(400, {"message": f"Invalid submission: {e.message}"})
+        if urllib.parse.parse_qs(parsed.query).get("dry-run") == ["true"]:
+            return self._send_json(204)
+        self._send_json(201, {"id": self.server.state.create(content)})
+
+    def do_GET(self):
+        path = urllib.parse.urlparse(self.path).path
+        match_actions = _RE_ACTIONS.match(path)
+        match_files = _RE_FILES.match(path)
+        if not match_actions and not match_files:
+            return self._send_json(404, {"message": "Not found"})
+        if not self._prepare():
+            return
+        if match_actions:
+            if not self._check_auth():
+                return
+            status = self.server.state.status(match_actions.group("id"), self.server.url)
+            if status is None:
+                return self._send_json(404, {"message": "No such submission"})
+            self._send_json(200, status)
+        else:
+            summary = self.server.state.summary(match_files.group("id"))
+            if summary is None:
+                return self._send_json(404, {"message": "No such file"})
+            self._send_json(200, summary)
+
+
+class FakeServer(http.server.ThreadingHTTPServer):
+    """Threaded HTTP server implementing the fake ClinVar submission API.
+
+    Use port ``0`` to bind to a free port and ``endpoint_url`` as ``client.Config.endpoint_url``.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self, host: str = "127.0.0.1", port: int = 0, config: FakeServerConfig = FakeServerConfig()
+    ):
+        super().__init__((host, port), _RequestHandler)
+        self.state = FakeServerState(config)
+
+    @property
+    def url(self) -> str:
+        """The base URL of the server."""
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def endpoint_url(self) -> str:
+        """The submissions endpoint URL of the server."""
+        return f"{self.url}/api/v1/submissions/"
+
+
+@click.command()
+@click.option("--host", default="127.0.0.1", help="The host to bind to")
+@click.option("--port", default=8080, type=int, help="The port to bind to")
+@click.option("--latency", default=0.0, type=float, help="Seconds of latency per request")
+@click.option("--error-rate", default=0.0, type=float, help="Probability of a 503 response")
+@click.option("--record-error-rate", default=0.0, type=float, help="Probability of a record error")
+@click.option("--polls-per-state", default=1, type=int, help="Status polls per intermediate state")
+@click.option("--validate/--no-validate", default=True, help="Validate submission payloads")
+@click.option("--seed", default=None, type=int, help="Seed for error injection")
+def main(
+    host: str,
+    port: int,
+    latency: float,
+    error_rate: float,
+    record_error_rate: float,
+    polls_per_state: int,
+    validate: bool,
+    seed: typing.Optional[int],
+):
+    """Run the fake ClinVar submission API server until interrupted."""
+    config = FakeServerConfig(
+        latency=latency,
+        error_rate=error_rate,
+        record_error_rate=record_error_rate,
+        polls_per_state=polls_per_state,
+        validate=validate,
+        seed=seed,
+    )
+    server = FakeServer(host, port, config)
+    logger.info("Serving fake ClinVar API with endpoint URL %s", server.endpoint_url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:  # pragma: no cover
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
@@ -0,0 +1,147 @@
+"""Instrumentation of the HTTP requests performed by ``clinvar_api.client``.
+
+The client calls each registered hook with a ``RequestRecord`` after every HTTP request attempt,
+including attempts that are retried.  ``StatsCollector`` is a hook that aggregates the records per
+endpoint.
+"""
+
+import bisect
+import collections
+import threading
+import typing
+
+import attrs
+from tabulate import tabulate
+
+
+@attrs.define(frozen=True)
+class RequestRecord:
+    """Information about one HTTP request attempt."""
+
+    #: Logical endpoint name, one of ``"submit"``, ``"status"``, ``"summary"``.
+    endpoint: str
+    #: The HTTP method.
+    method: str
+    #: The requested URL.
+    url: str
+    #: Zero-based attempt number, values greater than zero are retries.
+    attempt: int
+    #: Number of bytes in the request body as sent.
+    request_bytes: int
+    #: Number of bytes in the response body, ``None`` if unknown (e.g., when streaming).
+    response_bytes: typing.Optional[int]
+    #: Seconds until the response headers were parsed, ``None`` if no response was received.
+    ttfb: typing.Optional[float]
+    #: Total seconds of the attempt, including reading the body unless streaming.
+    total: float
+    #: The HTTP status code, ``None`` if no response was received.
+    status_code: typing.Optional[int] = None
+    #: Description of the connection error, if any.
+    error: typing.Optional[str] = None
+
+
+#: Type of the hooks called by the client.
+RequestHook = typing.Callable[[RequestRecord], None]
+
+#: Upper bounds of the latency histogram buckets in seconds.
+HISTOGRAM_BOUNDS: typing.Tuple[float, ...] = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+@attrs.define
+class EndpointStats:
+    """Aggregated statistics for one endpoint."""
+
+    #: Number of request attempts.
+    requests: int = 0
+    #: Number of attempts that were retries.
+    retries: int = 0
+    #: Number of attempts without a response.
+    errors: int = 0
+    #: Total bytes sent.
+    request_bytes: int = 0
+    #: Total bytes received, as far as known.
+    response_bytes: int = 0
+    #: Sum of total seconds.
+    total_seconds: float = 0.0
+    #: Maximal total seconds.
+    max_seconds: float = 0.0
+    #: Counts by status code.
+    status_codes: typing.Counter[int] = attrs.field(factory=collections.Counter)
+    #: Latency histogram, the last bucket counts attempts above the largest bound.
+    histogram: typing.List[int] = attrs.field(factory=lambda: [0] * (len(HISTOGRAM_BOUNDS) + 1))
+
+    def add(self, record: RequestRecord):
+        """Add ``record`` to the statistics."""
+        self.requests += 1
+        self.retries += 1 if record.attempt > 0 else 0
+        self.request_bytes += record.request_bytes
+        self.response_bytes += record.response_bytes or 0
+        self.total_seconds += record.total
+        self.max_seconds = max(self.max_seconds, record.total)
+        if record.status_code is None:
+            self.errors += 1
+        else:
+            self.status_codes[record.status_code] += 1
+        self.histogram[bisect.bisect_left(HISTOGRAM_BOUNDS, record.total)] += 1
+
+    def quantile(self, q: float) -> float:
+        """Estimate the ``q`` quantile of the total seconds as histogram bucket upper bound."""
+        rank = q * self.requests
+        seen = 0
+        for count, bound in zip(self.histogram, HISTOGRAM_BOUNDS):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.max_seconds
+
+
+class StatsCollector:
+    """Thread-safe ``RequestHook`` that aggregates ``RequestRecord`` objects per endpoint."""
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.endpoints: typing.Dict[str, EndpointStats] = {}
+
+    def __call__(self, record: RequestRecord):
+        with self.lock:
+            self.endpoints.setdefault(record.endpoint, EndpointStats()).add(record)
+
+    def format(self) -> str:
+        """Format the aggregated statistics as a table."""
+        with self.lock:
+            if not self.endpoints:
+                return "-- NO API REQUESTS --"
+            rows = []
+            for endpoint, stats in sorted(self.endpoints.items()):
+                rows.append(
+                    [
+                        endpoint,
+                        stats.requests,
+                        stats.retries,
+                        stats.errors,
+                        ", ".join(f"{k}: {v}" for k, v in sorted(stats.status_codes.items())),
+                        stats.request_bytes,
+                        stats.response_bytes,
+                        f"{stats.total_seconds / stats.requests:.3f}",
+                        f"<={stats.quantile(0.5):.2f}",
+                        f"<={stats.quantile(0.95):.2f}",
+                        f"{stats.max_seconds:.3f}",
+                    ]
+                )
+            return tabulate(
+                rows,
+                headers=[
+                    "endpoint",
+                    "requests",
+                    "retries",
+                    "errors",
+                    "status codes",
+                    "bytes sent",
+                    "bytes received",
+                    "mean s",
+                    "p50 s",
+                    "p95 s",
+                    "max s",
+                ],
+                tablefmt="grid",
+            )
@@ -1,23 +1,35 @@
 """Helpers for schema validation."""
 
+import functools
 import json
 import pathlib
 import typing
 
-from jsonschema import validate
+from jsonschema import Draft7Validator, validate
 
 
-def validate_submission_payload(payload: typing.Any):
-    schema_path = pathlib.Path(__file__).parent / "submission_schema.json"
+@functools.lru_cache(maxsize=None)
+def _load_schema(filename: str) -> typing.Dict[str, typing.Any]:
+    schema_path = pathlib.Path(__file__).parent / filename
     with schema_path.open("rt") as inputf:
-        schema = json.load(inputf)
+        return json.load(inputf)
 
-    validate(instance=payload, schema=schema)
 
+def validate_submission_payload(payload: typing.Any):
+    validate(instance=payload, schema=_load_schema("submission_schema.json"))
 
-def validate_status_summary(payload: typing.Any):
-    schema_path = pathlib.Path(__file__).parent / "summary_response_schema.json"
-    with schema_path.open("rt") as inputf:
-        schema = json.load(inputf)
 
-    validate(instance=payload, schema=schema)
+@functools.lru_cache(maxsize=None)
+def submission_record_validator() -> Draft7Validator:
+    """Return validator for single items of ``clinvarSubmission`` in submission payloads."""
+    schema = _load_schema("submission_schema.json")
+    return Draft7Validator(
+        {
+            **schema["properties"]["clinvarSubmission"]["items"],
+            "definitions": schema["definitions"],
+        }
+    )
+
+
+def validate_status_summary(payload: typing.Any):
+    validate(instance=payload, schema=_load_schema("summary_response_schema.json"))
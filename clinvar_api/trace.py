@@ -0,0 +1,47 @@
+"""Opt-in tracing of full request and response bodies to files.
+
+Log lines only ever get a constant-size summary of a body (size and hash).  The full bodies are
+written to a trace directory when one is configured.
+"""
+
+import datetime
+import hashlib
+import itertools
+import logging
+import pathlib
+import typing
+
+from logzero import logger
+
+#: Counter for making trace file names unique within the process.
+_COUNTER = itertools.count()
+
+
+def body_summary(body: bytes) -> str:
+    """Return a short summary of ``body`` suitable for log lines."""
+    return f"{len(body)} bytes, sha256={hashlib.sha256(body).hexdigest()[:16]}"
+
+
+def write_trace(
+    trace_dir: typing.Union[str, pathlib.Path], label: str, body: bytes
+) -> pathlib.Path:
+    """Write ``body`` to a new file in ``trace_dir`` and return its path.
+
+    File names start with a timestamp and a sequence number so they sort in request order.
+    """
+    trace_path = pathlib.Path(trace_dir)
+    trace_path.mkdir(parents=True, exist_ok=True)
+    timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S%f")
+    path = trace_path / f"{timestamp}-{next(_COUNTER):06d}-{label}.json"
+    with path.open("wb") as outputf:
+        outputf.write(body)
+    return path
+
+
+def trace_body(trace_dir: typing.Optional[str], label: str, body: bytes):
+    """Trace ``body`` to ``trace_dir`` if set and log its summary at debug level."""
+    if trace_dir:
+        path = write_trace(trace_dir, label, body)
+        logger.debug("Traced %s body (%s) to %s", label, body_summary(body), path)
+    elif logger.isEnabledFor(logging.DEBUG):
+        logger.debug("The %s body has %s", label, body_summary(body))
@@ -1,149 +1,360 @@
 """Management of batches."""
 
+import concurrent.futures
+import contextlib
 import datetime
-import json
+import fnmatch
+import functools
 import pathlib
+import re
 import typing
 
+import attrs
 from attrs import evolve
 from logzero import logger
 from tabulate import tabulate
 
 from clinvar_api import client, common, models
-from clinvar_this import config, exceptions
-from clinvar_this.io import tsv
+from clinvar_api.instrumentation import RequestHook
+from clinvar_this import (
+    checks,
+    config,
+    exceptions,
+    index,
+    liftover,
+    locking,
+    merge,
+    retention,
+    storage,
+)
+from clinvar_this.io import fasta, tsv
+from clinvar_this.normalize import normalize_tsv_records
 
 #: Shared files directory
 SHARE_DIR = pathlib.Path.home() / ".local" / "share" / "clinvar-this"
 
 #: Format string
-FORMAT_STR = "%Y%m%d%H%M%S"
+FORMAT_STR = storage.FORMAT_STR
 
 
-def _list_get_batches(share_dir: pathlib.Path):
-    if not share_dir.exists():
-        return []
-    else:
-        return [share_dir / path for path in share_dir.glob("*") if path.is_dir()]
+#: Type of the batch operations that are decorated by ``_locked()``.
+BatchOperation = typing.TypeVar("BatchOperation", bound=typing.Callable[..., typing.Any])
+
+
+def _batch_index(profile: str) -> index.BatchIndex:
+    """Return the batch index of the given ``profile``."""
+    return index.BatchIndex(SHARE_DIR / profile)
+
+
+def _locked(create: bool = False) -> typing.Callable[[BatchOperation], BatchOperation]:
+    """Decorate batch operation taking ``config`` and ``name`` to hold the batch lock.
+
+    :param create: Whether to create the batch directory, otherwise no lock is taken for
+        batches that do not exist.
+    """
+
+    def decorator(func: BatchOperation) -> BatchOperation:
+        @functools.wraps(func)
+        def wrapper(config: config.Config, name: str, *args, **kwargs):
+            batch_dir = SHARE_DIR / config.profile / name
+            if create:
+                batch_dir.mkdir(parents=True, exist_ok=True)
+            elif not batch_dir.exists():
+                return func(config, name, *args, **kwargs)
+            with locking.batch_lock(batch_dir, config.lock_timeout):
+                return func(config, name, *args, **kwargs)
+
+        return typing.cast(BatchOperation, wrapper)
+
+    return decorator
+
 
+def _format_timestamp(timestamp: typing.Optional[str]) -> str:
+    if not timestamp:
+        return "-"
+    return datetime.datetime.strptime(timestamp, FORMAT_STR).strftime("%Y-%m-%d %H:%M:%S")
 
-def list_(config: config.Config):
-    """List batches to stdout."""
+
+def list_(
+    config: config.Config,
+    *,
+    pattern: typing.Optional[str] = None,
+    states: typing.Sequence[str] = (),
+    sort_by: str = "name",
+    reverse: bool = False,
+):
+    """List batches with their state to stdout.
+
+    :param pattern: Glob pattern for the names of the batches to list.
+    :param states: States of the batches to list, see ``index.BATCH_STATES``.
+    :param sort_by: Column to sort by, see ``index.SORT_KEYS``.
+    :param reverse: Whether to sort in descending order.
+    """
     print(f"Listing batches at {SHARE_DIR}/{config.profile}")
-    _ = config
-    paths = _list_get_batches(SHARE_DIR / config.profile)
-    if not paths:
+    infos = [
+        info
+        for info in _batch_index(config.profile).list_batch_infos(
+            states=states, sort_by=sort_by, reverse=reverse
+        )
+        if not pattern or fnmatch.fnmatchcase(info.name, pattern)
+    ]
+    if not infos:
         table = [["-- NO BATCHES YET --"]]
         print(tabulate(table))
     else:
-        table = [[path.name] for path in sorted(paths)]
-        print(tabulate(table, headers=["path"], tablefmt="grid"))
+        table = [
+            [
+                info.name,
+                info.state,
+                "-" if info.record_count is None else str(info.record_count),
+                "-" if info.error_count is None else str(info.error_count),
+                info.submission_id or "-",
+                info.status or "-",
+                _format_timestamp(info.created),
+                _format_timestamp(info.modified),
+            ]
+            for info in infos
+        ]
+        print(
+            tabulate(
+                table,
+                headers=[
+                    "path",
+                    "state",
+                    "records",
+                    "errors",
+                    "submission",
+                    "status",
+                    "created",
+                    "modified",
+                ],
+                tablefmt="grid",
+            )
+        )
+
+
+#: Pattern for variant queries such as ``chr7:117559590 G>A``, alleles are optional.
+RE_VARIANT_QUERY = re.compile(
+    r"^(?:(?P<assembly>GRCh3[78]|hg(?:18|19|38)|NCBI36)[:\s-]+)?"
+    r"(?:chr)?(?P<chromosome>[0-9]+|X|Y|MT?)[:-](?P<start>\d+)"
+    r"(?:[:\s-]+(?P<ref>[ACGTN]+)[>:/-](?P<alt>[ACGTN]+))?$",
+    re.IGNORECASE,
+)
+
+#: Pattern for ClinVar accessions.
+RE_ACCESSION = re.compile(r"^SCV\d+(?:\.\d+)?$", re.IGNORECASE)
+
+
+def parse_find_query(query: str) -> typing.Dict[str, typing.Any]:
+    """Parse the query of ``find()`` into keyword arguments of ``BatchIndex.find_variants()``.
+
+    Queries are variants such as ``chr7:117559590 G>A`` or ``7-117559590``, optionally preceded
+    by the assembly as in ``GRCh37:7-117559590``, accessions such as ``SCV000000001``, or local
+    keys.
+    """
+    query = query.strip()
+    if not query:
+        raise exceptions.ArgumentsError("Empty query")
+    match = RE_VARIANT_QUERY.match(query)
+    if match:
+        chromosome = match.group("chromosome").upper()
+        result: typing.Dict[str, typing.Any] = {
+            "chromosome": "MT" if chromosome == "M" else chromosome,
+            "start": int(match.group("start")),
+        }
+        if match.group("assembly"):
+            assembly = match.group("assembly").lower()
+            result["assembly"] = next(
+                choice.value for choice in models.Assembly if choice.value.lower() == assembly
+            )
+        if match.group("ref"):
+            result["reference_allele"] = match.group("ref").upper()
+            result["alternate_allele"] = match.group("alt").upper()
+        return result
+    elif RE_ACCESSION.match(query):
+        return {"accession": query.upper()}
+    else:
+        return {"local_key": query}
+
+
+def find(config: config.Config, query: str):
+    """Print the variants of all batches matching ``query`` to stdout, see ``parse_find_query()``."""
+    infos = _batch_index(config.profile).find_variants(**parse_find_query(query))
+    if not infos:
+        print(tabulate([["-- NO VARIANTS FOUND --"]]))
+        return
+    table = [
+        [
+            info.batch,
+            info.local_key,
+            f"{info.assembly or '-'} {info.chromosome or '-'}:{info.start or '-'} "
+            f"{info.reference_allele or '-'}>{info.alternate_allele or '-'}",
+            info.accession or "-",
+            info.status or "-",
+            _format_timestamp(info.timestamp),
+        ]
+        for info in infos
+    ]
+    print(
+        tabulate(
+            table,
+            headers=["batch", "local key", "variant", "accession", "status", "snapshot"],
+            tablefmt="grid",
+        )
+    )
+
+
+def reindex(config: config.Config):
+    """Rebuild the batch index of the profile from the batch directories."""
+    logger.info("Rebuilding batch index at %s/%s", SHARE_DIR, config.profile)
+    batch_index = _batch_index(config.profile)
+    batch_index.rebuild()
+    logger.info("... done rebuilding index with %d batches", len(batch_index.list_batches()))
 
 
 def gen_name(config: config.Config) -> str:
     """Generate batch name that does not exist yet."""
     base = datetime.date.today().strftime("%Y-%m-%d")
+    existing = set(_batch_index(config.profile).list_batches(prefix=base))
     for i in range(1000):
         dirname = "%s-%03d" % (base, i)
-        if not (SHARE_DIR / config.profile / dirname).exists():
+        if dirname not in existing:
             return dirname
     else:  # pragma: no cover
         raise exceptions.IOException("Could not generate batch name")
 
 
-def _write_payload(submission_container: models.SubmissionContainer, profile: str, name: str):
-    """Write out payload to a new JSON file."""
-    # Create directory for batch.
-    batch_dir = SHARE_DIR / profile / name
-    batch_dir.mkdir(exist_ok=True, parents=True)
-    # Write out payload.
-    timestamp = datetime.datetime.now().strftime(FORMAT_STR)
-    payload_path = batch_dir / f"payload.{timestamp}.json"
-    payload_json = json.dumps(common.CONVERTER.unstructure(submission_container), indent=2)
-    with payload_path.open("wt") as outputf:
-        outputf.write(payload_json)
+def _write_payload(
+    submission_container: models.SubmissionContainer,
+    config: config.Config,
+    name: str,
+    previous: typing.Optional[models.SubmissionContainer] = None,
+):
+    """Write out payload to a new snapshot, a delta to ``previous`` where possible."""
+    storage.write_payload(
+        _batch_index(config.profile),
+        name,
+        submission_container,
+        previous,
+        compression=config.storage_compression,
+        storage_format=config.storage_format,
+    )
 
 
-def _merge_submission_container(
-    base: models.SubmissionContainer,
-    patch: models.SubmissionContainer,
+def _apply_registered_accessions(
+    batch_index: index.BatchIndex, submission_container: models.SubmissionContainer
 ) -> models.SubmissionContainer:
-    """Update base submission container with new one.
-
-    The following attributes will be copied from ``patch`` to ``base``:
+    """Set the accessions registered for the records' local keys and mark them as updates.
 
-    - mode of inheritance
-    - clinical significance
-        - clinical significance description (ACMG grading)
-        - condition
+    Records that already have an accession are left as they are.
     """
-    logger.info("Merging submission information...")
-
-    def merge_submission(
-        base: models.SubmissionClinvarSubmission,
-        patch: models.SubmissionClinvarSubmission,
-    ) -> models.SubmissionClinvarSubmission:
-        return evolve(
-            base,
-            condition_set=patch.condition_set,
-            clinical_significance=patch.clinical_significance,
-            observed_in=patch.observed_in,
-        )
-
-    patch_clinvar_submission = {
-        clinvar_submission.local_key: clinvar_submission
-        for clinvar_submission in (patch.clinvar_submission or [])
-    }
-    clinvar_submissions = []
-    for submission in base.clinvar_submission or []:
-        if submission.local_key in patch_clinvar_submission:
-            clinvar_submissions.append(
-                merge_submission(submission, patch_clinvar_submission[submission.local_key])
+    records = submission_container.clinvar_submission or []
+    accessions = batch_index.lookup_accessions(
+        record.local_key for record in records if record.local_key and not record.clinvar_accession
+    )
+    if not accessions:
+        return submission_container
+    logger.info("Marking %d records with registered accessions as updates", len(accessions))
+    return evolve(
+        submission_container,
+        clinvar_submission=[
+            evolve(
+                record,
+                clinvar_accession=accessions[record.local_key],
+                record_status=models.RecordStatus.UPDATE,
             )
-        else:
-            clinvar_submissions.append(submission)
-    result = evolve(base, clinvar_submission=clinvar_submissions)
-    logger.info("... done merging submission information")
-    return result
-
-
-def import_(config: config.Config, name: str, path: str, metadata: typing.Tuple[str, ...]):
-    """Import the data file at ``path`` into the batch of name ``name``."""
-    existing_payloads = list((SHARE_DIR / config.profile / name).glob("payload.*.json"))
-    if existing_payloads:
-        logger.info("Loading existing payload for later merging with new one")
-        previous_submission_container = _load_latest_payload(config.profile, name)
-    else:
-        previous_submission_container = None
+            if record.local_key in accessions and not record.clinvar_accession
+            else record
+            for record in records
+        ],
+    )
+
+
+@_locked(create=True)
+def import_(
+    config: config.Config,
+    name: str,
+    path: str,
+    metadata: typing.Tuple[str, ...],
+    merge_options: merge.MergeOptions = merge.MergeOptions(),
+    *,
+    normalize: bool = False,
+    references: typing.Optional[typing.Mapping[str, str]] = None,
+    liftover_to: typing.Optional[str] = None,
+    liftover_from: typing.Optional[str] = None,
+    chain: typing.Optional[str] = None,
+    unmapped_path: typing.Optional[str] = None,
+):
+    """Import the data file at ``path`` into the batch of name ``name``.
+
+    The records are merged into an existing payload according to ``merge_options``.  Records
+    without accession whose ``local_key`` has an accession registered from retrieve responses of
+    any batch get this accession and are marked as updates.
+
+    :param normalize: Whether to normalize the variants, see ``clinvar_this.normalize``.
+    :param references: Paths of indexed FASTA files by assembly name to normalize against.
+    :param liftover_to: Name of the assembly to lift the records to with the chain file at
+        ``chain`` before normalization, see ``clinvar_this.liftover``.  Unmapped records are not
+        imported but written to ``unmapped_path``, by default ``<path>.unmapped.tsv``.
+    :param liftover_from: Name of the source assembly of the chain file, by default derived from
+        ``liftover_to``.  Records on other assemblies are unmapped.
+    """
+    previous_submission_container = storage.load_payload(_batch_index(config.profile), name)
+    if previous_submission_container is not None:
+        logger.info("Loaded existing payload for later merging with new one")
     if path.endswith(".tsv") or path.endswith(".txt"):
         tsv_records = tsv.read_tsv(path=path)
+        if liftover_to:
+            if not chain:
+                raise exceptions.ArgumentsError("Liftover requires a chain file")
+            tsv_records, unmapped = liftover.lift_tsv_records(
+                tsv_records,
+                liftover.load_index(chain),
+                models.Assembly(liftover_to),
+                models.Assembly(liftover_from) if liftover_from else None,
+            )
+            if unmapped:
+                unmapped_path = unmapped_path or f"{path}.unmapped.tsv"
+                logger.warning("Writing %d unmapped records to %s", len(unmapped), unmapped_path)
+                tsv.write_tsv(unmapped, path=unmapped_path)
+        if normalize:
+            if not references:
+                raise exceptions.ArgumentsError("Normalization requires reference genomes")
+            with contextlib.ExitStack() as stack:
+                tsv_records = normalize_tsv_records(
+                    tsv_records,
+                    {
+                        assembly: stack.enter_context(fasta.IndexedFasta(fasta_path))
+                        for assembly, fasta_path in references.items()
+                    },
+                )
         batch_metadata = tsv.batch_metadata_from_mapping(metadata, use_defaults=True)
         new_submission_container = tsv.tsv_records_to_submission_container(
             tsv_records, batch_metadata
         )
         if previous_submission_container:
-            submission_container = _merge_submission_container(
+            submission_container, _ = merge.merge_submission_containers(
                 base=previous_submission_container,
                 patch=new_submission_container,
+                options=merge_options,
             )
         else:
             submission_container = new_submission_container
-        _write_payload(submission_container, config.profile, name)
+        submission_container = _apply_registered_accessions(
+            _batch_index(config.profile), submission_container
+        )
+        _write_payload(submission_container, config, name, previous=previous_submission_container)
     else:
         raise exceptions.IOException(f"File extension of {path} cannot be handled.")
 
 
-def _load_latest_payload(profile: str, name: str):
-    submission_path = SHARE_DIR / profile / name
-    payload_paths = list(sorted(submission_path.glob("payload.*.json")))
-    if not payload_paths:
-        raise exceptions.ClinvarThisException(f"Found no payload JSON file at {submission_path}")
-
-    payload_path = submission_path / payload_paths[-1]
-    with payload_path.open("rt") as inputf:
-        payload_json = inputf.read()
-    payload_unstructured = json.loads(payload_json)
-    return common.CONVERTER.structure(payload_unstructured, models.SubmissionContainer)
+def _load_latest_payload(profile: str, name: str) -> models.SubmissionContainer:
+    payload = storage.load_payload(_batch_index(profile), name)
+    if payload is None:
+        raise exceptions.ClinvarThisException(
+            f"Found no payload JSON file at {SHARE_DIR / profile / name}"
+        )
+    return payload
 
 
 def export_(config: config.Config, name: str, path: str, force: bool = False):
@@ -160,22 +371,188 @@ def export_(config: config.Config, name: str, path: str, force: bool = False):
         raise exceptions.IOException(f"File extension of {path} cannot be handled.")
 
 
+@_locked()
 def update(config: config.Config, name: str, metadata: typing.Tuple[str, ...]):
-    """Update the batch' meta data."""
+    """Update the batch' meta data.
+
+    The values are applied to the latest payload in one pass, only changed records are written.
+    """
     batch_metadata = tsv.batch_metadata_from_mapping(metadata, use_defaults=False)
-    _ = batch_metadata
+    payload = _load_latest_payload(config.profile, name)
+    updated = tsv.apply_batch_metadata(payload, batch_metadata)
+    if updated == payload:
+        logger.info("Batch metadata is unchanged, not writing payload")
+        return
+    num_changed = sum(
+        new is not old
+        for new, old in zip(updated.clinvar_submission or [], payload.clinvar_submission or [])
+    )
+    logger.info("Updated metadata of %d records", num_changed)
+    _write_payload(updated, config, name, previous=payload)
+
+
+def check(
+    config: config.Config,
+    name: str,
+    *,
+    workers: int = 1,
+    references: typing.Optional[typing.Mapping[str, str]] = None,
+) -> typing.List[checks.Finding]:
+    """Check the latest payload of the batch offline and print the findings to stdout.
+
+    :param references: Paths of indexed FASTA files by assembly name to check the reference
+        alleles against.
+    :return: The findings, see ``checks.check_payload()``.
+    """
+    payload = _load_latest_payload(config.profile, name)
+    with contextlib.ExitStack() as stack:
+        fastas = {
+            assembly: stack.enter_context(fasta.IndexedFasta(path))
+            for assembly, path in (references or {}).items()
+        }
+        findings = checks.check_payload(payload, workers=workers, references=fastas)
+    if not findings:
+        print(tabulate([["-- NO PROBLEMS FOUND --"]]))
+    else:
+        table = [
+            [finding.local_key or "-", finding.severity, finding.rule, finding.message]
+            for finding in findings
+        ]
+        print(
+            tabulate(table, headers=["local key", "severity", "rule", "message"], tablefmt="grid")
+        )
+    num_errors = sum(finding.severity == checks.ERROR for finding in findings)
+    logger.info(
+        "Checked %d records: %d errors, %d warnings",
+        len(payload.clinvar_submission or []),
+        num_errors,
+        len(findings) - num_errors,
+    )
+    return findings
+
+
+#: Record fields that are updated from retrieve responses and ignored for incremental submission.
+INCREMENTAL_IGNORED_FIELDS = ("clinvar_accession", "record_status", "extra_data")
+
 
+def _accepted_payload(
+    batch_index: index.BatchIndex, name: str
+) -> typing.Optional[models.SubmissionContainer]:
+    """Return the payload of the latest submission that was processed by ClinVar, if any.
 
-def submit(config: config.Config, name: str, *, use_testing: bool = False, dry_run: bool = False):
-    """Submit the batch to ClinVar."""
+    A submission counts as processed if a status retrieved for its submission ID was
+    ``"processed"``.  Its payload is the latest snapshot written before the submission.
+    """
+    processed = {
+        submission_id
+        for _, submission_id, status in batch_index.list_statuses(name)
+        if status == "processed"
+    }
+    for timestamp, submission_id in reversed(batch_index.list_submissions(name)):
+        if submission_id in processed:
+            return storage.load_payload(batch_index, name, upto=timestamp)
+    return None
+
+
+def _incremental_payload(
+    payload: models.SubmissionContainer, accepted: models.SubmissionContainer
+) -> models.SubmissionContainer:
+    """Return ``payload`` limited to the records added or changed since ``accepted``.
+
+    If the container-level fields (e.g., the release status or the assertion criteria) changed,
+    all records are returned as the changes only apply to the records submitted with them.
+    Records with an accession are sent as updates, all others as novel records.
+    """
+
+    def comparable(record: models.SubmissionClinvarSubmission):
+        return evolve(record, **{key: None for key in INCREMENTAL_IGNORED_FIELDS})
+
+    container_changed = evolve(payload, clinvar_submission=None) != evolve(
+        accepted, clinvar_submission=None
+    )
+    if container_changed:
+        logger.info("Batch metadata changed since the last accepted submission")
+
+    accepted_records: typing.Dict[typing.Optional[str], models.SubmissionClinvarSubmission] = {
+        record.local_key: comparable(record)
+        for record in accepted.clinvar_submission or []
+        if record.local_key
+    }
+    current_keys = set()
+    records = []
+    for record in payload.clinvar_submission or []:
+        current_keys.add(record.local_key)
+        if container_changed or accepted_records.get(record.local_key) != comparable(record):
+            records.append(
+                evolve(
+                    record,
+                    record_status=models.RecordStatus.UPDATE
+                    if record.clinvar_accession
+                    else models.RecordStatus.NOVEL,
+                )
+            )
+    num_removed = len(set(accepted_records) - current_keys)
+    if num_removed:
+        logger.warning(
+            "%d records were removed since the last accepted submission, this is not submitted",
+            num_removed,
+        )
+    logger.info(
+        "Submitting %d of %d records that changed since the last accepted submission",
+        len(records),
+        len(payload.clinvar_submission or []),
+    )
+    return evolve(payload, clinvar_submission=records)
+
+
+@_locked()
+def submit(
+    config: config.Config,
+    name: str,
+    *,
+    use_testing: bool = False,
+    dry_run: bool = False,
+    full: bool = False,
+    compress_requests: bool = False,
+    compression_level: int = 6,
+    trace_dir: typing.Optional[str] = None,
+    max_retries: int = 0,
+    hooks: typing.Sequence[RequestHook] = (),
+    client_obj: typing.Optional[client.Client] = None,
+) -> typing.Optional[str]:
+    """Submit the batch to ClinVar.
+
+    Unless ``full`` is given, only the records added or changed since the last submission that
+    was processed by ClinVar are submitted.
+
+    :param client_obj: Client to use instead of creating one from the other arguments.
+    :return: The submission ID, ``None`` if nothing was submitted or in dry-run mode.
+    """
     if not config.auth_token:
         raise exceptions.ConfigException("auth_token not configured")
 
-    client_obj = client.Client(
-        client.Config(auth_token=config.auth_token, use_testing=use_testing, use_dryrun=dry_run)
-    )
+    if client_obj is None:
+        client_obj = client.Client(
+            client.Config(
+                auth_token=config.auth_token,
+                use_testing=use_testing,
+                use_dryrun=dry_run,
+                compress_requests=compress_requests,
+                compression_level=compression_level,
+                trace_dir=trace_dir,
+                max_retries=max_retries,
+            ),
+            hooks,
+        )
 
     payload = _load_latest_payload(config.profile, name)
+    if not full:
+        accepted = _accepted_payload(_batch_index(config.profile), name)
+        if accepted is not None:
+            payload = _incremental_payload(payload, accepted)
+            if not payload.clinvar_submission:
+                logger.info("No records changed since the last accepted submission, not submitting")
+                return None
 
     logger.info("Initiating submission to ClinVar API")
     client_res = client_obj.submit_data(payload)
@@ -183,14 +560,18 @@ def submit(config: config.Config, name: str, *, use_testing: bool = False, dry_r
     # Terminate earlyier in dry-run mode.
     if dry_run:
         logger.info("In dry-run mode, not writing out response.")
-        return
+        return None
 
-    timestamp = datetime.datetime.now().strftime(FORMAT_STR)
-    response_path = SHARE_DIR / config.profile / name / f"submission-response.{timestamp}.json"
-    response_data = common.CONVERTER.unstructure(client_res)
-    logger.info("Writing out server response to %s", response_path)
-    with response_path.open("wt") as outputf:
-        json.dump(response_data, outputf)
+    batch_index = _batch_index(config.profile)
+    timestamp, response_path = storage.write_json(
+        batch_index,
+        name,
+        "submission-response",
+        common.CONVERTER.unstructure(client_res),
+        compression=config.storage_compression,
+    )
+    logger.info("Wrote out server response to %s", response_path)
+    batch_index.add_submission(name, timestamp, client_res.id)
     logger.info(
         "The ClinVar API has accepted your submission and will perform additional checks in the background."
     )
@@ -202,86 +583,165 @@ def submit(config: config.Config, name: str, *, use_testing: bool = False, dry_r
         name,
     )
     logger.info("All done. Have a nice day!")
+    return client_res.id
+
+
+@attrs.define
+class RetrieveChanges:
+    """Counts of the record changes applied from a retrieve response."""
+
+    #: Records from the summaries that were found in the payload.
+    matched: int = 0
+    #: Records from the summaries that were not found in the payload.
+    unmatched: int = 0
+    #: Records with a changed accession.
+    accession: int = 0
+    #: Records with a changed record status.
+    status: int = 0
+    #: Records with a changed error message.
+    error: int = 0
+    #: Records with any change.
+    records: int = 0
 
 
 def _retrieve_store_response(
     config: config.Config, name: str, status_result: client.RetrieveStatusResult
-):
+) -> RetrieveChanges:
     """Store information from the retrieve status result into a new payload JSON file.
 
-    Currently, this is the clinvar accession only.
+    The submissions from the summaries are applied one by one to the records they refer to,
+    setting the clinvar accession, the record status, and the error message.  Other records
+    are left as they are and no payload is written if nothing changed.
     """
     logger.debug("Updating local payload from retrieve status response ...")
-    logger.debug("Obtaining local key to accession map")
-    local_key_to_accession = {}
-    local_id_to_error = {}
+    payload = _load_latest_payload(config.profile, name)
+    records = list(payload.clinvar_submission or [])
+    by_local_key = {record.local_key: i for i, record in enumerate(records) if record.local_key}
+    by_local_id = {record.local_id: i for i, record in enumerate(records) if record.local_id}
+    changes = RetrieveChanges()
+    changed_records = set()
+    accessions = []
     for summary_response in status_result.summaries.values():
-        submissions = summary_response.submissions or []
-        for submission in submissions:
-            local_key_to_accession[
-                submission.identifiers.local_key
-            ] = submission.identifiers.clinvar_accession
-            errors = [
+        for submission in summary_response.submissions or []:
+            identifiers = submission.identifiers
+            idx = by_local_key.get(identifiers.local_key or "")
+            if idx is None:
+                idx = by_local_id.get(identifiers.local_id or "")
+            if idx is None:
+                changes.unmatched += 1
+                continue
+            changes.matched += 1
+            record = records[idx]
+            clinvar_accession = identifiers.clinvar_accession or record.clinvar_accession
+            if identifiers.clinvar_accession and record.local_key:
+                accessions.append((record.local_key, identifiers.clinvar_accession))
+            record_status = (
+                models.RecordStatus.UPDATE if clinvar_accession else models.RecordStatus.NOVEL
+            )
+            error_msg = "; ".join(
                 error_inner.user_message
                 for error_outer in (submission.errors or [])
                 for error_inner in (error_outer.output.errors or [])
-            ]
-            local_id_to_error[submission.identifiers.local_id] = "; ".join(errors)
-    logger.debug("Update map is %s", local_key_to_accession)
-    logger.debug("Loading latest payload")
-    payload = _load_latest_payload(config.profile, name)
-    logger.debug("Updating local payload")
-    clinvar_submission = [
-        evolve(
-            submission,
-            clinvar_accession=local_key_to_accession.get(
-                submission.local_key, submission.clinvar_accession
+            )
+            changed = False
+            if clinvar_accession != record.clinvar_accession:
+                changes.accession += 1
+                changed = True
+            if record_status != record.record_status:
+                changes.status += 1
+                changed = True
+            if error_msg != (record.extra_data or {}).get("error_msg", ""):
+                changes.error += 1
+                changed = True
+            if changed:
+                records[idx] = evolve(
+                    record,
+                    clinvar_accession=clinvar_accession,
+                    record_status=record_status,
+                    extra_data={**(record.extra_data or {}), "error_msg": error_msg},
+                )
+                changed_records.add(idx)
+    changes.records = len(changed_records)
+    logger.info(
+        "Applied retrieve response: %d records changed (%d accessions, %d record statuses, "
+        "%d errors), %d records not found in payload",
+        changes.records,
+        changes.accession,
+        changes.status,
+        changes.error,
+        changes.unmatched,
+    )
+    if changed_records:
+        logger.debug("Write out updated payload")
+        _write_payload(evolve(payload, clinvar_submission=records), config, name, previous=payload)
+    _batch_index(config.profile).add_accessions(name, accessions)
+    logger.debug("... done updating local payload from retrieve status response")
+    return changes
+
+
+@_locked()
+def retrieve(
+    config: config.Config,
+    name: str,
+    *,
+    use_testing: bool = False,
+    trace_dir: typing.Optional[str] = None,
+    max_retries: int = 0,
+    hooks: typing.Sequence[RequestHook] = (),
+    client_obj: typing.Optional[client.Client] = None,
+) -> str:
+    """Retrieve current processing status from ClinVar.
+
+    :param client_obj: Client to use instead of creating one from the other arguments.
+    :return: The retrieved status.
+    """
+    if client_obj is None:
+        client_obj = client.Client(
+            client.Config(
+                auth_token=config.auth_token,
+                use_testing=use_testing,
+                trace_dir=trace_dir,
+                max_retries=max_retries,
             ),
-            record_status=models.RecordStatus.UPDATE
-            if submission.local_key in local_key_to_accession
-            else models.RecordStatus.NOVEL,
-            extra_data={
-                **(submission.extra_data or {}),
-                "error_msg": local_id_to_error.get(submission.local_id, ""),
-            },
+            hooks,
         )
-        for submission in payload.clinvar_submission
-    ]
-    updated_payload = evolve(payload, clinvar_submission=clinvar_submission)
-    logger.debug("Write out updated payload")
-    _write_payload(updated_payload, config.profile, name)
-    logger.debug("... done updating local payload from retrieve status response")
-
-
-def retrieve(config: config.Config, name: str, *, use_testing: bool = False):
-    """Retrieve current processing status from ClinVar."""
-    client_obj = client.Client(client.Config(auth_token=config.auth_token, use_testing=use_testing))
 
     submission_path = SHARE_DIR / config.profile / name
-    submission_response_paths = list(sorted(submission_path.glob("submission-response.*.json")))
+    batch_index = _batch_index(config.profile)
 
-    if not submission_path.exists():
+    if not batch_index.has_batch(name):
         raise exceptions.ClinvarThisException(f"Submission does not exist at {submission_path}")
-    elif not submission_response_paths:
+    submission_response_path = batch_index.latest_file(name, "submission-response")
+    if not submission_response_path:
         raise exceptions.ClinvarThisException(
             f"Submission not submitted? No submission response at {submission_path}"
         )
 
-    submission_response_path = submission_path / submission_response_paths[-1]
     logger.info("Loading response from %s", submission_response_path)
-    with submission_response_path.open("rt") as inputf:
-        created = common.CONVERTER.structure(json.load(inputf), models.Created)
+    created = common.CONVERTER.structure(
+        storage.read_json(submission_response_path), models.Created
+    )
     logger.info("Submission ID is %s", created.id)
 
     logger.info("Initiating fetching of status from ClinVar API")
-    status_result = client_obj.retrieve_status(created.id)
-    timestamp = datetime.datetime.now().strftime(FORMAT_STR)
-    retrieve_response_path = submission_path / f"retrieve-response.{timestamp}.json"
-    logger.debug("Writing out response to %s", retrieve_response_path)
-    with retrieve_response_path.open("wt") as outputf:
-        json.dump(common.CONVERTER.unstructure(status_result), outputf, indent=2)
-
+    status_result = client_obj.retrieve_status(
+        created.id, spool_dir=storage.spool_dir(batch_index, name)
+    )
+    written = storage.write_retrieve_response(
+        batch_index,
+        name,
+        created.id,
+        common.CONVERTER.unstructure(status_result.status),
+        status_result.raw_summaries,
+        compression=config.storage_compression,
+    )
     status_str = status_result.status.actions[0].status
+    if written:
+        timestamp, retrieve_response_path = written
+        logger.debug("Wrote out response to %s", retrieve_response_path)
+        batch_index.add_status(name, timestamp, status_str, created.id)
+    else:
+        logger.info("Response is unchanged since the last retrieval")
     if status_str in ["submitted", "processing"]:
         logger.info(f"Status is {status_str}, be patient and check back in a while...")
         logger.info(
@@ -289,15 +749,170 @@ def retrieve(config: config.Config, name: str, *, use_testing: bool = False):
         )
     elif status_str == "processed":
         logger.info("Submission has been processed successfully")
-        logger.info("Will now update local information from response...")
-        _retrieve_store_response(config, name, status_result)
-        logger.info("... done updating local information from response")
     elif status_str == "error":
         logger.error("There were errors in your submission")
-        logger.info("Check the file %s for details", retrieve_response_path)
+        logger.info(
+            "Check the file %s for details", batch_index.latest_file(name, "retrieve-response")
+        )
+    else:
+        logger.error("Status is %s and clinvar-this does not know how to handle this yet!")
+        raise exceptions.ClinvarThisException(f"Unknown status {status_str}")
+    if status_str in index.FINAL_STATUSES:
         logger.info("Will now update local information from response...")
         _retrieve_store_response(config, name, status_result)
         logger.info("... done updating local information from response")
+    return status_str
+
+
+@attrs.define(frozen=True)
+class BatchResult:
+    """Result of an operation on one of several batches."""
+
+    #: The batch name.
+    name: str
+    #: Whether the operation succeeded.
+    ok: bool
+    #: The operation's result or the error message.
+    message: str
+
+
+def select_batches(
+    config: config.Config,
+    pattern: typing.Optional[str] = None,
+    states: typing.Sequence[str] = (),
+) -> typing.List[str]:
+    """Return the names of the batches matching the glob ``pattern`` and in one of ``states``.
+
+    See ``index.BATCH_STATES`` for the possible states.
+    """
+    return [
+        info.name
+        for info in _batch_index(config.profile).list_batch_infos(states=states)
+        if not pattern or fnmatch.fnmatchcase(info.name, pattern)
+    ]
+
+
+def _run_all(
+    names: typing.Sequence[str], workers: int, func: typing.Callable[[str], typing.Any]
+) -> typing.List[BatchResult]:
+    """Call ``func`` for each batch name in a pool of ``workers`` threads.
+
+    Errors are reported in the results and do not affect the other batches.
+    """
+
+    def run(name: str) -> BatchResult:
+        try:
+            result = func(name)
+        except Exception as e:  # report all errors per batch
+            logger.error("Operation on batch %s failed: %s", name, e)
+            return BatchResult(name=name, ok=False, message=str(e) or e.__class__.__name__)
+        return BatchResult(name=name, ok=True, message="-" if result is None else str(result))
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(run, names))
+
+
+def submit_all(
+    config: config.Config,
+    names: typing.Sequence[str],
+    *,
+    workers: int = 4,
+    use_testing: bool = False,
+    dry_run: bool = False,
+    full: bool = False,
+    compress_requests: bool = False,
+    compression_level: int = 6,
+    trace_dir: typing.Optional[str] = None,
+    max_retries: int = 0,
+    hooks: typing.Sequence[RequestHook] = (),
+) -> typing.List[BatchResult]:
+    """Submit the given batches with a shared client, ``workers`` batches at a time."""
+    if not config.auth_token:
+        raise exceptions.ConfigException("auth_token not configured")
+    client_obj = client.Client(
+        client.Config(
+            auth_token=config.auth_token,
+            use_testing=use_testing,
+            use_dryrun=dry_run,
+            compress_requests=compress_requests,
+            compression_level=compression_level,
+            trace_dir=trace_dir,
+            max_retries=max_retries,
+        ),
+        hooks,
+        pool_maxsize=workers,
+    )
+    return _run_all(
+        names,
+        workers,
+        lambda name: submit(config, name, dry_run=dry_run, full=full, client_obj=client_obj),
+    )
+
+
+def retrieve_all(
+    config: config.Config,
+    names: typing.Sequence[str],
+    *,
+    workers: int = 4,
+    use_testing: bool = False,
+    trace_dir: typing.Optional[str] = None,
+    max_retries: int = 0,
+    hooks: typing.Sequence[RequestHook] = (),
+) -> typing.List[BatchResult]:
+    """Retrieve the status of the given batches with a shared client, ``workers`` at a time."""
+    client_obj = client.Client(
+        client.Config(
+            auth_token=config.auth_token,
+            use_testing=use_testing,
+            trace_dir=trace_dir,
+            max_retries=max_retries,
+        ),
+        hooks,
+        pool_maxsize=workers,
+    )
+    return _run_all(names, workers, lambda name: retrieve(config, name, client_obj=client_obj))
+
+
+@_locked()
+def collect(
+    config: config.Config, name: str, policy: retention.RetentionPolicy, *, dry_run: bool = False
+) -> int:
+    """Remove the history of the batch not kept by ``policy``.
+
+    :return: The number of bytes reclaimed.
+    """
+    batch_index = _batch_index(config.profile)
+    if not batch_index.has_batch(name):
+        raise exceptions.ClinvarThisException(f"Batch {name} does not exist")
+    return retention.collect_batch(batch_index, name, policy, dry_run=dry_run)
+
+
+def collect_all(
+    config: config.Config,
+    names: typing.Sequence[str],
+    policy: retention.RetentionPolicy,
+    *,
+    dry_run: bool = False,
+) -> typing.Tuple[typing.List[BatchResult], int]:
+    """Remove the history of the given batches not kept by ``policy``.
+
+    :return: The results and the total number of bytes reclaimed.
+    """
+    reclaimed: typing.Dict[str, int] = {}
+
+    def run(name: str) -> str:
+        reclaimed[name] = collect(config, name, policy, dry_run=dry_run)
+        return f"{reclaimed[name]} bytes"
+
+    return _run_all(names, 1, run), sum(reclaimed.values())
+
+
+def print_results(results: typing.Sequence[BatchResult]):
+    """Print results of operations on several batches as a table to stdout."""
+    if not results:
+        print(tabulate([["-- NO BATCHES SELECTED --"]]))
     else:
-        logger.error("Status is %s and clinvar-this does not know how to handle this yet!")
-        raise exceptions.ClinvarThisException(f"Unknown status {status_str}")
+        table = [
+            [result.name, "ok" if result.ok else "FAILED", result.message] for result in results
+        ]
+        print(tabulate(table, headers=["batch", "result", "message"], tablefmt="grid"))
@@ -0,0 +1,299 @@
+"""Offline checks of batch payloads before submission.
+
+The checks catch common reasons for ClinVar rejecting submissions without contacting the API.
+Each record is validated against the submission schema and checked by the ``RECORD_RULES``, the
+container-level fields and the records' local keys by ``check_container()``.  Records are checked
+in chunks by a pool of worker processes as the checks are CPU bound.
+
+Optionally, the reference alleles are compared to the genome with ``check_reference()``.
+"""
+
+import concurrent.futures
+import re
+import typing
+
+import attrs
+import cattrs
+
+from clinvar_api import common, models, schemas
+from clinvar_this.io.fasta import IndexedFasta
+
+#: Maximal number of records in one submission.
+MAX_RECORDS = 10_000
+
+#: Number of records checked per task in the worker processes.
+CHUNK_SIZE = 1_000
+
+#: Pattern for valid alleles.
+RE_ALLELE = re.compile(r"^[ACGTN]+$")
+
+#: Severity of findings that ClinVar rejects.
+ERROR = "error"
+#: Severity of findings that ClinVar may accept.
+WARNING = "warning"
+
+
+@attrs.define(frozen=True)
+class Finding:
+    """A problem found by a check."""
+
+    #: Severity, ``ERROR`` or ``WARNING``.
+    severity: str
+    #: Name of the rule.
+    rule: str
+    #: Description of the problem.
+    message: str
+    #: Local key of the record, ``None`` for problems of the container.
+    local_key: typing.Optional[str] = None
+
+
+def check_schema(record: models.SubmissionClinvarSubmission) -> typing.Iterator[Finding]:
+    """Validate the record against the submission schema."""
+    data = common.clean_for_json(cattrs.unstructure(record.to_msg()))
+    for error in schemas.submission_record_validator().iter_errors(data):
+        path = "/".join(str(elem) for elem in error.absolute_path)
+        if error.validator in ("anyOf", "oneOf"):  # message would contain the whole instance
+            message = "is not valid under any of the given schemas"
+        else:
+            message = error.message
+        yield Finding(ERROR, "schema", f"{path or 'record'}: {message}")
+
+
+def check_coordinates(record: models.SubmissionClinvarSubmission) -> typing.Iterator[Finding]:
+    """Check the consistency of the variants' coordinates and alleles."""
+    for variant in record.variant_set.variant if record.variant_set else []:
+        coords = variant.chromosome_coordinates
+        if not coords:
+            if not variant.hgvs:
+                yield Finding(ERROR, "coordinates", "variant has neither coordinates nor HGVS")
+            continue
+        if not coords.assembly or not coords.chromosome:
+            yield Finding(ERROR, "coordinates", "coordinates lack assembly or chromosome")
+        if coords.start is None:
+            if coords.reference_allele or coords.alternate_allele:
+                yield Finding(ERROR, "coordinates", "alleles given without start position")
+            continue
+        if coords.start < 1:
+            yield Finding(ERROR, "coordinates", f"start position {coords.start} is not positive")
+        if coords.stop is not None and coords.stop < coords.start:
+            yield Finding(
+                ERROR, "coordinates", f"stop {coords.stop} is before start {coords.start}"
+            )
+        for label, allele in (
+            ("reference", coords.reference_allele),
+            ("alternate", coords.alternate_allele),
+        ):
+            if allele is not None and not RE_ALLELE.match(allele):
+                yield Finding(ERROR, "alleles", f"invalid {label} allele {allele!r}")
+        if coords.reference_allele is not None and coords.alternate_allele is not None:
+            if coords.reference_allele == coords.alternate_allele:
+                yield Finding(ERROR, "alleles", "reference and alternate allele are equal")
+        elif not variant.variant_type and not variant.hgvs:
+            yield Finding(ERROR, "alleles", "variant has no alleles, variant type, or HGVS")
+        if coords.reference_allele and coords.stop is not None:
+            expected = coords.start + len(coords.reference_allele) - 1
+            if coords.stop != expected:
+                yield Finding(
+                    ERROR,
+                    "coordinates",
+                    f"stop {coords.stop} does not match start and reference allele "
+                    f"length, expected {expected}",
+                )
+
+
+def check_variant_presence(record: models.SubmissionClinvarSubmission) -> typing.Iterator[Finding]:
+    """Check that the record defines variants."""
+    if not any(
+        (
+            record.variant_set and record.variant_set.variant,
+            record.haplotype_set,
+            record.haplotype_single_variant_set,
+            record.phase_unknown_set,
+            record.distinct_chromosomes_set,
+            record.diplotype_set,
+            record.compound_heterozygote_set,
+        )
+    ):
+        yield Finding(ERROR, "variant", "record has no variants")
+
+
+def check_condition(record: models.SubmissionClinvarSubmission) -> typing.Iterator[Finding]:
+    """Check that the record has conditions that are identified by name or database ID."""
+    conditions = record.condition_set.condition or []
+    if not conditions and not record.condition_set.drug_response:
+        yield Finding(ERROR, "condition", "record has no condition")
+    for condition in conditions:
+        if not condition.name and not (condition.db and condition.id):
+            yield Finding(ERROR, "condition", "condition has neither name nor database and ID")
+
+
+def check_record_status(record: models.SubmissionClinvarSubmission) -> typing.Iterator[Finding]:
+    """Check that the record status fits the accession."""
+    if record.record_status == models.RecordStatus.UPDATE and not record.clinvar_accession:
+        yield Finding(ERROR, "record_status", "update of record without accession")
+    elif record.record_status == models.RecordStatus.NOVEL and record.clinvar_accession:
+        yield Finding(
+            ERROR, "record_status", f"novel record has accession {record.clinvar_accession}"
+        )
+
+
+def check_combinations(record: models.SubmissionClinvarSubmission) -> typing.Iterator[Finding]:
+    """Check combinations of enumeration values."""
+    if not record.observed_in:
+        yield Finding(ERROR, "observed_in", "record has no observations")
+    significance = record.clinical_significance
+    if (
+        significance.clinical_significance_description
+        == models.ClinicalSignificanceDescription.DRUG_RESPONSE
+        and not record.condition_set.drug_response
+    ):
+        yield Finding(ERROR, "combination", "drug response significance without drug response")
+    if significance.mode_of_inheritance and any(
+        observed_in.allele_origin == models.AlleleOrigin.SOMATIC
+        for observed_in in record.observed_in
+    ):
+        yield Finding(WARNING, "combination", "mode of inheritance given for somatic allele")
+
+
+#: The checks applied to each record.
+RECORD_RULES: typing.Tuple[
+    typing.Callable[[models.SubmissionClinvarSubmission], typing.Iterable[Finding]], ...
+] = (
+    check_schema,
+    check_variant_presence,
+    check_coordinates,
+    check_condition,
+    check_record_status,
+    check_combinations,
+)
+
+
+def check_records(
+    records: typing.Sequence[models.SubmissionClinvarSubmission],
+) -> typing.List[Finding]:
+    """Apply the ``RECORD_RULES`` to the records."""
+    return [
+        attrs.evolve(finding, local_key=record.local_key)
+        for record in records
+        for rule in RECORD_RULES
+        for finding in rule(record)
+    ]
+
+
+def check_container(container: models.SubmissionContainer) -> typing.List[Finding]:
+    """Check the container-level fields and the uniqueness of the records' local keys."""
+    result = []
+    records = container.clinvar_submission or []
+    if not records:
+        result.append(Finding(ERROR, "container", "payload has no records"))
+    elif len(records) > MAX_RECORDS:
+        result.append(
+            Finding(ERROR, "container", f"{len(records)} records exceed maximum of {MAX_RECORDS}")
+        )
+    criteria = container.assertion_criteria
+    if not criteria or not (criteria.url or (criteria.db and criteria.id)):
+        result.append(Finding(ERROR, "assertion_criteria", "assertion criteria are missing"))
+    if not container.clinvar_submission_release_status:
+        result.append(Finding(WARNING, "container", "release status is missing"))
+    seen: typing.Set[str] = set()
+    for record in records:
+        if not record.local_key:
+            result.append(Finding(WARNING, "local_key", "record has no local key"))
+        elif record.local_key in seen:
+            result.append(
+                Finding(ERROR, "local_key", "local key is not unique", local_key=record.local_key)
+            )
+        else:
+            seen.add(record.local_key)
+    return result
+
+
+def check_reference(
+    records: typing.Sequence[models.SubmissionClinvarSubmission],
+    references: typing.Mapping[str, IndexedFasta],
+) -> typing.List[Finding]:
+    """Compare the reference alleles of the records to the genome.
+
+    The variants are checked sorted by position for locality of the memory-mapped reads.
+
+    :param references: The genomes by assembly name, variants on other assemblies are skipped.
+    :return: The findings ordered by position.
+    """
+    variants = []
+    for record in records:
+        for variant in record.variant_set.variant if record.variant_set else []:
+            coords = variant.chromosome_coordinates
+            if (
+                coords
+                and coords.assembly
+                and coords.assembly.value in references
+                and coords.chromosome
+                and coords.start
+                and coords.reference_allele
+            ):
+                variants.append(
+                    (
+                        coords.assembly.value,
+                        coords.chromosome.value,
+                        coords.start,
+                        coords.reference_allele,
+                        record.local_key,
+                    )
+                )
+    variants.sort(key=lambda variant: variant[:3])
+
+    result = []
+    contigs: typing.Dict[typing.Tuple[str, str], typing.Optional[str]] = {}
+    for assembly, chromosome, start, reference_allele, local_key in variants:
+        fasta = references[assembly]
+        if (assembly, chromosome) not in contigs:
+            contigs[(assembly, chromosome)] = fasta.contig_name(chromosome)
+        contig = contigs[(assembly, chromosome)]
+        if contig is None:
+            result.append(
+                Finding(
+                    WARNING,
+                    "reference",
+                    f"chromosome {chromosome} not in {assembly} reference",
+                    local_key=local_key,
+                )
+            )
+            continue
+        expected = fasta.fetch(contig, start, start + len(reference_allele) - 1)
+        if expected != reference_allele.upper():
+            result.append(
+                Finding(
+                    ERROR,
+                    "reference",
+                    f"reference allele {reference_allele} does not match {assembly} "
+                    f"{chromosome}:{start} {expected or '(past end)'}",
+                    local_key=local_key,
+                )
+            )
+    return result
+
+
+def check_payload(
+    container: models.SubmissionContainer,
+    workers: int = 1,
+    references: typing.Optional[typing.Mapping[str, IndexedFasta]] = None,
+) -> typing.List[Finding]:
+    """Check the container and its records, using ``workers`` processes for large payloads.
+
+    :param references: Genomes by assembly name to check the reference alleles against.
+    :return: The findings of the container, those of the records in order, and those of the
+        reference alleles by position.
+    """
+    records = container.clinvar_submission or []
+    chunks = [records[i : i + CHUNK_SIZE] for i in range(0, len(records), CHUNK_SIZE)]
+    result = check_container(container)
+    if workers > 1 and len(chunks) > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            for findings in executor.map(check_records, chunks):
+                result += findings
+    else:
+        for chunk in chunks:
+            result += check_records(chunk)
+    if references:
+        result += check_reference(records, references)
+    return result
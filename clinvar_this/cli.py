@@ -2,22 +2,60 @@
 
 import typing
 
-import attrs
 import click
 
-from clinvar_this import batches, exceptions
-from clinvar_this.config import Config, dump_config, load_config, save_config
+from clinvar_api.instrumentation import StatsCollector
+from clinvar_api.models import Assembly
+from clinvar_this import batches, checks, exceptions, index, liftover, merge, retention
+from clinvar_this.config import (
+    Config,
+    dump_config,
+    load_config,
+    prune_backups,
+    save_config,
+    set_value,
+)
 
 
 @click.group()
 @click.option("--verbose/--no-verbose", default=False)
 @click.option("--profile", default="default", help="The profile to use")
+@click.option(
+    "--trace-dir",
+    default=None,
+    help="Write full API request and response bodies to files in this directory",
+)
+@click.option(
+    "--max-retries",
+    default=0,
+    type=click.IntRange(0),
+    help="Number of retries of failed API requests, submissions are only retried if not sent",
+)
+@click.option(
+    "--stats/--no-stats",
+    default=False,
+    help="Print statistics about the API requests on exit",
+)
 @click.pass_context
-def cli(ctx: click.Context, verbose: bool, profile: str):
+def cli(
+    ctx: click.Context,
+    verbose: bool,
+    profile: str,
+    trace_dir: typing.Optional[str],
+    max_retries: int,
+    stats: bool,
+):
     """Main entry point for CLI via click."""
     ctx.ensure_object(dict)
     ctx.obj["verbose"] = verbose
     ctx.obj["profile"] = profile
+    ctx.obj["trace_dir"] = trace_dir
+    ctx.obj["max_retries"] = max_retries
+    ctx.obj["hooks"] = []
+    if stats:
+        collector = StatsCollector()
+        ctx.obj["hooks"].append(collector)
+        ctx.call_on_close(lambda: print(collector.format()))
 
 
 @cli.group()
@@ -40,10 +78,10 @@ def config_set(ctx: click.Context, name: str, value: str):
         config_obj = load_config(profile)
     except exceptions.ConfigFileMissingException:
         config_obj = Config(profile=profile, auth_token="")  # swallow, will recreate
-    allowed_names = ["auth_token"]
-    if name not in allowed_names:
-        raise click.ClickException(f"Invalid value {name}, must be one of {allowed_names}")
-    config_obj = attrs.evolve(config_obj, **{name: value})
+    try:
+        config_obj = set_value(config_obj, name, value)
+    except exceptions.ConfigException as e:
+        raise click.ClickException(str(e))
     save_config(config_obj, profile)
 
 
@@ -68,17 +106,69 @@ def config_dump():
     dump_config()
 
 
+@cli.command("find")
+@click.argument("query")
+@click.pass_context
+def find(ctx: click.Context, query: str):
+    """Find variants in all batches
+
+    QUERY is a variant such as "chr7:117559590 G>A" or "7:117559590", a ClinVar accession, or a
+    local key.
+    """
+    config_obj = load_config(ctx.obj["profile"])
+    batches.find(config_obj, query)
+
+
 @cli.group("batch")
 def batch():
     """Sub comment category ``batch ...``"""
 
 
 @batch.command("list")
+@click.option("--pattern", default=None, help="Glob pattern for batch names")
+@click.option(
+    "--state",
+    "states",
+    multiple=True,
+    type=click.Choice(index.BATCH_STATES),
+    help="Only list batches in the given state",
+)
+@click.option(
+    "--sort", "sort_by", default="name", type=click.Choice(index.SORT_KEYS), help="Sort by column"
+)
+@click.option("--reverse", is_flag=True, default=False, help="Sort in descending order")
 @click.pass_context
-def batch_list(ctx: click.Context):
+def batch_list(
+    ctx: click.Context,
+    pattern: typing.Optional[str],
+    states: typing.Tuple[str, ...],
+    sort_by: str,
+    reverse: bool,
+):
     """List existing batches"""
     config_obj = load_config(ctx.obj["profile"])
-    batches.list_(config_obj)
+    batches.list_(config_obj, pattern=pattern, states=states, sort_by=sort_by, reverse=reverse)
+
+
+@batch.command("reindex")
+@click.pass_context
+def batch_reindex(ctx: click.Context):
+    """Rebuild the batch index from the batch directories"""
+    config_obj = load_config(ctx.obj["profile"])
+    batches.reindex(config_obj)
+
+
+def _parse_references(references: typing.Iterable[str]) -> typing.Dict[str, str]:
+    """Parse the ``ASSEMBLY=PATH`` values of ``--reference`` options."""
+    result = {}
+    for reference in references:
+        assembly, sep, path = reference.partition("=")
+        if not sep or assembly not in [choice.value for choice in Assembly]:
+            raise click.BadParameter(
+                f"Invalid reference {reference}, must be ASSEMBLY=PATH", param_hint="--reference"
+            )
+        result[assembly] = path
+    return result
 
 
 @batch.command("import")
@@ -91,14 +181,80 @@ def batch_list(ctx: click.Context):
     help="Provide meta data settings as KEY=VALUE settings",
 )
 @click.option("--name", required=False, default=None, help="Name of the batch to create or add to")
+@click.option(
+    "--match-variants/--no-match-variants",
+    default=False,
+    help="Match records with unknown local key to existing records by variant coordinates",
+)
+@click.option(
+    "--delete-missing/--no-delete-missing",
+    default=False,
+    help="Delete existing records that are not in the imported file",
+)
+@click.option(
+    "--field-policy",
+    multiple=True,
+    help="Merge policy for a record field as FIELD=POLICY, POLICY is overwrite, keep, or fill",
+)
+@click.option(
+    "--normalize/--no-normalize",
+    default=False,
+    help="Trim and left-align the variants against the reference genome",
+)
+@click.option(
+    "--reference",
+    "references",
+    multiple=True,
+    help="ASSEMBLY=PATH of an indexed FASTA file to normalize against",
+)
+@click.option(
+    "--liftover-to",
+    type=click.Choice([choice.value for choice in Assembly]),
+    default=None,
+    help="Lift records on other assemblies to this assembly before import",
+)
+@click.option(
+    "--liftover-from",
+    type=click.Choice([choice.value for choice in Assembly]),
+    default=None,
+    help="Source assembly of the chain file, default is GRCh37 for GRCh38 and vice versa",
+)
+@click.option("--chain", default=None, help="UCSC chain file to use for liftover")
+@click.option(
+    "--unmapped",
+    default=None,
+    help="Path to write records that cannot be lifted to, default is PATH.unmapped.tsv",
+)
 @click.pass_context
 def batch_import(
     ctx: click.Context,
     path: str,
     name: typing.Optional[str] = None,
     metadata: typing.Optional[typing.Tuple[str, ...]] = None,
+    match_variants: bool = False,
+    delete_missing: bool = False,
+    field_policy: typing.Tuple[str, ...] = (),
+    normalize: bool = False,
+    references: typing.Tuple[str, ...] = (),
+    liftover_to: typing.Optional[str] = None,
+    liftover_from: typing.Optional[str] = None,
+    chain: typing.Optional[str] = None,
+    unmapped: typing.Optional[str] = None,
 ):
     """Import data for a new or existing batch"""
+    try:
+        field_policies = merge.parse_field_policies(field_policy)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint="--field-policy")
+    reference_paths = _parse_references(references)
+    if normalize and not reference_paths:
+        raise click.UsageError("--normalize requires at least one --reference")
+    if liftover_to and not chain:
+        raise click.UsageError("--liftover-to requires --chain")
+    if liftover_from and not liftover_to:
+        raise click.UsageError("--liftover-from requires --liftover-to")
+    if liftover_to and not liftover_from and Assembly(liftover_to) not in liftover.DEFAULT_SOURCE:
+        raise click.UsageError(f"--liftover-to {liftover_to} requires --liftover-from")
     config_obj = load_config(ctx.obj["profile"])
     if not name:
         name = batches.gen_name(config_obj)
@@ -107,7 +263,24 @@ def batch_import(
         metadata = ()
     print(f"metadata = {metadata}")
     config_obj = load_config(ctx.obj["profile"])
-    batches.import_(config_obj, name, path, metadata)
+    merge_options = merge.MergeOptions(
+        match_variants=match_variants,
+        delete_missing=delete_missing,
+        field_policies=field_policies,
+    )
+    batches.import_(
+        config_obj,
+        name,
+        path,
+        metadata,
+        merge_options,
+        normalize=normalize,
+        references=reference_paths,
+        liftover_to=liftover_to,
+        liftover_from=liftover_from,
+        chain=chain,
+        unmapped_path=unmapped,
+    )
 
 
 @batch.command("export")
@@ -141,6 +314,80 @@ def batch_update(
     batches.update(config_obj, name, metadata)
 
 
+@batch.command("check")
+@click.option(
+    "--workers", default=1, type=click.IntRange(1), help="Number of processes checking records"
+)
+@click.option(
+    "--reference",
+    "references",
+    multiple=True,
+    help="ASSEMBLY=PATH of an indexed FASTA file to check reference alleles against",
+)
+@click.argument("name")
+@click.pass_context
+def batch_check(ctx: click.Context, workers: int, references: typing.Tuple[str, ...], name: str):
+    """Check the batch for common problems without contacting ClinVar"""
+    config_obj = load_config(ctx.obj["profile"])
+    findings = batches.check(
+        config_obj, name, workers=workers, references=_parse_references(references)
+    )
+    if any(finding.severity == checks.ERROR for finding in findings):
+        ctx.exit(1)
+
+
+def _selection_options(default_states: typing.Tuple[str, ...]):
+    """Return decorator adding the options for selecting multiple batches to a command."""
+
+    def decorator(func):
+        for option in reversed(
+            [
+                click.option(
+                    "--all",
+                    "all_",
+                    is_flag=True,
+                    default=False,
+                    help="Process all batches selected by --pattern and --state instead of NAME",
+                ),
+                click.option("--pattern", default=None, help="Glob pattern for batch names"),
+                click.option(
+                    "--state",
+                    "states",
+                    multiple=True,
+                    type=click.Choice(index.BATCH_STATES),
+                    default=default_states,
+                    show_default=True,
+                    help="Batch states to select with --all",
+                ),
+                click.option(
+                    "--workers",
+                    default=4,
+                    type=click.IntRange(1, 64),
+                    help="Number of batches to process in parallel with --all",
+                ),
+            ]
+        ):
+            func = option(func)
+        return func
+
+    return decorator
+
+
+def _selected_batches(
+    config_obj: Config,
+    name: typing.Optional[str],
+    all_: bool,
+    pattern: typing.Optional[str],
+    states: typing.Tuple[str, ...],
+) -> typing.Optional[typing.List[str]]:
+    """Return the batch names selected with ``--all`` or ``None`` if ``NAME`` was given."""
+    if bool(name) == all_:
+        raise click.UsageError("Specify either NAME or --all")
+    if name:
+        return None
+    return batches.select_batches(config_obj, pattern, states)
+
+
 @batch.command("submit")
 @click.option(
     "--use-testing/--no-testing",
@@ -154,12 +401,74 @@ def batch_update(
     default=False,
     help="Whether to use the ClinVar dry-run",
 )
-@click.argument("name")
+@click.option(
+    "--compress/--no-compress",
+    required=False,
+    default=False,
+    help="Whether to gzip-compress the request body",
+)
+@click.option(
+    "--compression-level",
+    required=False,
+    default=6,
+    type=click.IntRange(1, 9),
+    help="The gzip compression level to use with --compress",
+)
+@click.option(
+    "--full/--incremental",
+    required=False,
+    default=False,
+    help="Whether to submit all records or only those changed since the last accepted submission",
+)
+@_selection_options(default_states=("unsubmitted",))
+@click.argument("name", required=False)
 @click.pass_context
-def batch_submit(ctx: click.Context, use_testing: bool, dry_run: bool, name: str):
-    """Submit the given batch to ClinVar"""
+def batch_submit(
+    ctx: click.Context,
+    use_testing: bool,
+    dry_run: bool,
+    compress: bool,
+    compression_level: int,
+    full: bool,
+    all_: bool,
+    pattern: typing.Optional[str],
+    states: typing.Tuple[str, ...],
+    workers: int,
+    name: typing.Optional[str] = None,
+):
+    """Submit the given batch or all selected batches to ClinVar"""
     config_obj = load_config(ctx.obj["profile"])
-    batches.submit(config_obj, name, use_testing=use_testing, dry_run=dry_run)
+    names = _selected_batches(config_obj, name, all_, pattern, states)
+    if names is not None:
+        results = batches.submit_all(
+            config_obj,
+            names,
+            workers=workers,
+            use_testing=use_testing,
+            dry_run=dry_run,
+            full=full,
+            compress_requests=compress,
+            compression_level=compression_level,
+            trace_dir=ctx.obj["trace_dir"],
+            max_retries=ctx.obj["max_retries"],
+            hooks=ctx.obj["hooks"],
+        )
+        batches.print_results(results)
+        if not all(result.ok for result in results):
+            ctx.exit(1)
+        return
+    batches.submit(
+        config_obj,
+        typing.cast(str, name),
+        use_testing=use_testing,
+        dry_run=dry_run,
+        full=full,
+        compress_requests=compress,
+        compression_level=compression_level,
+        trace_dir=ctx.obj["trace_dir"],
+        max_retries=ctx.obj["max_retries"],
+        hooks=ctx.obj["hooks"],
+    )
 
 
 @batch.command("retrieve")
@@ -169,9 +478,98 @@ def batch_submit(ctx: click.Context, use_testing: bool, dry_run: bool, name: str
     default=False,
     help="Whether to use the testing API",
 )
-@click.argument("name")
+@_selection_options(default_states=("pending",))
+@click.argument("name", required=False)
 @click.pass_context
-def batch_retrieve(ctx: click.Context, use_testing: bool, name: str):
-    """Submit the given batch to ClinVar"""
+def batch_retrieve(
+    ctx: click.Context,
+    use_testing: bool,
+    all_: bool,
+    pattern: typing.Optional[str],
+    states: typing.Tuple[str, ...],
+    workers: int,
+    name: typing.Optional[str] = None,
+):
+    """Retrieve the status of the given batch or all selected batches from ClinVar"""
+    config_obj = load_config(ctx.obj["profile"])
+    names = _selected_batches(config_obj, name, all_, pattern, states)
+    if names is not None:
+        results = batches.retrieve_all(
+            config_obj,
+            names,
+            workers=workers,
+            use_testing=use_testing,
+            trace_dir=ctx.obj["trace_dir"],
+            max_retries=ctx.obj["max_retries"],
+            hooks=ctx.obj["hooks"],
+        )
+        batches.print_results(results)
+        if not all(result.ok for result in results):
+            ctx.exit(1)
+        return
+    batches.retrieve(
+        config_obj,
+        typing.cast(str, name),
+        use_testing=use_testing,
+        trace_dir=ctx.obj["trace_dir"],
+        max_retries=ctx.obj["max_retries"],
+        hooks=ctx.obj["hooks"],
+    )
+
+
+@batch.command("gc")
+@click.option("--pattern", default=None, help="Glob pattern for batch names")
+@click.option(
+    "--keep-last",
+    default=retention.RetentionPolicy().keep_last,
+    type=click.IntRange(1),
+    help="Number of latest payload versions and retrieve responses to keep",
+)
+@click.option(
+    "--keep-days",
+    default=None,
+    type=click.FloatRange(0),
+    help="Also keep payload versions and retrieve responses newer than this many days",
+)
+@click.option(
+    "--keep-config-backups",
+    default=retention.RetentionPolicy().keep_config_backups,
+    type=click.IntRange(0),
+    help="Number of configuration file backups to keep",
+)
+@click.option(
+    "--dry-run/--no-dry-run", default=False, help="Only report the bytes that would be reclaimed"
+)
+@click.argument("names", nargs=-1)
+@click.pass_context
+def batch_gc(
+    ctx: click.Context,
+    pattern: typing.Optional[str],
+    keep_last: int,
+    keep_days: typing.Optional[float],
+    keep_config_backups: int,
+    dry_run: bool,
+    names: typing.Tuple[str, ...],
+):
+    """Remove old history of the given or all batches
+
+    Submitted payloads and the submission responses are always kept.
+    """
     config_obj = load_config(ctx.obj["profile"])
-    batches.retrieve(config_obj, name, use_testing=use_testing)
+    policy = retention.RetentionPolicy(
+        keep_last=keep_last, keep_days=keep_days, keep_config_backups=keep_config_backups
+    )
+    results, reclaimed = batches.collect_all(
+        config_obj,
+        list(names) or batches.select_batches(config_obj, pattern),
+        policy,
+        dry_run=dry_run,
+    )
+    batches.print_results(results)
+    backups = prune_backups(policy.keep_config_backups, dry_run=dry_run)
+    print(
+        f"{'Would reclaim' if dry_run else 'Reclaimed'} {reclaimed + backups} bytes in total "
+        f"({backups} bytes of configuration backups)"
+    )
+    if not all(result.ok for result in results):
+        ctx.exit(1)
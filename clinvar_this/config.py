@@ -29,6 +29,21 @@ class Config:
     #: The authentication token to use in the API.
     auth_token: str = attrs.field(repr=_obfuscate_repr)
 
+    #: Compression of new files in the batch directories, one of "none", "gzip", "zstd".
+    storage_compression: str = attrs.field(
+        default="none", validator=attrs.validators.in_(("none", "gzip", "zstd"))
+    )
+
+    #: Storage format of new batches, "json" for payload snapshots or "jsonl" for a record store.
+    storage_format: str = attrs.field(
+        default="json", validator=attrs.validators.in_(("json", "jsonl"))
+    )
+
+    #: Seconds to wait for the lock of a batch that is used by another process.
+    lock_timeout: float = attrs.field(
+        default=60.0, converter=float, validator=attrs.validators.ge(0)
+    )
+
 
 def load_config(profile: str = "default") -> Config:
     """Load configuration for the given profile.
@@ -53,7 +68,31 @@ def load_config(profile: str = "default") -> Config:
                 f"Problem decoding configuration file {config_path}"
             ) from e
 
-    return Config(profile=profile, auth_token=config_dict.get(profile, {}).get("auth_token"))
+    profile_dict = config_dict.get(profile, {})
+    field_names = {field.name for field in attrs.fields(Config)} - {"profile", "auth_token"}
+    kwargs = {key: value for key, value in profile_dict.items() if key in field_names}
+    try:
+        return Config(profile=profile, auth_token=profile_dict.get("auth_token"), **kwargs)
+    except ValueError as e:
+        raise exceptions.ConfigException(f"Invalid configuration in {config_path}: {e}") from e
+
+
+def set_value(config: Config, name: str, value: str) -> Config:
+    """Return copy of ``config`` with the setting ``name`` set to the string ``value``.
+
+    :raises exceptions.ConfigException: if the setting is unknown or the value is invalid.
+    """
+    field_types = {
+        field.name: field.type for field in attrs.fields(Config) if field.name != "profile"
+    }
+    if name not in field_types:
+        raise exceptions.ConfigException(
+            f"Invalid value {name}, must be one of {list(field_types)}"
+        )
+    try:
+        return attrs.evolve(config, **{name: cattrs.structure(value, field_types[name])})
+    except ValueError as e:
+        raise exceptions.ConfigException(f"Invalid value {value} for {name}: {e}") from e
 
 
 def save_config(config: Config, profile: str = "default"):
@@ -74,12 +113,35 @@ def save_config(config: Config, profile: str = "default"):
         config_path.rename(backup_path)
 
     all_config.setdefault("default", {})
-    all_config[profile] = {k: v for k, v in cattrs.unstructure(config).items() if k != "profile"}
+    defaults = {field.name: field.default for field in attrs.fields(Config)}
+    all_config[profile] = {
+        k: v
+        for k, v in cattrs.unstructure(config).items()
+        if k != "profile" and (k == "auth_token" or v != defaults[k])
+    }
 
     with config_path.open("wt") as configf:
         toml.dump(all_config, configf)
 
 
+def prune_backups(keep: int, dry_run: bool = False) -> int:
+    """Remove all but the ``keep`` latest backups written by ``save_config()``.
+
+    :return: The number of bytes reclaimed (or that would be with ``dry_run``).
+    """
+    config_path = pathlib.Path.home() / ".config" / "clinvar-this" / "config.toml"
+    if not config_path.parent.exists():
+        return 0
+    # the timestamp suffixes sort in chronological order
+    backups = sorted(config_path.parent.glob(config_path.name + "~*"))
+    obsolete = backups[: max(len(backups) - keep, 0)]
+    reclaimed = sum(path.stat().st_size for path in obsolete)
+    if not dry_run:
+        for path in obsolete:
+            path.unlink()
+    return reclaimed
+
+
 def dump_config(outf=None):
     """Dump configuraiton file to ``outf``."""
     if not outf:
@@ -23,3 +23,7 @@ class ArgumentsError(ClinvarThisException):
 
 class InvalidFormat(ClinvarThisException):
     """Raised on problems file contents in ``clinvar-this``."""
+
+
+class LockTimeout(ClinvarThisException):
+    """Raised if a batch lock could not be acquired in time."""
@@ -0,0 +1,603 @@
+"""Per-profile SQLite index of batches and the files in their directories.
+
+The index is derived data that is maintained by every batch operation so that listing batches
+with their state and finding the latest payload or response file does not need to scan
+directories or parse payloads.  It also holds the variants of the latest payload of each batch
+so that variants can be found by coordinates, ``local_key``, or accession across all batches of
+the profile, and the registry of the accessions retrieved for each ``local_key`` that is used
+to mark records of new imports as updates.  It can be rebuilt from the batch directories at any
+time with ``rebuild()``.
+"""
+
+import contextlib
+import json
+import pathlib
+import re
+import sqlite3
+import typing
+
+import attrs
+from logzero import logger
+
+from clinvar_this import exceptions
+from clinvar_this.io.compression import open_text
+
+#: File name of the index database in the profile directory.
+INDEX_FILENAME = "index.sqlite3"
+
+#: Version of the database schema, the index is rebuilt on mismatch.
+SCHEMA_VERSION = 6
+
+#: Pattern for the names of files tracked by the index.
+RE_BATCH_FILE = re.compile(
+    r"^(?P<kind>payload|payload-delta|submission-response|retrieve-response)"
+    r"\.(?P<timestamp>\d+)\.json(?:\.gz|\.zst)?$"
+)
+
+#: Statuses of submissions that ClinVar finished processing, possibly with errors for some
+#: records.  The accessions in their retrieve responses are registered.
+FINAL_STATUSES = ("processed", "error")
+
+#: States of batches in ``BatchInfo.state``.
+BATCH_STATES = ("unsubmitted", "pending", "processed", "error")
+
+#: Columns that ``BatchIndex.list_batch_infos()`` can sort by.
+SORT_KEYS = ("name", "created", "modified", "state", "records", "errors")
+
+#: SQL statements for creating the schema.
+_SCHEMA = (
+    """
+    CREATE TABLE batches (
+        name TEXT PRIMARY KEY,
+        record_count INTEGER,
+        error_count INTEGER
+    )
+    """,
+    """
+    CREATE TABLE files (
+        batch TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        timestamp TEXT NOT NULL,
+        filename TEXT NOT NULL,
+        PRIMARY KEY (batch, filename)
+    )
+    """,
+    "CREATE INDEX files_kind_timestamp ON files (batch, kind, timestamp)",
+    """
+    CREATE TABLE submissions (
+        batch TEXT NOT NULL,
+        timestamp TEXT NOT NULL,
+        submission_id TEXT NOT NULL,
+        PRIMARY KEY (batch, timestamp)
+    )
+    """,
+    """
+    CREATE TABLE statuses (
+        batch TEXT NOT NULL,
+        timestamp TEXT NOT NULL,
+        submission_id TEXT,
+        status TEXT NOT NULL,
+        PRIMARY KEY (batch, timestamp)
+    )
+    """,
+    """
+    CREATE TABLE variants (
+        batch TEXT NOT NULL,
+        local_key TEXT NOT NULL,
+        variant INTEGER NOT NULL,
+        timestamp TEXT NOT NULL,
+        assembly TEXT,
+        chromosome TEXT,
+        start INTEGER,
+        stop INTEGER,
+        reference_allele TEXT,
+        alternate_allele TEXT,
+        accession TEXT,
+        PRIMARY KEY (batch, local_key, variant)
+    )
+    """,
+    "CREATE INDEX variants_position ON variants (chromosome, start)",
+    "CREATE INDEX variants_local_key ON variants (local_key)",
+    "CREATE INDEX variants_accession ON variants (accession)",
+    """
+    CREATE TABLE accessions (
+        local_key TEXT PRIMARY KEY,
+        accession TEXT NOT NULL,
+        batch TEXT NOT NULL
+    )
+    """,
+)
+
+#: Maximal number of parameters per SQL query.
+_MAX_PARAMS = 500
+
+#: Columns of the ``variants`` table as set by ``BatchIndex.set_variants()``.
+VARIANT_COLUMNS = (
+    "local_key",
+    "variant",
+    "assembly",
+    "chromosome",
+    "start",
+    "stop",
+    "reference_allele",
+    "alternate_allele",
+    "accession",
+)
+
+
+@attrs.define(frozen=True)
+class BatchInfo:
+    """Summary information about one batch from the index."""
+
+    #: The batch name.
+    name: str
+    #: The batch state, one of ``BATCH_STATES``.
+    state: str
+    #: Number of records in the latest payload, ``None`` if there is no payload.
+    record_count: typing.Optional[int]
+    #: Number of records with an error message in the latest payload.
+    error_count: typing.Optional[int]
+    #: ID of the latest submission.
+    submission_id: typing.Optional[str]
+    #: Latest retrieved status.
+    status: typing.Optional[str]
+    #: Timestamp of the oldest file.
+    created: typing.Optional[str]
+    #: Timestamp of the newest file.
+    modified: typing.Optional[str]
+
+
+@attrs.define(frozen=True)
+class VariantInfo:
+    """A variant of a batch's latest payload from the index."""
+
+    #: The batch name.
+    batch: str
+    #: The record's local key.
+    local_key: str
+    #: Index of the variant in the record's variant set.
+    variant: int
+    #: Timestamp of the payload snapshot.
+    timestamp: str
+    #: The assembly.
+    assembly: typing.Optional[str]
+    #: The chromosome.
+    chromosome: typing.Optional[str]
+    #: 1-based start position.
+    start: typing.Optional[int]
+    #: 1-based end position.
+    stop: typing.Optional[int]
+    #: The reference allele.
+    reference_allele: typing.Optional[str]
+    #: The alternate allele.
+    alternate_allele: typing.Optional[str]
+    #: The ClinVar accession (SCV) of the record, if any.
+    accession: typing.Optional[str]
+    #: Latest retrieved status of the batch.
+    status: typing.Optional[str]
+
+
+def _state(submitted: typing.Optional[str], status: typing.Optional[str]) -> str:
+    """Return batch state from the latest submission timestamp and status retrieved for it.
+
+    The state is ``"unsubmitted"`` without submission, the status if it is final, else
+    ``"pending"``.
+    """
+    if submitted is None:
+        return "unsubmitted"
+    elif status in FINAL_STATUSES:
+        return status
+    else:
+        return "pending"
+
+
+class BatchIndex:
+    """Access to the index of the batches in ``profile_dir``.
+
+    The database is created and filled from the directory contents on first use.  Each method
+    uses its own connection so objects can be shared between threads.
+    """
+
+    def __init__(self, profile_dir: pathlib.Path):
+        self.profile_dir = profile_dir
+        self.path = profile_dir / INDEX_FILENAME
+        self._ensure_current()
+
+    @contextlib.contextmanager
+    def _connect(self) -> typing.Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(str(self.path), timeout=60)
+        try:
+            with conn:  # commit or rollback
+                yield conn
+        finally:
+            conn.close()
+
+    def _ensure_current(self):
+        """Create or rebuild the index if it is missing or has an outdated schema."""
+        if self.path.exists():
+            with self._connect() as conn:
+                (version,) = conn.execute("PRAGMA user_version").fetchone()
+            if version == SCHEMA_VERSION:
+                return
+            logger.info("Index at %s has outdated schema, rebuilding", self.path)
+        self.rebuild()
+
+    def rebuild(self):
+        """Rebuild the index from the contents of the batch directories."""
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            for (table,) in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table'"
+            ).fetchall():
+                conn.execute(f"DROP TABLE {table}")
+            for statement in _SCHEMA:
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        for batch_dir in sorted(self.profile_dir.iterdir()):
+            if batch_dir.is_dir():
+                self._rebuild_batch(batch_dir)
+        self._rebuild_accessions()
+
+    def _rebuild_batch(self, batch_dir: pathlib.Path):
+        """Add the batch at ``batch_dir``, its files, and its record counts to the index."""
+        from clinvar_this import storage  # storage builds on this module
+
+        name = batch_dir.name
+        self.add_batch(name)
+        statuses = []
+        for path in sorted(batch_dir.iterdir()):
+            match = RE_BATCH_FILE.match(path.name)
+            if not match:
+                continue
+            kind = match.group("kind")
+            timestamp = match.group("timestamp")
+            self.add_file(name, kind, timestamp, path.name)
+            try:
+                if kind == "submission-response":
+                    with open_text(path) as inputf:
+                        self.add_submission(name, timestamp, json.load(inputf)["id"])
+                elif kind == "retrieve-response":
+                    with open_text(path) as inputf:
+                        retrieve_response = json.load(inputf)
+                    statuses.append(
+                        (
+                            timestamp,
+                            retrieve_response.get("submission_id"),
+                            retrieve_response["status"]["actions"][0]["status"],
+                        )
+                    )
+            except (ValueError, KeyError, IndexError, TypeError) as e:
+                logger.warning("Could not interpret %s for index: %s", path, e)
+        submissions = self.list_submissions(name)
+        for timestamp, submission_id, status in statuses:
+            if submission_id is None:
+                # responses written before they recorded the submission ID belong to the latest
+                # submission before them
+                submission_id = next(
+                    (sid for submitted, sid in reversed(submissions) if submitted <= timestamp),
+                    None,
+                )
+            self.add_status(name, timestamp, status, submission_id)
+        store = storage.record_store(self, name)
+        if store:
+            timestamp = store.latest_timestamp()
+            if timestamp:
+                self.add_file(
+                    name,
+                    "records",
+                    timestamp,
+                    f"{storage.RECORD_STORE_DIRNAME}/{storage.RECORDS_FILENAME}",
+                )
+        try:
+            payload = storage.load_payload_unstructured(self, name)
+        except (ValueError, KeyError, TypeError, exceptions.ClinvarThisException) as e:
+            logger.warning("Could not count records of batch %s for index: %s", name, e)
+        else:
+            files = self.list_files(name, (*storage.PAYLOAD_KINDS, "records"))
+            if payload is not None and files:
+                storage.index_payload(self, name, files[-1][0], payload)
+
+    def _rebuild_accessions(self):
+        """Register the accessions from the retrieve responses with ``FINAL_STATUSES`` of all
+        batches.
+
+        The responses are applied oldest first, so the latest retrieved accession of each
+        ``local_key`` is registered as with live retrievals.
+        """
+        from clinvar_this import storage  # storage builds on this module
+
+        responses = []
+        for name in self.list_batches():
+            statuses = {timestamp: status for timestamp, _, status in self.list_statuses(name)}
+            for timestamp, _, path in self.list_files(name, ("retrieve-response",)):
+                if statuses.get(timestamp) in FINAL_STATUSES:
+                    responses.append((timestamp, name, path))
+        for _, name, path in sorted(responses):
+            try:
+                summaries = storage.load_retrieve_response(path)["summaries"]
+                self.add_accessions(
+                    name,
+                    [
+                        (identifiers["local_key"], identifiers["clinvar_accession"])
+                        for summary in summaries.values()
+                        for submission in summary.get("submissions") or []
+                        for identifiers in (submission["identifiers"],)
+                        if identifiers.get("local_key") and identifiers.get("clinvar_accession")
+                    ],
+                )
+            except (ValueError, KeyError, TypeError, exceptions.ClinvarThisException) as e:
+                logger.warning("Could not register accessions of %s for index: %s", path, e)
+
+    def add_batch(self, name: str):
+        """Register a batch of the given ``name``."""
+        with self._connect() as conn:
+            conn.execute("INSERT OR IGNORE INTO batches (name) VALUES (?)", (name,))
+
+    def set_record_counts(self, name: str, record_count: int, error_count: int):
+        """Register the number of records and of records with errors of the latest payload."""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE batches SET record_count = ?, error_count = ? WHERE name = ?",
+                (record_count, error_count, name),
+            )
+
+    def set_variants(
+        self, name: str, timestamp: str, rows: typing.Iterable[typing.Tuple[typing.Any, ...]]
+    ):
+        """Replace the variants of the batch by ``rows`` with values for ``VARIANT_COLUMNS``."""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM variants WHERE batch = ?", (name,))
+            conn.executemany(
+                f"INSERT OR REPLACE INTO variants (batch, timestamp, {', '.join(VARIANT_COLUMNS)}) "
+                f"VALUES (?, ?, {', '.join('?' * len(VARIANT_COLUMNS))})",
+                ((name, timestamp, *row) for row in rows),
+            )
+
+    def add_accessions(self, name: str, accessions: typing.Iterable[typing.Tuple[str, str]]):
+        """Register the ``(local_key, accession)`` pairs retrieved for the batch."""
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO accessions (local_key, accession, batch) VALUES (?, ?, ?)",
+                ((local_key, accession, name) for local_key, accession in accessions),
+            )
+
+    def lookup_accessions(self, local_keys: typing.Iterable[str]) -> typing.Dict[str, str]:
+        """Return the registered accessions of the given local keys by local key."""
+        local_keys = list(set(local_keys))
+        result: typing.Dict[str, str] = {}
+        with self._connect() as conn:
+            for i in range(0, len(local_keys), _MAX_PARAMS):
+                chunk = local_keys[i : i + _MAX_PARAMS]
+                result.update(
+                    conn.execute(
+                        "SELECT local_key, accession FROM accessions "
+                        f"WHERE local_key IN ({', '.join('?' * len(chunk))})",
+                        chunk,
+                    ).fetchall()
+                )
+        return result
+
+    def find_variants(
+        self,
+        *,
+        assembly: typing.Optional[str] = None,
+        chromosome: typing.Optional[str] = None,
+        start: typing.Optional[int] = None,
+        reference_allele: typing.Optional[str] = None,
+        alternate_allele: typing.Optional[str] = None,
+        local_key: typing.Optional[str] = None,
+        accession: typing.Optional[str] = None,
+    ) -> typing.List[VariantInfo]:
+        """Return the variants of all batches matching all given values."""
+        conditions = {
+            "assembly": assembly,
+            "chromosome": chromosome,
+            "start": start,
+            "reference_allele": reference_allele,
+            "alternate_allele": alternate_allele,
+            "local_key": local_key,
+            "accession": accession,
+        }
+        where = [f"v.{column} = ?" for column, value in conditions.items() if value is not None]
+        query = f"""
+            SELECT
+                v.batch, v.timestamp, {', '.join(f'v.{c}' for c in VARIANT_COLUMNS)},
+                (SELECT status FROM statuses t WHERE t.batch = v.batch
+                 ORDER BY timestamp DESC LIMIT 1)
+            FROM variants v
+            {'WHERE ' + ' AND '.join(where) if where else ''}
+            ORDER BY v.chromosome, v.start, v.batch, v.local_key, v.variant
+        """
+        with self._connect() as conn:
+            rows = conn.execute(
+                query, [value for value in conditions.values() if value is not None]
+            ).fetchall()
+        return [
+            VariantInfo(
+                batch=batch,
+                timestamp=timestamp,
+                status=status,
+                **dict(zip(VARIANT_COLUMNS, values)),
+            )
+            for batch, timestamp, *values, status in rows
+        ]
+
+    def add_file(self, name: str, kind: str, timestamp: str, filename: str):
+        """Register the file with ``filename`` in the batch directory of ``name``."""
+        with self._connect() as conn:
+            conn.execute("INSERT OR IGNORE INTO batches (name) VALUES (?)", (name,))
+            conn.execute(
+                "INSERT OR REPLACE INTO files (batch, kind, timestamp, filename) "
+                "VALUES (?, ?, ?, ?)",
+                (name, kind, timestamp, filename),
+            )
+
+    def add_submission(self, name: str, timestamp: str, submission_id: str):
+        """Register the submission ID from a submission response."""
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO submissions (batch, timestamp, submission_id) "
+                "VALUES (?, ?, ?)",
+                (name, timestamp, submission_id),
+            )
+
+    def add_status(
+        self, name: str, timestamp: str, status: str, submission_id: typing.Optional[str]
+    ):
+        """Register the status from a retrieve response for the submission ``submission_id``."""
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO statuses (batch, timestamp, submission_id, status) "
+                "VALUES (?, ?, ?, ?)",
+                (name, timestamp, submission_id, status),
+            )
+
+    def remove_file(self, name: str, kind: str, timestamp: str, filename: str):
+        """Unregister the file, together with the submission or status it registered."""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM files WHERE batch = ? AND filename = ?", (name, filename))
+            if kind == "submission-response":
+                conn.execute(
+                    "DELETE FROM submissions WHERE batch = ? AND timestamp = ?", (name, timestamp)
+                )
+            elif kind == "retrieve-response":
+                conn.execute(
+                    "DELETE FROM statuses WHERE batch = ? AND timestamp = ?", (name, timestamp)
+                )
+
+    def list_batches(self, prefix: str = "") -> typing.List[str]:
+        """Return the sorted names of the batches, optionally limited to those with ``prefix``."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT name FROM batches WHERE substr(name, 1, ?) = ? ORDER BY name",
+                (len(prefix), prefix),
+            ).fetchall()
+        return [name for (name,) in rows]
+
+    def has_batch(self, name: str) -> bool:
+        """Return whether the batch with the given ``name`` exists."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT 1 FROM batches WHERE name = ?", (name,)).fetchone()
+        return row is not None
+
+    def latest_file(self, name: str, kind: str) -> typing.Optional[pathlib.Path]:
+        """Return path to the latest file of the given ``kind`` in the batch, if any."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT filename FROM files WHERE batch = ? AND kind = ? "
+                "ORDER BY timestamp DESC, filename DESC LIMIT 1",
+                (name, kind),
+            ).fetchone()
+        if row:
+            return self.profile_dir / name / row[0]
+        else:
+            return None
+
+    def list_files(
+        self, name: str, kinds: typing.Iterable[str]
+    ) -> typing.List[typing.Tuple[str, str, pathlib.Path]]:
+        """Return ``(timestamp, kind, path)`` of the batch's files of the given kinds in order."""
+        kinds = list(kinds)
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT timestamp, kind, filename FROM files WHERE batch = ? "
+                f"AND kind IN ({', '.join('?' * len(kinds))}) ORDER BY timestamp, filename",
+                (name, *kinds),
+            ).fetchall()
+        return [
+            (timestamp, kind, self.profile_dir / name / filename)
+            for timestamp, kind, filename in rows
+        ]
+
+    def list_submissions(self, name: str) -> typing.List[typing.Tuple[str, str]]:
+        """Return ``(timestamp, submission_id)`` of the batch's submissions in order."""
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT timestamp, submission_id FROM submissions WHERE batch = ? "
+                "ORDER BY timestamp",
+                (name,),
+            ).fetchall()
+
+    def list_statuses(self, name: str) -> typing.List[typing.Tuple[str, typing.Optional[str], str]]:
+        """Return ``(timestamp, submission_id, status)`` of the batch's retrieved statuses in
+        order."""
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT timestamp, submission_id, status FROM statuses WHERE batch = ? "
+                "ORDER BY timestamp",
+                (name,),
+            ).fetchall()
+
+    def list_batch_infos(
+        self,
+        *,
+        names: typing.Optional[typing.Sequence[str]] = None,
+        states: typing.Sequence[str] = (),
+        sort_by: str = "name",
+        reverse: bool = False,
+    ) -> typing.List[BatchInfo]:
+        """Return information on all batches or those with the given ``names``.
+
+        :param states: Only return batches in these states, all if empty.
+        :param sort_by: Sort key, one of ``SORT_KEYS``, ties are broken by name.
+        :param reverse: Whether to sort in descending order.
+        """
+        query = """
+            SELECT
+                b.name,
+                b.record_count,
+                b.error_count,
+                (SELECT MIN(timestamp) FROM files f WHERE f.batch = b.name),
+                (SELECT MAX(timestamp) FROM files f WHERE f.batch = b.name),
+                (SELECT MAX(timestamp) FROM submissions s WHERE s.batch = b.name),
+                (SELECT submission_id FROM submissions s WHERE s.batch = b.name
+                 ORDER BY timestamp DESC LIMIT 1),
+                (SELECT status FROM statuses t WHERE t.batch = b.name
+                 ORDER BY timestamp DESC LIMIT 1),
+                (SELECT status FROM statuses t WHERE t.batch = b.name AND t.submission_id = (
+                    SELECT submission_id FROM submissions s WHERE s.batch = b.name
+                    ORDER BY timestamp DESC LIMIT 1
+                 ) ORDER BY timestamp DESC LIMIT 1)
+            FROM batches b
+        """
+        params: typing.List[str] = []
+        if names is not None:
+            query += f" WHERE b.name IN ({', '.join('?' * len(names))})"
+            params += names
+        with self._connect() as conn:
+            rows = conn.execute(query, params).fetchall()
+        result = [
+            BatchInfo(
+                name=name,
+                state=_state(submitted, status_since_submission),
+                record_count=record_count,
+                error_count=error_count,
+                submission_id=submission_id,
+                status=status,
+                created=created,
+                modified=modified,
+            )
+            for (
+                name,
+                record_count,
+                error_count,
+                created,
+                modified,
+                submitted,
+                submission_id,
+                status,
+                status_since_submission,
+            ) in rows
+        ]
+        if states:
+            result = [info for info in result if info.state in states]
+        if sort_by not in SORT_KEYS:
+            raise ValueError(f"Invalid sort key {sort_by}, must be one of {SORT_KEYS}")
+        attr = {"records": "record_count", "errors": "error_count"}.get(sort_by, sort_by)
+        result.sort(key=lambda info: info.name)
+        # missing values sort first, stable sort keeps the name order for ties
+        result.sort(
+            key=lambda info: (getattr(info, attr) is not None, getattr(info, attr)),
+            reverse=reverse,
+        )
+        return result
@@ -0,0 +1,53 @@
+"""Transparent compression of the files in the batch directories.
+
+The compression is derived from the file name suffix on reading, so compressed and uncompressed
+files can be mixed in one batch directory.
+"""
+
+import gzip
+import io
+import pathlib
+import typing
+
+from clinvar_this import exceptions
+
+try:
+    import zstandard  # type: ignore
+except ImportError:  # pragma: no cover
+    zstandard = None  # type: ignore
+
+#: File name suffixes by compression.
+SUFFIXES: typing.Dict[str, str] = {"none": "", "gzip": ".gz", "zstd": ".zst"}
+
+
+def suffix_for(compression: str) -> str:
+    """Return file name suffix for the given ``compression``.
+
+    :raises exceptions.ConfigException: if the compression is unknown or not available.
+    """
+    if compression not in SUFFIXES:
+        raise exceptions.ConfigException(
+            f"Invalid compression {compression}, must be one of {list(SUFFIXES)}"
+        )
+    if compression == "zstd" and zstandard is None:
+        raise exceptions.ConfigException("zstd compression requires the zstandard package")
+    return SUFFIXES[compression]
+
+
+def open_text(path: pathlib.Path, mode: str = "rt") -> typing.TextIO:
+    """Open the file at ``path`` in text mode, compressed according to its suffix.
+
+    :param mode: One of ``"rt"`` and ``"wt"``.
+    """
+    if path.name.endswith(SUFFIXES["gzip"]):
+        return typing.cast(typing.TextIO, gzip.open(path, mode, encoding="utf-8"))
+    elif path.name.endswith(SUFFIXES["zstd"]):
+        suffix_for("zstd")  # raise if not available
+        binary: typing.Any
+        if mode == "rt":
+            binary = zstandard.ZstdDecompressor().stream_reader(path.open("rb"), closefd=True)
+        else:
+            binary = zstandard.ZstdCompressor().stream_writer(path.open("wb"), closefd=True)
+        return io.TextIOWrapper(binary, encoding="utf-8")
+    else:
+        return typing.cast(typing.TextIO, path.open(mode, encoding="utf-8"))
@@ -0,0 +1,107 @@
+"""Random access to uncompressed FASTA files indexed with ``samtools faidx``.
+
+The sequence file is memory-mapped and sequences are sliced from it using the line layout in
+the ``.fai`` index, so only the pages of the requested regions are read from disk.
+"""
+
+import mmap
+import pathlib
+import typing
+
+import attrs
+
+from clinvar_this import exceptions
+
+#: Alternative names of contigs to try for chromosome names.
+CONTIG_ALIASES: typing.Dict[str, typing.Tuple[str, ...]] = {
+    "MT": ("MT", "chrM", "chrMT", "M"),
+}
+
+
+@attrs.define(frozen=True)
+class FaiEntry:
+    """One line of a ``.fai`` index."""
+
+    #: Name of the contig.
+    name: str
+    #: Number of bases in the contig.
+    length: int
+    #: Byte offset of the first base in the FASTA file.
+    offset: int
+    #: Number of bases per line.
+    line_bases: int
+    #: Number of bytes per line, including the line break.
+    line_width: int
+
+
+def read_fai(path: pathlib.Path) -> typing.Dict[str, FaiEntry]:
+    """Read the ``.fai`` index at ``path``.
+
+    :raises exceptions.InvalidFormat: on invalid lines.
+    """
+    result = {}
+    with path.open("rt") as inputf:
+        for lineno, line in enumerate(inputf, 1):
+            fields = line.rstrip("\n").split("\t")
+            try:
+                entry = FaiEntry(fields[0], *map(int, fields[1:5]))
+            except (IndexError, ValueError, TypeError):
+                raise exceptions.InvalidFormat(f"Invalid line {lineno} in FASTA index {path}")
+            result[entry.name] = entry
+    return result
+
+
+class IndexedFasta:
+    """Access to the FASTA file at ``path`` with its index at ``<path>.fai``.
+
+    Use as context manager or call ``close()`` to release the memory map.
+    """
+
+    def __init__(self, path: typing.Union[str, pathlib.Path]):
+        self.path = pathlib.Path(path)
+        fai_path = self.path.with_name(self.path.name + ".fai")
+        if self.path.suffix in (".gz", ".bgz"):
+            raise exceptions.IOException(f"Compressed FASTA files are not supported: {path}")
+        if not fai_path.exists():
+            raise exceptions.IOException(
+                f"Missing FASTA index {fai_path}, create it with samtools faidx"
+            )
+        self.index = read_fai(fai_path)
+        with self.path.open("rb") as inputf:
+            self._mmap = mmap.mmap(inputf.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __enter__(self) -> "IndexedFasta":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._mmap.close()
+
+    def contig_name(self, chromosome: str) -> typing.Optional[str]:
+        """Return the name of the contig for ``chromosome`` (e.g., ``"1"`` or ``"chr1"``)."""
+        name = chromosome[3:] if chromosome.startswith("chr") else chromosome
+        for candidate in CONTIG_ALIASES.get(name, (name, f"chr{name}")):
+            if candidate in self.index:
+                return candidate
+        return None
+
+    def fetch(self, contig: str, start: int, stop: int) -> str:
+        """Return the upper case sequence from 1-based ``start`` to ``stop``, both inclusive.
+
+        The range is clipped to the contig.
+
+        :raises KeyError: if the contig is not in the index.
+        """
+        entry = self.index[contig]
+        begin, end = max(start - 1, 0), min(stop, entry.length)
+        if begin >= end:
+            return ""
+
+        def byte_offset(pos: int) -> int:
+            line, column = divmod(pos, entry.line_bases)
+            return entry.offset + line * entry.line_width + column
+
+        data = self._mmap[byte_offset(begin) : byte_offset(end - 1) + 1]
+        return data.replace(b"\n", b"").replace(b"\r", b"").decode("ascii").upper()
@@ -449,6 +449,48 @@ def tsv_records_to_submission_container(
     )
 
 
+def apply_batch_metadata(
+    submission_container: SubmissionContainer, batch_metadata: BatchMetadata
+) -> SubmissionContainer:
+    """Apply the values set in ``batch_metadata`` to the container and its records.
+
+    Records that already have the values are kept as they are, so only the changed records are
+    written by ``clinvar_this.storage``.
+    """
+    observed_in_changes = {
+        key: value
+        for key, value in (
+            ("allele_origin", batch_metadata.allele_origin),
+            ("collection_method", batch_metadata.collection_method),
+        )
+        if value is not None
+    }
+
+    def update_record(record: SubmissionClinvarSubmission) -> SubmissionClinvarSubmission:
+        if not observed_in_changes or not any(
+            getattr(observed_in, key) != value
+            for observed_in in record.observed_in
+            for key, value in observed_in_changes.items()
+        ):
+            return record
+        return attrs.evolve(
+            record,
+            observed_in=[
+                attrs.evolve(observed_in, **observed_in_changes)
+                for observed_in in record.observed_in
+            ],
+        )
+
+    changes: typing.Dict[str, typing.Any] = {}
+    if batch_metadata.release_status is not None:
+        changes["clinvar_submission_release_status"] = batch_metadata.release_status
+    if submission_container.clinvar_submission:
+        changes["clinvar_submission"] = [
+            update_record(record) for record in submission_container.clinvar_submission
+        ]
+    return attrs.evolve(submission_container, **changes)
+
+
 def submission_container_to_tsv_records(
     submission_container: SubmissionContainer,
 ) -> typing.List[TsvRecord]:
@@ -0,0 +1,301 @@
+"""Liftover of variants between assemblies with UCSC chain files.
+
+The ungapped blocks of all chains are kept in sorted arrays per source chromosome, so a position
+is mapped by bisecting the block starts.  Building the index is the expensive part; it is done
+once per process and pickled to ``<chain>.idx.pickle`` next to the chain file, and reused until
+the chain file changes.
+
+As in UCSC chain files, "target" (``t``) refers to the source assembly and "query" (``q``) to
+the assembly lifted to.  Variants are only mapped if their reference allele lies in one ungapped
+block.
+"""
+
+import bisect
+import functools
+import itertools
+import os
+import pathlib
+import pickle
+import typing
+
+import attrs
+from logzero import logger
+
+from clinvar_api.models import Assembly, Chromosome
+from clinvar_this import __version__, exceptions
+from clinvar_this.io import compression
+from clinvar_this.io.tsv import TsvRecord
+
+#: Suffix of the pickled index next to the chain file.
+INDEX_SUFFIX = ".idx.pickle"
+
+#: Version of the pickled index, increase on changes of ``ChainIndex``.
+INDEX_VERSION = 1
+
+#: Name of the extra column with the reason in the file of unmapped records.
+UNMAPPED_REASON = "unmapped_reason"
+
+#: Groups of names of the same assembly.
+EQUIVALENT_ASSEMBLIES = (
+    frozenset((Assembly.GRCH38, Assembly.HG38)),
+    frozenset((Assembly.GRCH37, Assembly.HG19)),
+    frozenset((Assembly.NCBI36, Assembly.HG18)),
+)
+
+#: Source assembly of the chain file by the assembly lifted to, if not given explicitly.
+DEFAULT_SOURCE = {
+    Assembly.GRCH38: Assembly.GRCH37,
+    Assembly.HG38: Assembly.GRCH37,
+    Assembly.GRCH37: Assembly.GRCH38,
+    Assembly.HG19: Assembly.GRCH38,
+}
+
+#: Complementary bases.
+_COMPLEMENT = str.maketrans("ACGTN", "TGCAN")
+
+
+@attrs.define
+class ContigBlocks:
+    """Ungapped blocks on one source contig, sorted by start."""
+
+    #: 0-based start positions in the source.
+    starts: typing.List[int] = attrs.field(factory=list)
+    #: 0-based end positions (exclusive) in the source.
+    ends: typing.List[int] = attrs.field(factory=list)
+    #: Indices into ``ChainIndex.query_contigs``.
+    contigs: typing.List[int] = attrs.field(factory=list)
+    #: 0-based start positions in the query, on the query strand.
+    query_starts: typing.List[int] = attrs.field(factory=list)
+    #: Whether the block maps to the reverse strand of the query.
+    reverse: typing.List[bool] = attrs.field(factory=list)
+
+
+@attrs.define(frozen=True)
+class Mapping:
+    """Result of mapping an interval."""
+
+    #: Name of the contig in the query.
+    contig: str
+    #: 1-based start position in the query.
+    pos: int
+    #: Whether the interval maps to the reverse strand.
+    reverse: bool
+
+
+@attrs.define
+class ChainIndex:
+    """Index of the ungapped blocks of a chain file."""
+
+    #: Blocks by source contig.
+    blocks: typing.Dict[str, ContigBlocks] = attrs.field(factory=dict)
+    #: Names and sizes of the query contigs.
+    query_contigs: typing.List[typing.Tuple[str, int]] = attrs.field(factory=list)
+
+    def map(self, contig: str, pos: int, length: int = 1) -> typing.Optional[Mapping]:
+        """Map the interval of ``length`` bases at 1-based ``pos`` on the source ``contig``.
+
+        :return: The mapping or ``None`` if the interval is not in one ungapped block.
+        """
+        blocks = self.blocks.get(contig)
+        if blocks is None:
+            return None
+        begin, end = pos - 1, pos - 1 + max(length, 1)
+        idx = bisect.bisect_right(blocks.starts, begin) - 1
+        if idx < 0 or end > blocks.ends[idx]:
+            return None
+        name, size = self.query_contigs[blocks.contigs[idx]]
+        query_begin = blocks.query_starts[idx] + begin - blocks.starts[idx]
+        if blocks.reverse[idx]:
+            return Mapping(name, size - (query_begin + end - begin) + 1, True)
+        return Mapping(name, query_begin + 1, False)
+
+
+def _add_blocks(
+    index: ChainIndex, contig_ids: typing.Dict[typing.Tuple[str, int], int], lines: typing.Iterator
+):
+    """Add the blocks of the chain with the header line returned first by ``lines``."""
+    header = next(lines).split()
+    t_name, t_start = header[2], int(header[5])
+    q_name, q_size, q_strand, q_start = header[7], int(header[8]), header[9], int(header[10])
+    contig_id = contig_ids.setdefault((q_name, q_size), len(index.query_contigs))
+    if contig_id == len(index.query_contigs):
+        index.query_contigs.append((q_name, q_size))
+    blocks = index.blocks.setdefault(t_name, ContigBlocks())
+    for line in lines:
+        fields = line.split()
+        if not fields:
+            break
+        size = int(fields[0])
+        blocks.starts.append(t_start)
+        blocks.ends.append(t_start + size)
+        blocks.contigs.append(contig_id)
+        blocks.query_starts.append(q_start)
+        blocks.reverse.append(q_strand == "-")
+        if len(fields) < 3:
+            break
+        t_start += size + int(fields[1])
+        q_start += size + int(fields[2])
+
+
+def build_index(path: pathlib.Path) -> ChainIndex:
+    """Build the index of the chain file at ``path``, which may be compressed.
+
+    :raises exceptions.InvalidFormat: on invalid chain files.
+    """
+    index = ChainIndex()
+    contig_ids: typing.Dict[typing.Tuple[str, int], int] = {}
+    with compression.open_text(path) as inputf:
+        lines = (line for line in inputf if not line.startswith("#"))
+        for line in lines:
+            if not line.strip():
+                continue
+            if not line.startswith("chain "):
+                raise exceptions.InvalidFormat(f"Expected chain header in {path}: {line!r}")
+            try:
+                _add_blocks(index, contig_ids, itertools.chain([line], lines))
+            except (IndexError, ValueError):
+                raise exceptions.InvalidFormat(f"Invalid chain in {path}: {line.strip()}")
+    for blocks in index.blocks.values():
+        order = sorted(range(len(blocks.starts)), key=blocks.starts.__getitem__)
+        for field in attrs.fields(ContigBlocks):
+            values = getattr(blocks, field.name)
+            setattr(blocks, field.name, [values[i] for i in order])
+    return index
+
+
+def _cache_key(path: pathlib.Path) -> typing.Tuple:
+    stat = path.stat()
+    return (INDEX_VERSION, __version__, stat.st_size, stat.st_mtime_ns)
+
+
+@functools.lru_cache(maxsize=4)
+def _load_index(path: pathlib.Path, key: typing.Tuple) -> ChainIndex:
+    cache_path = path.with_name(path.name + INDEX_SUFFIX)
+    try:
+        with cache_path.open("rb") as inputf:
+            cached_key, index = pickle.load(inputf)
+        if cached_key == key and isinstance(index, ChainIndex):
+            return index
+    except FileNotFoundError:
+        pass
+    except Exception as e:  # any unpickling problem means that the cache is unusable
+        logger.debug("Ignoring unreadable chain index %s: %s", cache_path, e)
+    logger.info("Building index of chain file %s", path)
+    index = build_index(path)
+    tmp_path = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.tmp")
+    try:
+        with tmp_path.open("wb") as outputf:
+            pickle.dump((key, index), outputf, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except (OSError, pickle.PicklingError) as e:
+        logger.debug("Could not write chain index %s: %s", cache_path, e)
+        tmp_path.unlink(missing_ok=True)
+    return index
+
+
+def load_index(path: typing.Union[str, pathlib.Path]) -> ChainIndex:
+    """Return the index of the chain file at ``path``, from the cache if it is current.
+
+    :raises exceptions.IOException: if the chain file does not exist.
+    """
+    path = pathlib.Path(path).resolve()
+    try:
+        key = _cache_key(path)
+    except FileNotFoundError:
+        raise exceptions.IOException(f"Chain file {path} does not exist")
+    return _load_index(path, key)
+
+
+def _reverse_complement(seq: str) -> str:
+    return seq.upper().translate(_COMPLEMENT)[::-1]
+
+
+def _chromosome(contig: str) -> typing.Optional[Chromosome]:
+    """Return the chromosome of the query contig, ``None`` for other contigs."""
+    name = contig[3:] if contig.startswith("chr") else contig
+    try:
+        return Chromosome("MT" if name == "M" else name)
+    except ValueError:
+        return None
+
+
+def same_assembly(first: Assembly, second: Assembly) -> bool:
+    """Return whether ``first`` and ``second`` are names of the same assembly, e.g. GRCh37 and
+    hg19."""
+    return first == second or any(
+        first in group and second in group for group in EQUIVALENT_ASSEMBLIES
+    )
+
+
+def lift_record(
+    index: ChainIndex, record: TsvRecord, assembly: Assembly
+) -> typing.Tuple[TsvRecord, typing.Optional[str]]:
+    """Lift ``record`` to ``assembly`` with the chain ``index``.
+
+    :return: The lifted record and ``None``, or the unchanged record and the reason why it could
+        not be mapped.
+    """
+    name = record.chromosome.value
+    candidates = (name, f"chr{name}") + (("chrM",) if record.chromosome == Chromosome.CHRMT else ())
+    contig = next((contig for contig in candidates if contig in index.blocks), None)
+    if contig is None:
+        return record, f"chromosome {name} not in chain file"
+    mapping = index.map(contig, record.pos, len(record.ref))
+    if mapping is None:
+        return record, "reference allele not in one ungapped block"
+    chromosome = _chromosome(mapping.contig)
+    if chromosome is None:
+        return record, f"maps to contig {mapping.contig}"
+    ref, alt = record.ref, record.alt
+    if mapping.reverse:
+        if len(ref) != len(alt):
+            return record, "indel maps to reverse strand"
+        ref, alt = _reverse_complement(ref), _reverse_complement(alt)
+    return (
+        attrs.evolve(
+            record, assembly=assembly, chromosome=chromosome, pos=mapping.pos, ref=ref, alt=alt
+        ),
+        None,
+    )
+
+
+def lift_tsv_records(
+    records: typing.Sequence[TsvRecord],
+    index: ChainIndex,
+    assembly: Assembly,
+    source: typing.Optional[Assembly] = None,
+) -> typing.Tuple[typing.List[TsvRecord], typing.List[TsvRecord]]:
+    """Lift the records on the ``source`` assembly of the chain ``index`` to ``assembly``.
+
+    Records already on ``assembly`` (or an equivalent name of it) are kept as they are, records on
+    other assemblies than ``source`` cannot be lifted with the chain and are unmapped.
+
+    :param source: The source assembly of the chain file, by default from ``DEFAULT_SOURCE``.
+    :return: The lifted records, including those already on ``assembly``, and the unmapped
+        records with the reason in the extra column ``UNMAPPED_REASON``.
+    :raises exceptions.ArgumentsError: if ``source`` is not given and there is no default.
+    """
+    if source is None:
+        source = DEFAULT_SOURCE.get(assembly)
+        if source is None:
+            raise exceptions.ArgumentsError(
+                f"Source assembly required for liftover to {assembly.value}"
+            )
+    lifted, unmapped = [], []
+    for record in records:
+        if same_assembly(record.assembly, assembly):
+            lifted.append(record)
+            continue
+        if same_assembly(record.assembly, source):
+            record, reason = lift_record(index, record, assembly)
+        else:
+            reason = f"assembly {record.assembly.value} is not the chain's source {source.value}"
+        if reason is None:
+            lifted.append(record)
+        else:
+            logger.warning("Could not lift record %s: %s", record.local_key, reason)
+            unmapped.append(
+                attrs.evolve(record, extra_data={**record.extra_data, UNMAPPED_REASON: reason})
+            )
+    logger.info("Lifted %d records to %s", len(records) - len(unmapped), assembly.value)
+    return lifted, unmapped
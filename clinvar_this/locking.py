@@ -0,0 +1,48 @@
+"""Advisory locks for batch directories.
+
+Operations that read and write a batch hold an exclusive ``flock()`` on the file
+``LOCK_FILENAME`` in the batch directory so that concurrent runs of ``clinvar-this`` on the same
+batch are serialized.
+"""
+
+import contextlib
+import fcntl
+import pathlib
+import time
+import typing
+
+from logzero import logger
+
+from clinvar_this import exceptions
+
+#: File name of the lock file in the batch directory.
+LOCK_FILENAME = ".lock"
+
+#: Seconds between attempts to acquire the lock.
+POLL_INTERVAL = 0.1
+
+
+@contextlib.contextmanager
+def batch_lock(batch_dir: pathlib.Path, timeout: float) -> typing.Iterator[None]:
+    """Hold the exclusive lock of the batch in ``batch_dir`` within the context.
+
+    :param timeout: Seconds to wait for the lock.
+    :raises exceptions.LockTimeout: if the lock could not be acquired within ``timeout``.
+    """
+    with (batch_dir / LOCK_FILENAME).open("a") as lockf:
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                fcntl.flock(lockf.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    raise exceptions.LockTimeout(
+                        f"Could not lock batch at {batch_dir} within {timeout} seconds"
+                    )
+                logger.debug("Waiting for lock of batch at %s", batch_dir)
+                time.sleep(POLL_INTERVAL)
+        try:
+            yield
+        finally:
+            fcntl.flock(lockf.fileno(), fcntl.LOCK_UN)
@@ -0,0 +1,195 @@
+"""Merging of submission containers on import.
+
+Records of the patch container are matched to the records of the base container by their
+``local_key`` and, optionally, by their variant coordinates.  Matched records are merged field
+by field according to a ``FieldPolicy``, unmatched patch records are added, and unmatched base
+records are kept or deleted.  Matching uses dicts so the merge runs in linear time.
+"""
+
+import enum
+import typing
+
+import attrs
+from logzero import logger
+
+from clinvar_api import models
+
+#: Type of the variant keys used for matching records by coordinates.
+VariantKey = typing.Tuple[typing.Tuple[typing.Any, ...], ...]
+
+
+class FieldPolicy(enum.Enum):
+    """How to merge one field of matched records."""
+
+    #: Use the value from the patch.
+    OVERWRITE = "overwrite"
+    #: Keep the value from the base.
+    KEEP = "keep"
+    #: Use the value from the patch if the base value is empty.
+    FILL = "fill"
+
+
+#: Policies for the fields of ``SubmissionClinvarSubmission``, fields not listed are kept.
+DEFAULT_FIELD_POLICIES: typing.Dict[str, FieldPolicy] = {
+    "condition_set": FieldPolicy.OVERWRITE,
+    "clinical_significance": FieldPolicy.OVERWRITE,
+    "observed_in": FieldPolicy.OVERWRITE,
+    "clinvar_accession": FieldPolicy.FILL,
+}
+
+#: Names of the fields of ``SubmissionClinvarSubmission``.
+RECORD_FIELDS: typing.Tuple[str, ...] = tuple(
+    field.name for field in attrs.fields(models.SubmissionClinvarSubmission)  # type: ignore[arg-type]
+)
+
+
+@attrs.define(frozen=True)
+class MergeOptions:
+    """Options for ``merge_submission_containers()``."""
+
+    #: Match patch records without known ``local_key`` to base records by variant coordinates.
+    match_variants: bool = False
+    #: Delete base records that have no match in the patch.
+    delete_missing: bool = False
+    #: Policies by field name, overriding ``DEFAULT_FIELD_POLICIES``.
+    field_policies: typing.Dict[str, FieldPolicy] = attrs.field(factory=dict)
+
+    def policy(self, field_name: str) -> FieldPolicy:
+        """Return the policy for the field with the given name."""
+        return self.field_policies.get(
+            field_name, DEFAULT_FIELD_POLICIES.get(field_name, FieldPolicy.KEEP)
+        )
+
+
+@attrs.define
+class MergeSummary:
+    """The ``local_key`` values of the records by the change applied to them."""
+
+    #: Records only in the patch.
+    added: typing.List[str] = attrs.field(factory=list)
+    #: Matched records with changed fields.
+    updated: typing.List[str] = attrs.field(factory=list)
+    #: Matched records without changed fields.
+    unchanged: typing.List[str] = attrs.field(factory=list)
+    #: Records only in the base that were deleted.
+    deleted: typing.List[str] = attrs.field(factory=list)
+    #: Records only in the base that were kept.
+    kept: typing.List[str] = attrs.field(factory=list)
+
+    def format(self) -> str:
+        """Format the counts of the changes in one line."""
+        return (
+            f"{len(self.added)} added, {len(self.updated)} updated, "
+            f"{len(self.unchanged)} unchanged, {len(self.deleted)} deleted, "
+            f"{len(self.kept)} kept"
+        )
+
+
+def parse_field_policies(values: typing.Iterable[str]) -> typing.Dict[str, FieldPolicy]:
+    """Parse ``FIELD=POLICY`` strings into a dict of field policies.
+
+    :raises ValueError: on invalid field names or policies.
+    """
+    result = {}
+    for value in values:
+        field_name, sep, policy = value.partition("=")
+        if not sep or field_name not in RECORD_FIELDS:
+            raise ValueError(f"Invalid field policy {value}, field must be one of {RECORD_FIELDS}")
+        result[field_name] = FieldPolicy(policy)
+    return result
+
+
+def variant_key(record: models.SubmissionClinvarSubmission) -> typing.Optional[VariantKey]:
+    """Return the key of the record's chromosome coordinates, ``None`` if it has none."""
+    if not record.variant_set:
+        return None
+    result = []
+    for variant in record.variant_set.variant:
+        coords = variant.chromosome_coordinates
+        if not coords:
+            return None
+        result.append(
+            (
+                coords.assembly,
+                coords.chromosome,
+                coords.start,
+                coords.stop,
+                coords.reference_allele,
+                coords.alternate_allele,
+            )
+        )
+    return tuple(result)
+
+
+def _merge_record(
+    base: models.SubmissionClinvarSubmission,
+    patch: models.SubmissionClinvarSubmission,
+    options: MergeOptions,
+) -> models.SubmissionClinvarSubmission:
+    changes = {}
+    for field_name in RECORD_FIELDS:
+        policy = options.policy(field_name)
+        base_value = getattr(base, field_name)
+        patch_value = getattr(patch, field_name)
+        if policy == FieldPolicy.OVERWRITE or (policy == FieldPolicy.FILL and not base_value):
+            if patch_value != base_value:
+                changes[field_name] = patch_value
+    return attrs.evolve(base, **changes) if changes else base
+
+
+def merge_submission_containers(
+    base: models.SubmissionContainer,
+    patch: models.SubmissionContainer,
+    options: MergeOptions = MergeOptions(),
+) -> typing.Tuple[models.SubmissionContainer, MergeSummary]:
+    """Merge the records of ``patch`` into ``base``.
+
+    The container-level fields are taken from ``base``.  Base records keep their order and added
+    records are appended in patch order.
+
+    :return: The merged container and the summary of the changes.
+    """
+    base_records = base.clinvar_submission or []
+    by_key = {record.local_key: i for i, record in enumerate(base_records) if record.local_key}
+    by_variant: typing.Dict[VariantKey, int] = {}
+    if options.match_variants:
+        for i, record in enumerate(base_records):
+            key = variant_key(record)
+            if key is not None:
+                by_variant.setdefault(key, i)
+
+    summary = MergeSummary()
+    merged: typing.List[typing.Optional[models.SubmissionClinvarSubmission]] = [None] * len(
+        base_records
+    )
+    added = []
+    for record in patch.clinvar_submission or []:
+        idx = by_key.get(record.local_key) if record.local_key else None
+        if idx is None and options.match_variants:
+            key = variant_key(record)
+            idx = by_variant.get(key) if key is not None else None
+        if idx is None:
+            added.append(record)
+            summary.added.append(record.local_key or "")
+        elif merged[idx] is not None:  # repeated in patch, the last one wins
+            merged[idx] = _merge_record(merged[idx] or base_records[idx], record, options)
+        else:
+            merged[idx] = _merge_record(base_records[idx], record, options)
+            if merged[idx] is base_records[idx]:
+                summary.unchanged.append(base_records[idx].local_key or "")
+            else:
+                summary.updated.append(base_records[idx].local_key or "")
+
+    records = []
+    for base_record, merged_record in zip(base_records, merged):
+        if merged_record is not None:
+            records.append(merged_record)
+        elif options.delete_missing:
+            summary.deleted.append(base_record.local_key or "")
+        else:
+            records.append(base_record)
+            summary.kept.append(base_record.local_key or "")
+    records += added
+
+    logger.info("Merged submission records: %s", summary.format())
+    return attrs.evolve(base, clinvar_submission=records), summary
@@ -0,0 +1,116 @@
+"""Normalization of variants against the reference genome.
+
+Variants are normalized by trimming the bases shared by the reference and alternate allele and
+shifting indels to their leftmost position, keeping one padding base for indels as in VCF.  The
+reference sequence is read through a ``WindowReader`` that caches fixed-size windows, so the
+repeated reads of left-alignment and of neighbouring variants hit the cache.
+"""
+
+import collections
+import typing
+
+import attrs
+from logzero import logger
+
+from clinvar_this.io.fasta import IndexedFasta
+from clinvar_this.io.tsv import TsvRecord
+
+#: Number of bases per cached window.
+WINDOW_SIZE = 4096
+
+#: Maximal number of cached windows.
+MAX_WINDOWS = 64
+
+
+class WindowReader:
+    """Read sequence from ``fasta`` through a least-recently-used cache of windows."""
+
+    def __init__(
+        self, fasta: IndexedFasta, window_size: int = WINDOW_SIZE, max_windows: int = MAX_WINDOWS
+    ):
+        self.fasta = fasta
+        self.window_size = window_size
+        self.max_windows = max_windows
+        self._windows: typing.OrderedDict[typing.Tuple[str, int], str] = collections.OrderedDict()
+        #: Number of windows read from the FASTA file.
+        self.reads = 0
+
+    def _window(self, contig: str, idx: int) -> str:
+        key = (contig, idx)
+        if key in self._windows:
+            self._windows.move_to_end(key)
+        else:
+            start = idx * self.window_size + 1
+            self._windows[key] = self.fasta.fetch(contig, start, start + self.window_size - 1)
+            self.reads += 1
+            if len(self._windows) > self.max_windows:
+                self._windows.popitem(last=False)
+        return self._windows[key]
+
+    def fetch(self, contig: str, start: int, stop: int) -> str:
+        """Return the sequence from 1-based ``start`` to ``stop``, both inclusive.
+
+        The range is clipped to the contig.
+        """
+        start, stop = max(start, 1), min(stop, self.fasta.index[contig].length)
+        if stop < start:
+            return ""
+        first, last = (start - 1) // self.window_size, (stop - 1) // self.window_size
+        seq = "".join(self._window(contig, idx) for idx in range(first, last + 1))
+        offset = start - 1 - first * self.window_size
+        return seq[offset : offset + stop - start + 1]
+
+
+def normalize_variant(
+    reader: WindowReader, contig: str, pos: int, ref: str, alt: str
+) -> typing.Tuple[int, str, str]:
+    """Return the normalized ``(pos, ref, alt)`` of the variant, see module docstring."""
+    if ref == alt:
+        return pos, ref, alt
+    while True:
+        if ref and alt and ref[-1] == alt[-1]:
+            ref, alt = ref[:-1], alt[:-1]
+        elif (not ref or not alt) and pos > 1:
+            pos -= 1
+            base = reader.fetch(contig, pos, pos)
+            ref, alt = base + ref, base + alt
+        else:
+            break
+    while len(ref) > 1 and len(alt) > 1 and ref[0] == alt[0]:
+        ref, alt = ref[1:], alt[1:]
+        pos += 1
+    return pos, ref, alt
+
+
+def normalize_tsv_records(
+    records: typing.Sequence[TsvRecord], references: typing.Mapping[str, IndexedFasta]
+) -> typing.List[TsvRecord]:
+    """Normalize the variants of the records on assemblies with a genome in ``references``.
+
+    Records on other assemblies, on chromosomes missing in the genome, or with a reference allele
+    that does not match the genome are left as they are.
+    """
+    readers = {assembly: WindowReader(fasta) for assembly, fasta in references.items()}
+    result = []
+    num_changed = 0
+    for record in records:
+        reader = readers.get(record.assembly.value)
+        contig = reader.fasta.contig_name(record.chromosome.value) if reader else None
+        if not reader or not contig:
+            result.append(record)
+            continue
+        ref, alt = record.ref.upper(), record.alt.upper()
+        if reader.fetch(contig, record.pos, record.pos + len(ref) - 1) != ref:
+            logger.warning(
+                "Not normalizing record %s, reference allele does not match genome",
+                record.local_key,
+            )
+            result.append(record)
+            continue
+        pos, ref, alt = normalize_variant(reader, contig, record.pos, ref, alt)
+        if (pos, ref, alt) != (record.pos, record.ref, record.alt):
+            record = attrs.evolve(record, pos=pos, ref=ref, alt=alt)
+            num_changed += 1
+        result.append(record)
+    logger.info("Normalized %d of %d records", num_changed, len(records))
+    return result
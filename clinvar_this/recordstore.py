@@ -0,0 +1,217 @@
+"""JSON Lines record store for large batches.
+
+The store is an alternative to the payload snapshots of ``clinvar_this.storage`` in the directory
+``RECORD_STORE_DIRNAME`` of a batch.  It consists of
+
+- ``HEADER_FILENAME`` with the versions of the container-level fields of the payload, and
+- ``RECORDS_FILENAME``, an append-only log with one line per written version of a record.
+
+Writing a payload only appends the records that changed.  As all versions are kept with their
+timestamp, the latest and earlier payloads are reconstructed by scanning the log.  A partially
+written last line, e.g., after an interrupted write, is truncated when scanning.  ``compact()``
+drops the versions that are not needed for reconstructing a given set of payloads.
+"""
+
+import bisect
+import collections
+import json
+import os
+import pathlib
+import typing
+
+from logzero import logger
+
+from clinvar_this import exceptions
+
+#: Name of the record store directory in the batch directory.
+RECORD_STORE_DIRNAME = "records"
+
+#: File name of the container-level fields.
+HEADER_FILENAME = "header.json"
+
+#: File name of the record log.
+RECORDS_FILENAME = "records.jsonl"
+
+#: Type of the unstructured records and containers.
+JsonDict = typing.Dict[str, typing.Any]
+
+
+class RecordStore:
+    """Access to the record store in directory ``path``."""
+
+    def __init__(self, path: pathlib.Path):
+        self.path = path
+        self.header_path = path / HEADER_FILENAME
+        self.records_path = path / RECORDS_FILENAME
+
+    @staticmethod
+    def exists(path: pathlib.Path) -> bool:
+        """Return whether there is a record store in directory ``path``."""
+        return (path / HEADER_FILENAME).exists()
+
+    def _read_header(self) -> typing.List[typing.Tuple[str, JsonDict]]:
+        """Return the ``(timestamp, fields)`` versions of the container-level fields."""
+        if not self.header_path.exists():
+            return []
+        with self.header_path.open("rt") as inputf:
+            return [(timestamp, fields) for timestamp, fields in json.load(inputf)["versions"]]
+
+    def _write_header(self, versions: typing.List[typing.Tuple[str, JsonDict]]):
+        tmp_path = self.header_path.with_name(f".tmp-{os.getpid()}.{HEADER_FILENAME}")
+        with tmp_path.open("wt") as outputf:
+            json.dump({"versions": versions}, outputf, indent=2)
+            outputf.flush()
+            os.fsync(outputf.fileno())
+        os.replace(tmp_path, self.header_path)
+
+    def latest_timestamp(self) -> typing.Optional[str]:
+        """Return the timestamp of the latest write, if any."""
+        if not self.exists(self.path):
+            return None
+        timestamps = [timestamp for timestamp, _ in self._read_header()[-1:]]
+        timestamps.extend(collections.deque((line["ts"] for _, line in self._scan()), maxlen=1))
+        return max(timestamps, default=None)
+
+    def _scan(self) -> typing.Iterator[typing.Tuple[int, JsonDict]]:
+        """Yield ``(offset, line)`` of the log, truncating a partially written last line."""
+        if not self.records_path.exists():
+            return
+        with self.records_path.open("rb") as inputf:
+            offset = 0
+            for raw_line in inputf:
+                try:
+                    line = json.loads(raw_line)
+                except ValueError:
+                    line = None
+                if line is None or not raw_line.endswith(b"\n"):
+                    logger.warning("Truncating partial line at offset %d of log", offset)
+                    inputf.close()
+                    os.truncate(self.records_path, offset)
+                    return
+                yield offset, line
+                offset += len(raw_line)
+
+    def iter_records(self, upto: typing.Optional[str] = None) -> typing.Iterator[JsonDict]:
+        """Yield the records in order, as of the latest write not after ``upto``.
+
+        Records keep their position when changed and are moved to the end when added again.
+        """
+        records: typing.Dict[str, JsonDict] = {}
+        for _, line in self._scan():
+            if upto and line["ts"] > upto:
+                break
+            if line["record"] is None:
+                records.pop(line["local_key"], None)
+            else:
+                records[line["local_key"]] = line["record"]
+        yield from records.values()
+
+    def load(self, upto: typing.Optional[str] = None) -> typing.Optional[JsonDict]:
+        """Return the unstructured container as of the latest write not after ``upto``."""
+        versions = [
+            fields for timestamp, fields in self._read_header() if not upto or timestamp <= upto
+        ]
+        if not versions:
+            return None
+        return {**versions[-1], "clinvar_submission": list(self.iter_records(upto))}
+
+    def write(
+        self, timestamp: str, payload: JsonDict, previous: typing.Optional[JsonDict] = None
+    ) -> int:
+        """Write the unstructured container ``payload`` at ``timestamp``.
+
+        Only records that differ from ``previous`` (default: the current records) are appended.
+
+        :return: The number of appended lines.
+        :raises exceptions.InvalidFormat: if records have no or duplicate ``local_key`` values.
+        """
+        records: typing.Dict[str, JsonDict] = {}
+        for record in payload.get("clinvar_submission") or []:
+            local_key = record.get("local_key")
+            if not local_key or local_key in records:
+                raise exceptions.InvalidFormat(
+                    f"Records need unique local keys in record store, got {local_key!r}"
+                )
+            records[local_key] = record
+        self.path.mkdir(parents=True, exist_ok=True)
+        if previous is None:
+            previous = self.load() or {}
+        previous_records = {
+            record["local_key"]: record for record in previous.get("clinvar_submission") or []
+        }
+
+        fields = {key: value for key, value in payload.items() if key != "clinvar_submission"}
+        versions = self._read_header()
+        if not versions or versions[-1][1] != fields:
+            self._write_header(versions + [(timestamp, fields)])
+
+        lines: typing.List[JsonDict] = [
+            {"ts": timestamp, "local_key": local_key, "record": record}
+            for local_key, record in records.items()
+            if previous_records.get(local_key) != record
+        ] + [
+            {"ts": timestamp, "local_key": local_key, "record": None}
+            for local_key in previous_records
+            if local_key not in records
+        ]
+        with self.records_path.open("ab") as outputf:
+            for line in lines:
+                outputf.write(json.dumps(line, separators=(",", ":")).encode("utf-8") + b"\n")
+            outputf.flush()
+            os.fsync(outputf.fileno())
+        logger.debug("Appended %d lines to record store at %s", len(lines), self.path)
+        return len(lines)
+
+    def versions(self) -> typing.List[str]:
+        """Return the sorted timestamps of the writes."""
+        timestamps = {timestamp for timestamp, _ in self._read_header()}
+        timestamps.update(line["ts"] for _, line in self._scan())
+        return sorted(timestamps)
+
+    def compact(self, keep: typing.Iterable[str], dry_run: bool = False) -> int:
+        """Drop the record and header versions not needed for the payloads at the ``keep`` times.
+
+        :return: The number of bytes reclaimed (or that would be with ``dry_run``).
+        """
+        keep = sorted(set(keep))
+        lines = [line for _, line in self._scan()]
+        by_key: typing.Dict[str, typing.List[int]] = {}
+        for i, line in enumerate(lines):
+            by_key.setdefault(line["local_key"], []).append(i)
+        needed: typing.Set[int] = set()
+        for indices in by_key.values():
+            timestamps = [lines[i]["ts"] for i in indices]
+            kept = sorted(
+                {
+                    indices[pos - 1]
+                    for pos in (bisect.bisect_right(timestamps, timestamp) for timestamp in keep)
+                    if pos
+                }
+            )
+            # tombstones are only needed after a kept version of the record
+            needed.update(i for j, i in enumerate(kept) if lines[i]["record"] is not None or j > 0)
+        versions = self._read_header()
+        header_timestamps = [timestamp for timestamp, _ in versions]
+        needed_versions = sorted(
+            {pos - 1 for pos in (bisect.bisect_right(header_timestamps, ts) for ts in keep) if pos}
+        )
+
+        old_size = self.records_path.stat().st_size if self.records_path.exists() else 0
+        data = b"".join(
+            json.dumps(lines[i], separators=(",", ":")).encode("utf-8") + b"\n"
+            for i in sorted(needed)
+        )
+        reclaimed = old_size - len(data)
+        if dry_run or (reclaimed <= 0 and len(needed_versions) == len(versions)):
+            return max(reclaimed, 0)
+        if len(needed_versions) != len(versions):
+            self._write_header([versions[i] for i in needed_versions])
+        if reclaimed > 0:
+            tmp_path = self.records_path.with_name(f".tmp-{os.getpid()}.{RECORDS_FILENAME}")
+            with tmp_path.open("wb") as outputf:
+                outputf.write(data)
+                outputf.flush()
+                os.fsync(outputf.fileno())
+            os.replace(tmp_path, self.records_path)
+        logger.debug("Compacted record store at %s by %d bytes", self.path, reclaimed)
+        return max(reclaimed, 0)
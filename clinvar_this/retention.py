@@ -0,0 +1,183 @@
+"""Retention policy for the history of batches.
+
+Every operation on a batch adds files to its directory.  ``collect_batch()`` removes the history
+that is not kept by a ``RetentionPolicy``:
+
+- payload versions are kept if they are among the latest ``keep_last`` ones or newer than
+  ``keep_days``, and always if they were submitted as incremental submission compares to them,
+- submission responses are always kept,
+- retrieve responses are kept like payload versions and, for each submission, the latest one
+  retrieved for it; summary files no longer referred to are removed.
+
+Kept deltas whose preceding snapshot is removed are first rewritten as full snapshots, so the
+history can be loaded at any time during the collection.  Deltas without a full snapshot before
+them cannot be loaded and are left untouched with a warning.  Batches with a
+``recordstore.RecordStore`` are compacted with ``RecordStore.compact()`` instead.
+"""
+
+import bisect
+import datetime
+import json
+import pathlib
+import typing
+
+import attrs
+from logzero import logger
+
+from clinvar_this import storage
+from clinvar_this.index import BatchIndex
+
+
+@attrs.define(frozen=True)
+class RetentionPolicy:
+    """Which history of the batches to keep."""
+
+    #: Number of latest payload versions and retrieve responses to keep.
+    keep_last: int = attrs.field(default=5, validator=attrs.validators.ge(1))
+    #: Keep payload versions and retrieve responses newer than this number of days.
+    keep_days: typing.Optional[float] = None
+    #: Number of backups of the configuration file to keep.
+    keep_config_backups: int = attrs.field(default=5, validator=attrs.validators.ge(0))
+
+
+def _kept(
+    timestamps: typing.Sequence[str], policy: RetentionPolicy, cutoff: typing.Optional[str]
+) -> typing.Set[str]:
+    """Return the ``timestamps`` kept by ``policy`` by number and age."""
+    kept = set(timestamps[-policy.keep_last :])
+    if cutoff:
+        kept.update(timestamp for timestamp in timestamps if timestamp >= cutoff)
+    return kept
+
+
+def _latest_not_after(timestamps: typing.Sequence[str], timestamp: str) -> typing.Optional[str]:
+    """Return the latest of the sorted ``timestamps`` not after ``timestamp``, if any."""
+    pos = bisect.bisect_right(timestamps, timestamp)
+    return timestamps[pos - 1] if pos else None
+
+
+def _size(path: pathlib.Path) -> int:
+    return path.stat().st_size if path.exists() else 0
+
+
+def _remove(batch_index: BatchIndex, name: str, kind: str, timestamp: str, path: pathlib.Path):
+    """Unregister and remove the file, an interrupted removal leaves an unregistered file."""
+    batch_index.remove_file(name, kind, timestamp, path.name)
+    path.unlink(missing_ok=True)
+
+
+def _collect_payloads(
+    batch_index: BatchIndex,
+    name: str,
+    kept: typing.Callable[[typing.Sequence[str]], typing.Set[str]],
+    dry_run: bool,
+) -> int:
+    files = batch_index.list_files(name, storage.PAYLOAD_KINDS)
+    first_full = next((i for i, (_, kind, _) in enumerate(files) if kind == "payload"), len(files))
+    if first_full:
+        logger.warning(
+            "Batch %s has %d payload deltas without a full snapshot before them, leaving them",
+            name,
+            first_full,
+        )
+        files = files[first_full:]
+    keep = kept([timestamp for timestamp, _, _ in files])
+    removed = [(timestamp, kind, path) for timestamp, kind, path in files if timestamp not in keep]
+    if dry_run:
+        return sum(_size(path) for _, _, path in removed)
+
+    reclaimed = 0
+    for i, (timestamp, kind, path) in enumerate(files):
+        if kind == "payload-delta" and timestamp in keep and i > 0 and files[i - 1][0] not in keep:
+            payload = storage.load_payload_unstructured(batch_index, name, upto=timestamp)
+            suffix = path.name.split(".json", 1)[1]
+            full_path = path.with_name(f"payload.{timestamp}.json{suffix}")
+            with storage.atomic_open_text(full_path) as outputf:
+                json.dump(payload, outputf, indent=2)
+            batch_index.add_file(name, "payload", timestamp, full_path.name)
+            reclaimed -= _size(full_path)
+            removed.append((timestamp, kind, path))
+    for timestamp, kind, path in removed:
+        reclaimed += _size(path)
+        _remove(batch_index, name, kind, timestamp, path)
+    return reclaimed
+
+
+def _collect_retrieve_responses(
+    batch_index: BatchIndex,
+    name: str,
+    kept: typing.Callable[[typing.Sequence[str]], typing.Set[str]],
+    dry_run: bool,
+) -> int:
+    files = batch_index.list_files(name, ("retrieve-response",))
+    keep = kept([timestamp for timestamp, _, _ in files])
+    # the final status of each submission, statuses are listed in order
+    final = {
+        submission_id: timestamp for timestamp, submission_id, _ in batch_index.list_statuses(name)
+    }
+    keep.update(final.values())
+
+    referenced = set()
+    for timestamp, _, path in files:
+        if timestamp in keep:
+            for summary in storage.read_json(path)["summaries"].values():
+                if isinstance(summary, str):
+                    referenced.add(pathlib.Path(summary).name)
+    summaries_dir = batch_index.profile_dir / name / storage.SUMMARIES_DIRNAME
+    orphans = [
+        path
+        for path in (sorted(summaries_dir.iterdir()) if summaries_dir.exists() else [])
+        if path.name not in referenced and not path.name.startswith(".tmp-")
+    ]
+    removed = [(timestamp, kind, path) for timestamp, kind, path in files if timestamp not in keep]
+
+    reclaimed = sum(_size(path) for _, _, path in removed) + sum(_size(path) for path in orphans)
+    if not dry_run:
+        for timestamp, kind, path in removed:
+            _remove(batch_index, name, kind, timestamp, path)
+        for path in orphans:
+            path.unlink()
+    return reclaimed
+
+
+def collect_batch(
+    batch_index: BatchIndex,
+    name: str,
+    policy: RetentionPolicy,
+    *,
+    dry_run: bool = False,
+    now: typing.Optional[datetime.datetime] = None,
+) -> int:
+    """Remove the history of the batch that is not kept by ``policy``.
+
+    :return: The number of bytes reclaimed (or that would be with ``dry_run``, not accounting for
+        deltas rewritten as full snapshots).
+    """
+    cutoff = None
+    if policy.keep_days is not None:
+        now = now or datetime.datetime.now()
+        cutoff = (now - datetime.timedelta(days=policy.keep_days)).strftime(storage.FORMAT_STR)
+    submissions = [timestamp for timestamp, _ in batch_index.list_submissions(name)]
+
+    def kept(timestamps: typing.Sequence[str]) -> typing.Set[str]:
+        """Return the payload versions to keep, including the submitted ones."""
+        result = _kept(timestamps, policy, cutoff)
+        for submitted in submissions:
+            version = _latest_not_after(timestamps, submitted)
+            if version:
+                result.add(version)
+        return result
+
+    store = storage.record_store(batch_index, name)
+    if store:
+        reclaimed = store.compact(kept(store.versions()), dry_run=dry_run)
+    else:
+        reclaimed = _collect_payloads(batch_index, name, kept, dry_run)
+    reclaimed += _collect_retrieve_responses(
+        batch_index,
+        name,
+        lambda timestamps: _kept(timestamps, policy, cutoff),
+        dry_run,
+    )
+    logger.info("Reclaimed %d bytes in batch %s", reclaimed, name)
+    return reclaimed
@@ -0,0 +1,531 @@
+"""Storage of payload snapshots and responses in batch directories.
+
+Each write creates a new snapshot of the batch's ``SubmissionContainer``.  A snapshot is either
+a full copy (``payload.<timestamp>.json``) or a delta (``payload-delta.<timestamp>.json``) to the
+previous snapshot.  Deltas contain the container-level fields, the records added or changed,
+and the ``local_key`` values of the records removed.  A full snapshot is written instead of a
+delta every ``COMPACTION_INTERVAL`` snapshots, when the delta would be large, or when records
+cannot be identified by a unique ``local_key``.
+
+All files can be written compressed with gzip or zstd, readers detect the compression from the
+file name suffix.
+
+Files are written to a temporary file in the batch directory that is synced and then renamed to
+its final name, so readers never see partially written files.
+
+Retrieve responses are stored compactly: the raw summary files are written once to the
+``SUMMARIES_DIRNAME`` directory, named by the SHA-256 of their content, and
+``retrieve-response.<timestamp>.json`` only contains the status and the paths of the summary
+files.  A response is not written again if neither the action states and responses nor the
+summary files changed since the previous one.
+
+Batches can alternatively keep their payload in a ``recordstore.RecordStore`` which appends only
+the changed records on each write.  Batches created with the ``"jsonl"`` storage format use it.
+
+The structured latest snapshot is additionally pickled to ``PAYLOAD_CACHE_FILENAME`` in the batch
+directory.  The cache is keyed by the names, sizes, and modification times of the snapshot files
+it was built from and is ignored when stale.
+"""
+
+import contextlib
+import datetime
+import json
+import os
+import pathlib
+import pickle
+import shutil
+import typing
+import uuid
+
+from logzero import logger
+
+from clinvar_api import client, common, models, msg
+from clinvar_this import __version__, exceptions
+from clinvar_this.index import BatchIndex
+from clinvar_this.io import compression as compression_
+from clinvar_this.recordstore import RECORD_STORE_DIRNAME, RECORDS_FILENAME, RecordStore
+
+#: Format string for timestamps in file names.
+FORMAT_STR = "%Y%m%d%H%M%S"
+
+#: Maximal number of deltas written after a full snapshot.
+COMPACTION_INTERVAL = 10
+
+#: Kinds of payload snapshot files in the index.
+PAYLOAD_KINDS = ("payload", "payload-delta")
+
+#: Storage formats of new batches, JSON snapshots or record store.
+STORAGE_FORMATS = ("json", "jsonl")
+
+#: Name of the directory with the summary files in the batch directory.
+SUMMARIES_DIRNAME = "summaries"
+
+#: File name of the structured payload cache in the batch directory.
+PAYLOAD_CACHE_FILENAME = ".payload-cache.pickle"
+
+#: Version of the payload cache format.
+PAYLOAD_CACHE_VERSION = 1
+
+
+def new_timestamp(previous: typing.Optional[str] = None) -> str:
+    """Return timestamp for a new file, strictly after ``previous`` if given."""
+    now = datetime.datetime.now().replace(microsecond=0)
+    if previous:
+        previous_dt = datetime.datetime.strptime(previous, FORMAT_STR)
+        if now <= previous_dt:
+            now = previous_dt + datetime.timedelta(seconds=1)
+    return now.strftime(FORMAT_STR)
+
+
+def _records_by_key(
+    records: typing.List[typing.Dict[str, typing.Any]]
+) -> typing.Optional[typing.Dict[str, typing.Dict[str, typing.Any]]]:
+    """Return records by ``local_key`` or ``None`` if keys are missing or not unique."""
+    result = {}
+    for record in records:
+        local_key = record.get("local_key")
+        if not local_key or local_key in result:
+            return None
+        result[local_key] = record
+    return result
+
+
+def compute_delta(
+    previous: typing.Dict[str, typing.Any], current: typing.Dict[str, typing.Any]
+) -> typing.Optional[typing.Dict[str, typing.Any]]:
+    """Compute the delta between two unstructured ``SubmissionContainer`` objects.
+
+    :return: The delta or ``None`` if records cannot be identified by their ``local_key``.
+    """
+    previous_records = _records_by_key(previous.get("clinvar_submission") or [])
+    current_records = _records_by_key(current.get("clinvar_submission") or [])
+    if previous_records is None or current_records is None:
+        return None
+    return {
+        "container": {k: v for k, v in current.items() if k != "clinvar_submission"},
+        "upsert": [
+            record
+            for local_key, record in current_records.items()
+            if previous_records.get(local_key) != record
+        ],
+        "delete": [local_key for local_key in previous_records if local_key not in current_records],
+    }
+
+
+def apply_delta(
+    base: typing.Dict[str, typing.Any], delta: typing.Dict[str, typing.Any]
+) -> typing.Dict[str, typing.Any]:
+    """Apply ``delta`` to the unstructured ``SubmissionContainer`` in ``base``.
+
+    Changed records keep their position, added records are appended.
+    """
+    records = {record["local_key"]: record for record in base.get("clinvar_submission") or []}
+    for local_key in delta["delete"]:
+        records.pop(local_key, None)
+    for record in delta["upsert"]:
+        records[record["local_key"]] = record
+    return {**delta["container"], "clinvar_submission": list(records.values())}
+
+
+def _payload_chain(
+    batch_index: BatchIndex, name: str, upto: typing.Optional[str] = None
+) -> typing.List[typing.Tuple[str, str, pathlib.Path]]:
+    """Return the snapshot files to reconstruct the latest snapshot not after ``upto``.
+
+    The result starts with the full snapshot and is followed by the deltas in order.
+    """
+    chain = []
+    for timestamp, kind, path in reversed(batch_index.list_files(name, PAYLOAD_KINDS)):
+        if upto and timestamp > upto:
+            continue
+        chain.append((timestamp, kind, path))
+        if kind == "payload":
+            break
+    else:
+        if chain:
+            raise exceptions.IOException(f"Found no full payload snapshot for deltas in {name}")
+    return list(reversed(chain))
+
+
+@contextlib.contextmanager
+def atomic_open_text(path: pathlib.Path) -> typing.Iterator[typing.TextIO]:
+    """Open ``path`` for writing text, compressed according to its suffix, and replace atomically.
+
+    The file is written to a temporary file next to ``path`` which is synced to disk and renamed
+    to ``path`` when the context is left without exception.
+    """
+    tmp_path = path.with_name(f".tmp-{os.getpid()}-{uuid.uuid4().hex}.{path.name}")
+    try:
+        with compression_.open_text(tmp_path, "wt") as outputf:
+            yield outputf
+        fd = os.open(tmp_path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        os.replace(tmp_path, path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+    fd = os.open(path.parent, os.O_RDONLY)
+    try:
+        os.fsync(fd)  # persist the rename
+    finally:
+        os.close(fd)
+
+
+def read_json(path: pathlib.Path) -> typing.Any:
+    """Read JSON file at ``path``, compressed or not."""
+    with compression_.open_text(path) as inputf:
+        return json.load(inputf)
+
+
+def write_json(
+    batch_index: BatchIndex,
+    name: str,
+    kind: str,
+    data: typing.Any,
+    *,
+    compression: str = "none",
+    indent: typing.Optional[int] = None,
+    kinds: typing.Optional[typing.Iterable[str]] = None,
+) -> typing.Tuple[str, pathlib.Path]:
+    """Write ``data`` to a new ``<kind>.<timestamp>.json`` file and register it in the index.
+
+    The timestamp is strictly after the latest file of the same ``kinds`` (default: ``kind``).
+
+    :return: The timestamp and path of the written file.
+    """
+    batch_dir = batch_index.profile_dir / name
+    batch_dir.mkdir(exist_ok=True, parents=True)
+    previous = batch_index.list_files(name, kinds or (kind,))
+    timestamp = new_timestamp(previous[-1][0] if previous else None)
+    path = batch_dir / f"{kind}.{timestamp}.json{compression_.suffix_for(compression)}"
+    with atomic_open_text(path) as outputf:
+        json.dump(data, outputf, indent=indent)
+    batch_index.add_file(name, kind, timestamp, path.name)
+    return timestamp, path
+
+
+def record_counts(payload: typing.Dict[str, typing.Any]) -> typing.Tuple[int, int]:
+    """Return the number of records and of records with an error message in ``payload``."""
+    records = payload.get("clinvar_submission") or []
+    num_errors = sum(1 for record in records if (record.get("extra_data") or {}).get("error_msg"))
+    return len(records), num_errors
+
+
+def variant_rows(
+    payload: typing.Dict[str, typing.Any]
+) -> typing.List[typing.Tuple[typing.Any, ...]]:
+    """Return the values of ``index.VARIANT_COLUMNS`` for the records in ``payload``.
+
+    Records without ``local_key`` are skipped, records have one row per variant and one row
+    without coordinates if they have no variants.
+    """
+    result: typing.List[typing.Tuple[typing.Any, ...]] = []
+    for record in payload.get("clinvar_submission") or []:
+        if not record.get("local_key"):
+            continue
+        variants = (record.get("variant_set") or {}).get("variant") or [{}]
+        for i, variant in enumerate(variants):
+            coords = variant.get("chromosome_coordinates") or {}
+            result.append(
+                (
+                    record["local_key"],
+                    i,
+                    coords.get("assembly"),
+                    coords.get("chromosome"),
+                    coords.get("start"),
+                    coords.get("stop"),
+                    coords.get("reference_allele"),
+                    coords.get("alternate_allele"),
+                    record.get("clinvar_accession"),
+                )
+            )
+    return result
+
+
+def index_payload(
+    batch_index: BatchIndex, name: str, timestamp: str, payload: typing.Dict[str, typing.Any]
+):
+    """Register the record counts and variants of the batch's latest ``payload`` in the index."""
+    batch_index.set_record_counts(name, *record_counts(payload))
+    batch_index.set_variants(name, timestamp, variant_rows(payload))
+
+
+def record_store(batch_index: BatchIndex, name: str) -> typing.Optional[RecordStore]:
+    """Return the record store of the batch if it uses one."""
+    path = batch_index.profile_dir / name / RECORD_STORE_DIRNAME
+    return RecordStore(path) if RecordStore.exists(path) else None
+
+
+def _load_chain_unstructured(
+    chain: typing.List[typing.Tuple[str, str, pathlib.Path]]
+) -> typing.Dict[str, typing.Any]:
+    _, _, base_path = chain[0]
+    payload = read_json(base_path)
+    for _, _, delta_path in chain[1:]:
+        payload = apply_delta(payload, read_json(delta_path))
+    return payload
+
+
+def _status_key(data: typing.Dict[str, typing.Any]) -> typing.Any:
+    """Return the parts of a stored retrieve response that identify changes of the status.
+
+    The ``updated`` timestamps of the actions change on each poll while a submission is being
+    processed and are left out.
+    """
+    return (
+        [
+            (action.get("status"), action.get("responses"))
+            for action in data["status"].get("actions", [])
+        ],
+        data["summaries"],
+    )
+
+
+def spool_dir(batch_index: BatchIndex, name: str) -> pathlib.Path:
+    """Return the directory of the batch's summary files, where the raw summaries of a retrieval
+    are spooled to before ``write_retrieve_response()``."""
+    path = batch_index.profile_dir / name / SUMMARIES_DIRNAME
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def write_retrieve_response(
+    batch_index: BatchIndex,
+    name: str,
+    submission_id: str,
+    status: typing.Dict[str, typing.Any],
+    raw_summaries: typing.Mapping[str, client.RawSummary],
+    compression: str = "none",
+) -> typing.Optional[typing.Tuple[str, pathlib.Path]]:
+    """Write the unstructured ``SubmissionStatus`` of ``submission_id`` and the raw summary
+    files for the batch.
+
+    Summary files with content that is already stored are not written again.  The temporary
+    files of ``raw_summaries`` are removed.
+
+    :return: The timestamp and path of the written file, ``None`` if the status is the same as
+        the latest one and for the same submission.
+    """
+    summaries_dir = spool_dir(batch_index, name)
+    pointers = {}
+    try:
+        for url, raw_summary in raw_summaries.items():
+            existing = sorted(summaries_dir.glob(f"{raw_summary.digest}.json*"))
+            if existing:
+                path = existing[0]
+            else:
+                path = summaries_dir / (
+                    f"{raw_summary.digest}.json{compression_.suffix_for(compression)}"
+                )
+                with raw_summary.path.open("rt", encoding="utf-8") as inputf:
+                    with atomic_open_text(path) as outputf:
+                        shutil.copyfileobj(inputf, outputf)
+            pointers[url] = f"{SUMMARIES_DIRNAME}/{path.name}"
+    finally:
+        for raw_summary in raw_summaries.values():
+            raw_summary.path.unlink(missing_ok=True)
+    data = {"submission_id": submission_id, "status": status, "summaries": pointers}
+
+    latest = batch_index.list_files(name, ("retrieve-response",))
+    if latest:
+        previous = read_json(latest[-1][2])
+        if previous.get("submission_id") == submission_id and _status_key(previous) == _status_key(
+            data
+        ):
+            logger.debug("Retrieve response unchanged since %s", latest[-1][0])
+            return None
+    return write_json(batch_index, name, "retrieve-response", data, compression=compression)
+
+
+def load_retrieve_response(path: pathlib.Path) -> typing.Dict[str, typing.Any]:
+    """Load the unstructured ``RetrieveStatusResult`` from ``path`` with its summary files.
+
+    Responses written before summary files were stored separately contain the unstructured
+    summaries inline.
+    """
+    data = read_json(path)
+    summaries = {}
+    for url, summary in data["summaries"].items():
+        if isinstance(summary, str):
+            sr_msg = common.CONVERTER.structure(
+                read_json(path.parent / summary), msg.SummaryResponse
+            )
+            summary = common.CONVERTER.unstructure(models.SummaryResponse.from_msg(sr_msg))
+        summaries[url] = summary
+    return {"status": data["status"], "summaries": summaries}
+
+
+def load_payload_unstructured(
+    batch_index: BatchIndex, name: str, upto: typing.Optional[str] = None
+) -> typing.Optional[typing.Dict[str, typing.Any]]:
+    """Load the unstructured payload of the latest snapshot not after ``upto``.
+
+    :return: The payload or ``None`` if there is no snapshot.
+    """
+    store = record_store(batch_index, name)
+    if store:
+        return store.load(upto)
+    chain = _payload_chain(batch_index, name, upto)
+    if not chain:
+        return None
+    return _load_chain_unstructured(chain)
+
+
+def _cache_key(chain: typing.List[typing.Tuple[str, str, pathlib.Path]]) -> typing.Tuple:
+    """Return key of the payload cache for the snapshot files in ``chain``."""
+    files = []
+    for _, _, path in chain:
+        stat = path.stat()
+        files.append((path.name, stat.st_size, stat.st_mtime_ns))
+    return (PAYLOAD_CACHE_VERSION, __version__, tuple(files))
+
+
+def _read_cache(batch_dir: pathlib.Path, key: typing.Tuple) -> typing.Optional[typing.Any]:
+    """Return the cached payload if the cache in ``batch_dir`` has the given ``key``."""
+    try:
+        with (batch_dir / PAYLOAD_CACHE_FILENAME).open("rb") as inputf:
+            cached_key, payload = pickle.load(inputf)
+    except FileNotFoundError:
+        return None
+    except Exception as e:  # any unpickling problem means that the cache is unusable
+        logger.debug("Ignoring unreadable payload cache in %s: %s", batch_dir, e)
+        return None
+    if cached_key != key or not isinstance(payload, models.SubmissionContainer):
+        return None
+    return payload
+
+
+def _write_cache(batch_dir: pathlib.Path, key: typing.Tuple, payload: models.SubmissionContainer):
+    """Write the payload cache in ``batch_dir``, failure to do so is not an error."""
+    cache_path = batch_dir / PAYLOAD_CACHE_FILENAME
+    tmp_path = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.tmp")
+    try:
+        with tmp_path.open("wb") as outputf:
+            pickle.dump((key, payload), outputf, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except (OSError, pickle.PicklingError) as e:
+        logger.debug("Could not write payload cache in %s: %s", batch_dir, e)
+        tmp_path.unlink(missing_ok=True)
+
+
+def load_payload(
+    batch_index: BatchIndex, name: str, upto: typing.Optional[str] = None
+) -> typing.Optional[models.SubmissionContainer]:
+    """Load the payload of the latest snapshot not after ``upto``, ``None`` if none exists.
+
+    The payload cache is used if it is current and updated when loading the latest snapshot.
+    """
+    batch_dir = batch_index.profile_dir / name
+    store = record_store(batch_index, name)
+    if store:
+        if upto is not None:
+            unstructured = store.load(upto)
+            if unstructured is None:
+                return None
+            return common.CONVERTER.structure(unstructured, models.SubmissionContainer)
+        chain = _store_chain(store)
+    else:
+        chain = _payload_chain(batch_index, name, upto)
+        if not chain:
+            return None
+    key = _cache_key(chain)
+    payload = _read_cache(batch_dir, key)
+    if payload is None:
+        unstructured = store.load() if store else _load_chain_unstructured(chain)
+        if unstructured is None:
+            return None
+        payload = common.CONVERTER.structure(unstructured, models.SubmissionContainer)
+        if upto is None:
+            _write_cache(batch_dir, key, payload)
+    return payload
+
+
+def _store_chain(store: RecordStore) -> typing.List[typing.Tuple[str, str, pathlib.Path]]:
+    """Return the record store files in the form of ``_payload_chain()`` for ``_cache_key()``."""
+    return [
+        (path.name, "records", path)
+        for path in (store.header_path, store.records_path)
+        if path.exists()
+    ]
+
+
+def _write_store_payload(
+    batch_index: BatchIndex,
+    name: str,
+    store: RecordStore,
+    submission_container: models.SubmissionContainer,
+    previous: typing.Optional[models.SubmissionContainer],
+) -> pathlib.Path:
+    """Write the payload to the record store of the batch, see ``write_payload()``."""
+    payload = common.CONVERTER.unstructure(submission_container)
+    timestamp = new_timestamp(store.latest_timestamp())
+    store.write(
+        timestamp, payload, None if previous is None else common.CONVERTER.unstructure(previous)
+    )
+    batch_index.add_file(name, "records", timestamp, f"{RECORD_STORE_DIRNAME}/{RECORDS_FILENAME}")
+    index_payload(batch_index, name, timestamp, payload)
+    _write_cache(
+        batch_index.profile_dir / name, _cache_key(_store_chain(store)), submission_container
+    )
+    return store.records_path
+
+
+def write_payload(
+    batch_index: BatchIndex,
+    name: str,
+    submission_container: models.SubmissionContainer,
+    previous: typing.Optional[models.SubmissionContainer] = None,
+    compression: str = "none",
+    storage_format: str = "json",
+) -> pathlib.Path:
+    """Write a new payload snapshot for the batch and register it in the index.
+
+    :param previous: The current latest snapshot if already loaded by the caller.
+    :param compression: The compression to use for the written file.
+    :param storage_format: The format to use for batches without payload, one of
+        ``STORAGE_FORMATS``.  Existing batches keep their format.
+    :return: Path to the written file.
+    """
+    store = record_store(batch_index, name)
+    chain = _payload_chain(batch_index, name)
+    if store is None and not chain and storage_format == "jsonl":
+        store = RecordStore(batch_index.profile_dir / name / RECORD_STORE_DIRNAME)
+    if store is not None:
+        return _write_store_payload(batch_index, name, store, submission_container, previous)
+
+    payload = common.CONVERTER.unstructure(submission_container)
+    delta = None
+    if chain and len(chain) <= COMPACTION_INTERVAL:
+        if previous is None:
+            previous_payload = load_payload_unstructured(batch_index, name)
+        else:
+            previous_payload = common.CONVERTER.unstructure(previous)
+        delta = compute_delta(previous_payload or {}, payload)
+        num_records = len(payload.get("clinvar_submission") or [])
+        if delta and len(delta["upsert"]) + len(delta["delete"]) > max(1, num_records // 2):
+            delta = None  # delta too large, write full snapshot
+
+    if delta is None:
+        kind, data = "payload", payload
+    else:
+        kind, data = "payload-delta", delta
+        logger.debug(
+            "Writing delta with %d upserts and %d deletes",
+            len(delta["upsert"]),
+            len(delta["delete"]),
+        )
+    timestamp, path = write_json(
+        batch_index, name, kind, data, compression=compression, indent=2, kinds=PAYLOAD_KINDS
+    )
+    index_payload(batch_index, name, timestamp, payload)
+    if delta is None or apply_delta(previous_payload or {}, delta) == payload:
+        # only cache if loading from the files yields the same record order
+        _write_cache(
+            batch_index.profile_dir / name,
+            _cache_key(_payload_chain(batch_index, name)),
+            submission_container,
+        )
+    return path
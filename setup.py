@@ -50,6 +50,10 @@ setup(
     description="ClinVar Submission via API Made Easy",
     entry_points={"console_scripts": ["clinvar-this=clinvar_this.cli:cli"]},
     install_requires=install_requirements,
+    extras_require={
+        "streaming": ["ijson >=3.1, <4.0"],
+        "zstd": ["zstandard >=0.15"],
+    },
     license="MIT license",
     long_description=readme + "\n\n" + history,
     long_description_content_type="text/markdown",
@@ -1,6 +1,14 @@
+import tempfile
+
 import pytest
 
 
+@pytest.fixture(autouse=True)
+def spool_to_tmp_path(tmp_path, monkeypatch):
+    """Keep the raw summaries spooled by ``client.retrieve_status()`` in ``tmp_path``."""
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+
+
 @pytest.fixture
 def data_created():
     return {"id": "SUB999999"}
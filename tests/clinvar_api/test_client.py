@@ -1,6 +1,12 @@
+import gzip
+import hashlib
+import io
+import json
+
 import pytest
+import requests
 
-from clinvar_api import client, exceptions, models
+from clinvar_api import client, exceptions, instrumentation, models
 
 FAKE_ID = "SUBxxx"
 FAKE_TOKEN = "1234567890abcdefghijklmnopqrstuvwxyz"
@@ -12,14 +18,18 @@ FAKE_HEADERS = {
 def test_config_long_token():
     config = client.Config(auth_token="1234567890", use_testing=False, use_dryrun=False)
     assert str(config) == (
-        "Config(auth_token='12345*****', use_testing=False, use_dryrun=False, presubmission_validation=True)"
+        "Config(auth_token='12345*****', use_testing=False, use_dryrun=False, presubmission_validation=True, "
+        "stream_summaries=False, compress_requests=False, compression_level=6, trace_dir=None, "
+        "endpoint_url=None, max_retries=0, retry_backoff=1.0)"
     )
 
 
 def test_config_short_token():
     config = client.Config(auth_token="123", use_testing=False, use_dryrun=False)
     assert str(config) == (
-        "Config(auth_token='***', use_testing=False, use_dryrun=False, presubmission_validation=True)"
+        "Config(auth_token='***', use_testing=False, use_dryrun=False, presubmission_validation=True, "
+        "stream_summaries=False, compress_requests=False, compression_level=6, trace_dir=None, "
+        "endpoint_url=None, max_retries=0, retry_backoff=1.0)"
     )
 
 
@@ -39,6 +49,169 @@ def test_submit_data_success(requests_mock):
     assert str(result) == "Created(id='SUB999999')"
 
 
+def test_submit_data_success_compressed(requests_mock):
+    requests_mock.register_uri(
+        "POST",
+        "https://submit.ncbi.nlm.nih.gov/api/v1/submissions/",
+        request_headers={**FAKE_HEADERS, "Content-Encoding": "gzip"},
+        status_code=200,
+        reason="OK",
+        json={"id": "SUB999999"},
+    )
+    result = client.submit_data(
+        models.SubmissionContainer(),
+        config=client.Config(
+            auth_token=FAKE_TOKEN,
+            presubmission_validation=False,
+            compress_requests=True,
+            compression_level=9,
+        ),
+    )
+    assert str(result) == "Created(id='SUB999999')"
+    body = json.loads(gzip.decompress(requests_mock.last_request.body))
+    assert body == {
+        "actions": [{"type": "AddData", "targetDb": "clinvar", "data": {"content": {}}}]
+    }
+
+
+def test_submit_data_success_traced(requests_mock, tmp_path):
+    requests_mock.register_uri(
+        "POST",
+        "https://submit.ncbi.nlm.nih.gov/api/v1/submissions/",
+        request_headers=FAKE_HEADERS,
+        status_code=200,
+        reason="OK",
+        json={"id": "SUB999999"},
+    )
+    client.submit_data(
+        models.SubmissionContainer(),
+        config=client.Config(
+            auth_token=FAKE_TOKEN, presubmission_validation=False, trace_dir=str(tmp_path)
+        ),
+    )
+    request_path, response_path = sorted(tmp_path.iterdir())
+    assert request_path.name.endswith("-submit-request.json")
+    assert json.loads(request_path.read_text())["actions"][0]["type"] == "AddData"
+    assert response_path.name.endswith("-submit-response.json")
+    assert json.loads(response_path.read_text()) == {"id": "SUB999999"}
+
+
+def test_submit_data_retry(requests_mock):
+    requests_mock.register_uri(
+        "POST",
+        "https://submit.ncbi.nlm.nih.gov/api/v1/submissions/",
+        [
+            {"status_code": 429, "reason": "Too Many Requests", "json": {"message": "busy"}},
+            {"status_code": 200, "reason": "OK", "json": {"id": "SUB999999"}},
+        ],
+    )
+    collector = instrumentation.StatsCollector()
+    result = client.submit_data(
+        models.SubmissionContainer(),
+        config=client.Config(
+            auth_token=FAKE_TOKEN,
+            presubmission_validation=False,
+            max_retries=2,
+            retry_backoff=0.0,
+        ),
+        hooks=[collector],
+    )
+    assert str(result) == "Created(id='SUB999999')"
+    stats = collector.endpoints["submit"]
+    assert stats.requests == 2
+    assert stats.retries == 1
+    assert dict(stats.status_codes) == {200: 1, 429: 1}
+    assert stats.request_bytes > 0
+
+
+def test_submit_data_retries_exhausted(requests_mock):
+    requests_mock.register_uri(
+        "POST",
+        "https://submit.ncbi.nlm.nih.gov/api/v1/submissions/",
+        status_code=429,
+        reason="Too Many Requests",
+        json={"message": "busy"},
+    )
+    with pytest.raises(exceptions.SubmissionFailed):
+        client.submit_data(
+            models.SubmissionContainer(),
+            config=client.Config(
+                auth_token=FAKE_TOKEN,
+                presubmission_validation=False,
+                max_retries=1,
+                retry_backoff=0.0,
+            ),
+        )
+    assert requests_mock.call_count == 2
+
+
+@pytest.mark.parametrize(
+    "response",
+    [
+        {"status_code": 504, "reason": "Gateway Timeout", "json": {"message": "timeout"}},
+        {"exc": requests.ConnectionError("Connection aborted")},
+    ],
+)
+def test_submit_data_no_retry_after_sending(requests_mock, response):
+    requests_mock.register_uri(
+        "POST", "https://submit.ncbi.nlm.nih.gov/api/v1/submissions/", [response]
+    )
+    with pytest.raises((exceptions.SubmissionFailed, requests.ConnectionError)):
+        client.submit_data(
+            models.SubmissionContainer(),
+            config=client.Config(
+                auth_token=FAKE_TOKEN,
+                presubmission_validation=False,
+                max_retries=2,
+                retry_backoff=0.0,
+            ),
+        )
+    assert requests_mock.call_count == 1
+
+
+def test_submit_data_retry_connect_error(requests_mock):
+    requests_mock.register_uri(
+        "POST",
+        "https://submit.ncbi.nlm.nih.gov/api/v1/submissions/",
+        [
+            {"exc": requests.ConnectTimeout("Connect timeout")},
+            {"status_code": 200, "reason": "OK", "json": {"id": "SUB999999"}},
+        ],
+    )
+    result = client.submit_data(
+        models.SubmissionContainer(),
+        config=client.Config(
+            auth_token=FAKE_TOKEN,
+            presubmission_validation=False,
+            max_retries=1,
+            retry_backoff=0.0,
+        ),
+    )
+    assert str(result) == "Created(id='SUB999999')"
+    assert requests_mock.call_count == 2
+
+
+def test_retrieve_status_retry(requests_mock, data_submission_submitted):
+    requests_mock.register_uri(
+        "GET",
+        f"https://submit.ncbi.nlm.nih.gov/api/v1/submissions/{FAKE_ID}/actions/",
+        [
+            {"status_code": 503, "reason": "Service Unavailable"},
+            {"status_code": 200, "json": data_submission_submitted},
+        ],
+    )
+    result = client.retrieve_status(
+        FAKE_ID, client.Config(auth_token=FAKE_TOKEN, max_retries=1, retry_backoff=0.0)
+    )
+    assert result.status.actions
+    assert requests_mock.call_count == 2
+
+
+def test_config_invalid_compression_level():
+    with pytest.raises(ValueError):
+        client.Config(auth_token=FAKE_TOKEN, compression_level=10)
+
+
 def test_submit_data_failed(requests_mock):
     requests_mock.register_uri(
         "POST",
@@ -55,6 +228,35 @@ def test_submit_data_failed(requests_mock):
         )
 
 
+def test_submit_data_failed_no_json(requests_mock):
+    requests_mock.register_uri(
+        "POST",
+        "https://submit.ncbi.nlm.nih.gov/api/v1/submissions/",
+        request_headers=FAKE_HEADERS,
+        status_code=502,
+        reason="Bad Gateway",
+        text="<html>proxy error</html>",
+    )
+    with pytest.raises(exceptions.SubmissionFailed) as e:
+        client.submit_data(
+            models.SubmissionContainer(),
+            config=client.Config(auth_token=FAKE_TOKEN, presubmission_validation=False),
+        )
+    assert "502 Bad Gateway" in str(e)
+
+
+def test_structure_summary_incrementally(data_summary_response_processed):
+    pytest.importorskip("ijson")
+    inputf = io.BytesIO(json.dumps(data_summary_response_processed).encode("utf-8"))
+    result = client.structure_summary_incrementally(inputf)
+    expected = models.SummaryResponse.from_msg(
+        client.common.CONVERTER.structure(
+            data_summary_response_processed, client.msg.SummaryResponse
+        )
+    )
+    assert result == expected
+
+
 def test_retrieve_status_result():
     status_result = client.RetrieveStatusResult(
         status=models.SubmissionStatus(actions=[]), summaries={}
@@ -140,6 +342,49 @@ def test_retrieve_status_success_with_extra_files(
     )
 
 
+def test_retrieve_status_success_stream_summaries(
+    requests_mock, data_submission_processed, data_summary_response_processed, tmp_path
+):
+    pytest.importorskip("ijson")
+    requests_mock.register_uri(
+        "GET",
+        f"https://submit.ncbi.nlm.nih.gov/api/v1/submissions/{FAKE_ID}/actions/",
+        request_headers=FAKE_HEADERS,
+        status_code=200,
+        reason="OK",
+        json=data_submission_processed,
+    )
+    requests_mock.register_uri(
+        "GET",
+        (
+            "https://dsubmit.ncbi.nlm.nih.gov/api/2.0/files/xxxxxxxx"
+            "/sub999999-summary-report.json/?format=attachment"
+        ),
+        status_code=200,
+        reason="OK",
+        json=data_summary_response_processed,
+    )
+    expected = client.retrieve_status(
+        FAKE_ID,
+        config=client.Config(auth_token=FAKE_TOKEN, presubmission_validation=False),
+        spool_dir=tmp_path,
+    )
+    result = client.retrieve_status(
+        FAKE_ID,
+        config=client.Config(
+            auth_token=FAKE_TOKEN, presubmission_validation=False, stream_summaries=True
+        ),
+        spool_dir=tmp_path,
+    )
+    assert result == expected
+    (raw_summary,) = result.raw_summaries.values()
+    (expected_raw_summary,) = expected.raw_summaries.values()
+    assert raw_summary.path.parent == tmp_path
+    assert raw_summary.digest == expected_raw_summary.digest
+    assert raw_summary.digest == hashlib.sha256(raw_summary.path.read_bytes()).hexdigest()
+    assert json.loads(raw_summary.path.read_bytes()) == data_summary_response_processed
+
+
 def test_retrieve_status_failed_initial_request(requests_mock):
     requests_mock.register_uri(
         "GET",
@@ -181,6 +426,47 @@ def test_retrieve_status_failed_extra_request(requests_mock, data_submission_pro
         )
 
 
+def test_retrieve_status_invalid_summary_removes_spool_file(
+    requests_mock, data_submission_processed, tmp_path
+):
+    requests_mock.register_uri(
+        "GET",
+        f"https://submit.ncbi.nlm.nih.gov/api/v1/submissions/{FAKE_ID}/actions/",
+        request_headers=FAKE_HEADERS,
+        status_code=200,
+        reason="OK",
+        json=data_submission_processed,
+    )
+    requests_mock.register_uri(
+        "GET",
+        (
+            "https://dsubmit.ncbi.nlm.nih.gov/api/2.0/files/xxxxxxxx"
+            "/sub999999-summary-report.json/?format=attachment"
+        ),
+        status_code=200,
+        reason="OK",
+        text="not json",
+    )
+
+    with pytest.raises(Exception):
+        client.retrieve_status(
+            FAKE_ID,
+            config=client.Config(auth_token=FAKE_TOKEN, presubmission_validation=False),
+            spool_dir=tmp_path,
+        )
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_client_pool_maxsize():
+    client_obj = client.Client(config=client.Config(auth_token=FAKE_TOKEN), pool_maxsize=32)
+    for url in (client.ENDPOINT_URL_PROD, "http://127.0.0.1/api/v1/submissions/"):
+        adapter = client_obj.session.get_adapter(url)
+        assert adapter.poolmanager.connection_pool_kw["maxsize"] == 32
+    default = client.Client(config=client.Config(auth_token=FAKE_TOKEN))
+    adapter = default.session.get_adapter(client.ENDPOINT_URL_PROD)
+    assert adapter.poolmanager.connection_pool_kw["maxsize"] == requests.adapters.DEFAULT_POOLSIZE
+
+
 def test_client_submit_success(requests_mock):
     requests_mock.register_uri(
         "POST",
@@ -206,10 +492,13 @@ def test_client_retrieve_status_success_no_extra_file(requests_mock, data_submis
         reason="OK",
         json=data_submission_submitted,
     )
+    collector = instrumentation.StatsCollector()
     client_obj = client.Client(
-        config=client.Config(auth_token=FAKE_TOKEN, presubmission_validation=False)
+        config=client.Config(auth_token=FAKE_TOKEN, presubmission_validation=False),
+        hooks=[collector],
     )
     result = client_obj.retrieve_status(FAKE_ID)
+    assert collector.endpoints["status"].requests == 1
     assert str(result).replace("tzlocal", "tzutc") == (
         "RetrieveStatusResult(status=SubmissionStatus(actions=[SubmissionStatusActions("
         "id='SUB999999-1', responses=[], status='submitted', target_db='clinvar', "
@@ -0,0 +1,81 @@
+import threading
+
+import pytest
+
+from clinvar_api import client, exceptions, models, schemas
+from clinvar_api.fake_server import FakeServer, FakeServerConfig
+
+FAKE_TOKEN = "1234567890abcdefghijklmnopqrstuvwxyz"
+
+
+@pytest.fixture
+def fake_server_factory():
+    servers = []
+
+    def factory(config=FakeServerConfig()):
+        server = FakeServer(config=config)
+        threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield factory
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def test_fake_server_roundtrip(fake_server_factory, make_record, make_container):
+    server = fake_server_factory(FakeServerConfig(polls_per_state=1, seed=42))
+    client_obj = client.Client(
+        client.Config(auth_token=FAKE_TOKEN, endpoint_url=server.endpoint_url)
+    )
+    created = client_obj.submit_data(make_container(make_record("key-1"), make_record("key-2")))
+    assert created.id == "SUB000001"
+
+    statuses = [client_obj.retrieve_status(created.id) for _ in range(3)]
+    assert [s.status.actions[0].status for s in statuses] == [
+        "submitted",
+        "processing",
+        "processed",
+    ]
+    (summary,) = statuses[-1].summaries.values()
+    assert summary.total_success == 2
+    assert [s.identifiers.clinvar_accession for s in summary.submissions] == [
+        "SCV000000001",
+        "SCV000000002",
+    ]
+    schemas.validate_status_summary(server.state.summary(created.id))
+
+
+def test_fake_server_record_errors(fake_server_factory, make_record, make_container):
+    server = fake_server_factory(FakeServerConfig(polls_per_state=0, record_error_rate=1.0))
+    config = client.Config(auth_token=FAKE_TOKEN, endpoint_url=server.endpoint_url)
+    created = client.submit_data(make_container(make_record("key-1")), config)
+    result = client.retrieve_status(created.id, config)
+    assert result.status.actions[0].status == "error"
+    (summary,) = result.summaries.values()
+    assert summary.total_errors == 1
+
+
+def test_fake_server_dry_run(fake_server_factory, make_record, make_container):
+    server = fake_server_factory()
+    config = client.Config(auth_token=FAKE_TOKEN, endpoint_url=server.endpoint_url, use_dryrun=True)
+    created = client.submit_data(make_container(make_record("key-1")), config)
+    assert created.id == "--NONE--dry-run-result--"
+
+
+def test_fake_server_injected_errors(fake_server_factory, make_record, make_container):
+    server = fake_server_factory(FakeServerConfig(error_rate=1.0))
+    config = client.Config(auth_token=FAKE_TOKEN, endpoint_url=server.endpoint_url)
+    with pytest.raises(exceptions.SubmissionFailed):
+        client.submit_data(make_container(make_record("key-1")), config)
+
+
+def test_fake_server_validates_payload(fake_server_factory):
+    server = fake_server_factory()
+    config = client.Config(
+        auth_token=FAKE_TOKEN, endpoint_url=server.endpoint_url, presubmission_validation=False
+    )
+    with pytest.raises(exceptions.SubmissionFailed) as e:
+        client.submit_data(models.SubmissionContainer(), config)
+    assert "Invalid submission" in str(e)
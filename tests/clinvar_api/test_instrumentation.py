@@ -0,0 +1,44 @@
+from clinvar_api import instrumentation
+
+
+def make_record(**kwargs):
+    values = {
+        "endpoint": "status",
+        "method": "GET",
+        "url": "https://example.com/",
+        "attempt": 0,
+        "request_bytes": 0,
+        "response_bytes": 100,
+        "ttfb": 0.01,
+        "total": 0.02,
+        "status_code": 200,
+    }
+    values.update(kwargs)
+    return instrumentation.RequestRecord(**values)
+
+
+def test_endpoint_stats():
+    stats = instrumentation.EndpointStats()
+    stats.add(make_record(total=0.02))
+    stats.add(make_record(total=0.3, attempt=1, status_code=503))
+    stats.add(make_record(total=40.0, status_code=None, response_bytes=None, error="refused"))
+    assert stats.requests == 3
+    assert stats.retries == 1
+    assert stats.errors == 1
+    assert stats.response_bytes == 200
+    assert dict(stats.status_codes) == {200: 1, 503: 1}
+    assert stats.histogram == [1, 0, 0, 1, 0, 0, 0, 0, 0, 1]
+    assert stats.quantile(0.5) == 0.5
+    assert stats.quantile(1.0) == 40.0
+
+
+def test_stats_collector():
+    collector = instrumentation.StatsCollector()
+    assert collector.format() == "-- NO API REQUESTS --"
+    collector(make_record(endpoint="submit", method="POST", request_bytes=1000))
+    collector(make_record(endpoint="status"))
+    assert sorted(collector.endpoints) == ["status", "submit"]
+    assert collector.endpoints["submit"].request_bytes == 1000
+    table = collector.format()
+    assert "submit" in table
+    assert "200: 1" in table
@@ -0,0 +1,29 @@
+import hashlib
+
+from clinvar_api import trace
+
+
+def test_body_summary():
+    body = b'{"id": "SUB999999"}'
+    assert trace.body_summary(body) == (f"19 bytes, sha256={hashlib.sha256(body).hexdigest()[:16]}")
+
+
+def test_write_trace(tmp_path):
+    first = trace.write_trace(tmp_path / "traces", "submit-request", b"{}")
+    second = trace.write_trace(tmp_path / "traces", "submit-response", b"[]")
+    assert first.read_bytes() == b"{}"
+    assert second.read_bytes() == b"[]"
+    assert first.name.endswith("-submit-request.json")
+    assert sorted([second, first]) == [first, second]
+
+
+def test_trace_body(tmp_path):
+    trace.trace_body(str(tmp_path / "traces"), "submit-request", b"{}")
+    assert [path.read_bytes() for path in (tmp_path / "traces").iterdir()] == [b"{}"]
+
+
+def test_trace_body_disabled(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # relative trace paths would end up here
+    trace.trace_body(None, "submit-request", b"{}")
+    trace.trace_body("", "submit-request", b"{}")
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,48 @@
+import hashlib
+import pathlib
+import tempfile
+import threading
+
+import pytest
+
+from clinvar_api import client
+from clinvar_api.fake_server import FakeServer, FakeServerConfig
+from clinvar_this import batches, config
+
+
+@pytest.fixture
+def share_dir(tmp_path, monkeypatch):
+    """Temporary replacement for ``batches.SHARE_DIR``."""
+    result = tmp_path / "share"
+    monkeypatch.setattr(batches, "SHARE_DIR", result)
+    return result
+
+
+@pytest.fixture
+def config_obj():
+    return config.Config(profile="default", auth_token="1234567890abcdefghijklmnopqrstuvwxyz")
+
+
+@pytest.fixture
+def fake_server(monkeypatch):
+    """Fake ClinVar API server that is used in place of the production endpoint."""
+    server = FakeServer(config=FakeServerConfig(polls_per_state=0))
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    monkeypatch.setattr(client, "ENDPOINT_URL_PROD", server.endpoint_url)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def spool_summary(tmp_path):
+    """Factory for ``client.RawSummary`` objects with the given body as returned by the client."""
+
+    def make(body: bytes) -> client.RawSummary:
+        with tempfile.NamedTemporaryFile(
+            prefix=".tmp-summary-", suffix=".json", dir=tmp_path, delete=False
+        ) as outputf:
+            outputf.write(body)
+        return client.RawSummary(pathlib.Path(outputf.name), hashlib.sha256(body).hexdigest())
+
+    return make
@@ -0,0 +1,419 @@
+import datetime
+import pathlib
+import random
+
+import attrs
+import pytest
+
+from clinvar_api import client, models
+from clinvar_this import batches, exceptions, retention, storage
+
+DATA_DIR = pathlib.Path(__file__).parent / "data"
+
+
+def test_gen_name(share_dir, config_obj):
+    today = datetime.date.today().strftime("%Y-%m-%d")
+    assert batches.gen_name(config_obj) == f"{today}-000"
+    batches.import_(config_obj, f"{today}-000", str(DATA_DIR / "example.tsv"), ())
+    assert batches.gen_name(config_obj) == f"{today}-001"
+
+
+def test_import_export(share_dir, config_obj, tmp_path):
+    batches.import_(config_obj, "batch-1", str(DATA_DIR / "example.tsv"), ())
+    assert len(list((share_dir / "default" / "batch-1").glob("payload.*.json"))) == 1
+    output_path = tmp_path / "out.tsv"
+    batches.export_(config_obj, "batch-1", str(output_path))
+    assert "NHLRC2" in output_path.read_text()
+    with pytest.raises(exceptions.IOException):
+        batches.export_(config_obj, "batch-1", str(output_path))
+
+
+def test_load_latest_payload_missing(share_dir, config_obj):
+    with pytest.raises(exceptions.ClinvarThisException):
+        batches._load_latest_payload(config_obj.profile, "does-not-exist")
+
+
+def test_list_and_reindex(share_dir, config_obj, capsys):
+    batches.list_(config_obj)
+    assert "NO BATCHES YET" in capsys.readouterr().out
+    batches.import_(config_obj, "batch-1", str(DATA_DIR / "example.tsv"), ())
+    (share_dir / "default" / "manual-batch").mkdir()
+    batches.reindex(config_obj)
+    batches.list_(config_obj)
+    out = capsys.readouterr().out
+    assert "batch-1" in out
+    assert "manual-batch" in out
+    assert "unsubmitted" in out
+    infos = batches._batch_index(config_obj.profile).list_batch_infos(names=["batch-1"])
+    assert infos[0].record_count == 1
+    batches.list_(config_obj, pattern="batch-*", states=["pending"])
+    assert "NO BATCHES YET" in capsys.readouterr().out
+
+
+def test_find(share_dir, config_obj, capsys):
+    batches.import_(config_obj, "batch-1", str(DATA_DIR / "example.tsv"), ())
+    batches.find(config_obj, "chr10:115614632 A>G")
+    out = capsys.readouterr().out
+    assert "batch-1" in out
+    assert "GRCh37 10:115614632 A>G" in out
+    batches.find(config_obj, "KEY")
+    assert "batch-1" in capsys.readouterr().out
+    batches.find(config_obj, "10-115614632-A-T")
+    assert "NO VARIANTS FOUND" in capsys.readouterr().out
+
+    batches.reindex(config_obj)
+    batches.find(config_obj, "10:115614632")
+    assert "batch-1" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize(
+    "query,expected",
+    [
+        (
+            "chr7:117559590 G>A",
+            {
+                "chromosome": "7",
+                "start": 117559590,
+                "reference_allele": "G",
+                "alternate_allele": "A",
+            },
+        ),
+        ("chrM-10", {"chromosome": "MT", "start": 10}),
+        ("grch38:chr1:10", {"assembly": "GRCh38", "chromosome": "1", "start": 10}),
+        ("hg19 1-10", {"assembly": "hg19", "chromosome": "1", "start": 10}),
+        ("scv000000001.2", {"accession": "SCV000000001.2"}),
+        ("KEY", {"local_key": "KEY"}),
+    ],
+)
+def test_parse_find_query(query, expected):
+    assert batches.parse_find_query(query) == expected
+
+
+def test_check(share_dir, config_obj, capsys):
+    batches.import_(config_obj, "batch-1", str(DATA_DIR / "example.tsv"), ())
+    assert batches.check(config_obj, "batch-1") == []
+    assert "NO PROBLEMS FOUND" in capsys.readouterr().out
+
+
+def test_import_twice_writes_delta(share_dir, config_obj):
+    batches.import_(config_obj, "batch-1", str(DATA_DIR / "example.tsv"), ())
+    first = batches._load_latest_payload(config_obj.profile, "batch-1")
+    batches.import_(config_obj, "batch-1", str(DATA_DIR / "example.tsv"), ())
+    batch_dir = share_dir / "default" / "batch-1"
+    assert len(list(batch_dir.glob("payload.*.json"))) == 1
+    assert len(list(batch_dir.glob("payload-delta.*.json"))) == 1
+    assert batches._load_latest_payload(config_obj.profile, "batch-1") == first
+
+
+def test_import_normalize(share_dir, config_obj, tmp_path):
+    fasta_path = tmp_path / "genome.fa"
+    fasta_path.write_text(">1\nGATTACACACAGTTTTTTG\n")
+    (tmp_path / "genome.fa.fai").write_text("1\t19\t3\t19\t20\n")
+    data_path = tmp_path / "data.tsv"
+    data_path.write_text(
+        "ASSEMBLY\tCHROM\tPOS\tREF\tALT\tOMIM\tMOI\tCLIN_SIG\tKEY\tgene\n"
+        "GRCh37\t1\t9\tACA\tA\tOMIM:618278\tAutosomal recessive inheritance\t"
+        "not provided\tKEY\tGENE\n"
+    )
+    with pytest.raises(exceptions.ArgumentsError):
+        batches.import_(config_obj, "batch-1", str(data_path), (), normalize=True)
+    batches.import_(
+        config_obj,
+        "batch-1",
+        str(data_path),
+        (),
+        normalize=True,
+        references={"GRCh37": str(fasta_path)},
+    )
+    payload = batches._load_latest_payload(config_obj.profile, "batch-1")
+    assert payload.clinvar_submission
+    assert payload.clinvar_submission[0].variant_set
+    coords = payload.clinvar_submission[0].variant_set.variant[0].chromosome_coordinates
+    assert coords
+    assert (coords.start, coords.reference_allele, coords.alternate_allele) == (4, "TAC", "T")
+
+
+def test_import_liftover(share_dir, config_obj, tmp_path):
+    chain_path = tmp_path / "hg19ToHg38.over.chain"
+    chain_path.write_text("chain 1000 chr1 1000 + 100 200 chr1 2000 + 500 600 1\n100\n")
+    data_path = tmp_path / "data.tsv"
+    data_path.write_text(
+        "ASSEMBLY\tCHROM\tPOS\tREF\tALT\tOMIM\tMOI\tCLIN_SIG\tKEY\tgene\n"
+        "GRCh37\t1\t101\tA\tG\tOMIM:618278\t\tnot provided\tMAPPED\tGENE\n"
+        "GRCh37\t2\t101\tA\tG\tOMIM:618278\t\tnot provided\tUNMAPPED\tGENE\n"
+    )
+    with pytest.raises(exceptions.ArgumentsError):
+        batches.import_(config_obj, "batch-1", str(data_path), (), liftover_to="GRCh38")
+    batches.import_(
+        config_obj,
+        "batch-1",
+        str(data_path),
+        (),
+        liftover_to="GRCh38",
+        chain=str(chain_path),
+    )
+    payload = batches._load_latest_payload(config_obj.profile, "batch-1")
+    assert payload.clinvar_submission
+    assert [record.local_key for record in payload.clinvar_submission] == ["MAPPED"]
+    assert payload.clinvar_submission[0].variant_set
+    coords = payload.clinvar_submission[0].variant_set.variant[0].chromosome_coordinates
+    assert coords
+    assert (coords.assembly, coords.start) == (models.Assembly.GRCH38, 501)
+    unmapped = (tmp_path / "data.tsv.unmapped.tsv").read_text()
+    assert "UNMAPPED" in unmapped
+    assert "\tMAPPED\t" not in unmapped
+
+
+def test_import_export_compressed(share_dir, config_obj, tmp_path):
+    config_obj = attrs.evolve(config_obj, storage_compression="gzip")
+    batches.import_(config_obj, "batch-1", str(DATA_DIR / "example.tsv"), ())
+    batch_dir = share_dir / "default" / "batch-1"
+    assert len(list(batch_dir.glob("payload.*.json.gz"))) == 1
+    batches.reindex(config_obj)
+    output_path = tmp_path / "out.tsv"
+    batches.export_(config_obj, "batch-1", str(output_path))
+    assert "NHLRC2" in output_path.read_text()
+
+
+def test_update_metadata(share_dir, config_obj):
+    batches.import_(config_obj, "batch-1", str(DATA_DIR / "example.tsv"), ())
+    batches.update(config_obj, "batch-1", ("allele_origin=de novo",))
+    payload = batches._load_latest_payload(config_obj.profile, "batch-1")
+    (record,) = payload.clinvar_submission
+    assert record.observed_in[0].allele_origin == models.AlleleOrigin.DE_NOVO
+    assert payload.clinvar_submission_release_status == models.ReleaseStatus.PUBLIC
+
+    batch_index = batches._batch_index(config_obj.profile)
+    num_files = len(batch_index.list_files("batch-1", storage.PAYLOAD_KINDS))
+    batches.update(config_obj, "batch-1", ("allele_origin=de novo",))
+    assert len(batch_index.list_files("batch-1", storage.PAYLOAD_KINDS)) == num_files
+
+
+def test_incremental_submit_payload(share_dir, config_obj):
+    batches.import_(config_obj, "batch-1", str(DATA_DIR / "example.tsv"), ())
+    batch_index = batches._batch_index(config_obj.profile)
+    assert batches._accepted_payload(batch_index, "batch-1") is None
+
+    submitted = batches._load_latest_payload(config_obj.profile, "batch-1")
+    ((timestamp, _, _),) = batch_index.list_files("batch-1", ("payload",))
+    batch_index.add_submission("batch-1", timestamp, "SUB000001")
+    batch_index.add_status("batch-1", timestamp, "processing", "SUB000001")
+    assert batches._accepted_payload(batch_index, "batch-1") is None
+    batch_index.add_status("batch-1", timestamp, "processed", "SUB000001")
+    assert batches._accepted_payload(batch_index, "batch-1") == submitted
+
+    (record,) = submitted.clinvar_submission
+    accessioned = attrs.evolve(
+        record, clinvar_accession="SCV000000001", record_status=models.RecordStatus.UPDATE
+    )
+    added = attrs.evolve(record, local_key="KEY2", local_id="ID2")
+    batches._write_payload(
+        attrs.evolve(submitted, clinvar_submission=[accessioned, added]), config_obj, "batch-1"
+    )
+    current = batches._load_latest_payload(config_obj.profile, "batch-1")
+    assert batches._accepted_payload(batch_index, "batch-1") == submitted
+
+    incremental = batches._incremental_payload(current, submitted)
+    assert incremental.clinvar_submission == [added]
+
+    changed = attrs.evolve(accessioned, observed_in=[])
+    incremental = batches._incremental_payload(
+        attrs.evolve(current, clinvar_submission=[changed]), submitted
+    )
+    assert incremental.clinvar_submission == [changed]
+
+    incremental = batches._incremental_payload(
+        attrs.evolve(
+            current, clinvar_submission_release_status=models.ReleaseStatus.HOLD_UNTIL_PUBLISHED
+        ),
+        submitted,
+    )
+    assert incremental.clinvar_submission == [accessioned, added]
+
+    # a submission in the same second as the processed status of the previous one
+    later = storage.new_timestamp(timestamp)
+    batches._write_payload(current, config_obj, "batch-1")
+    batch_index.add_submission("batch-1", later, "SUB000002")
+    batch_index.add_status("batch-1", later, "processed", "SUB000001")
+    assert batches._accepted_payload(batch_index, "batch-1") == submitted
+
+
+def test_submit_after_metadata_change(share_dir, config_obj, fake_server):
+    batches.import_(config_obj, "batch-1", str(DATA_DIR / "example.tsv"), ())
+    assert batches.submit(config_obj, "batch-1") == "SUB000001"
+    batches.retrieve(config_obj, "batch-1")
+    assert batches.submit(config_obj, "batch-1") is None
+
+    batches.update(config_obj, "batch-1", ("release_status=hold until published",))
+    assert batches.submit(config_obj, "batch-1") == "SUB000002"
+    content = fake_server.state.submissions["SUB000002"].content
+    assert content["clinvarSubmissionReleaseStatus"] == "hold until published"
+    (record,) = content["clinvarSubmission"]
+    assert record["recordStatus"] == "update"
+
+
+def test_submit_retrieve_all(share_dir, config_obj, fake_server, capsys):
+    for name in ("batch-1", "batch-2", "other"):
+        batches.import_(config_obj, name, str(DATA_DIR / "example.tsv"), ())
+    names = batches.select_batches(config_obj, "batch-*", ["unsubmitted"])
+    assert names == ["batch-1", "batch-2"]
+
+    results = batches.submit_all(config_obj, names, workers=2)
+    assert [(r.name, r.ok) for r in results] == [("batch-1", True), ("batch-2", True)]
+    assert {r.message for r in results} == {"SUB000001", "SUB000002"}
+    assert batches.select_batches(config_obj, states=["pending"]) == names
+
+    results = batches.retrieve_all(config_obj, names + ["missing"], workers=2)
+    assert [(r.name, r.ok, r.message) for r in results[:2]] == [
+        ("batch-1", True, "processed"),
+        ("batch-2", True, "processed"),
+    ]
+    assert not results[2].ok
+    assert batches.select_batches(config_obj, states=["processed"]) == names
+    assert (
+        batches._load_latest_payload(config_obj.profile, "batch-1")
+        .clinvar_submission[0]
+        .clinvar_accession.startswith("SCV")
+    )
+
+    batches.print_results(results)
+    out = capsys.readouterr().out
+    assert "FAILED" in out
+    assert "processed" in out
+
+
+def test_import_uses_registered_accessions(share_dir, config_obj, fake_server):
+    batches.import_(config_obj, "batch-1", str(DATA_DIR / "example.tsv"), ())
+    batches.submit(config_obj, "batch-1")
+    batches.retrieve(config_obj, "batch-1")
+    (record,) = batches._load_latest_payload(config_obj.profile, "batch-1").clinvar_submission
+    assert record.clinvar_accession
+
+    batches.import_(config_obj, "batch-2", str(DATA_DIR / "example.tsv"), ())
+    (imported,) = batches._load_latest_payload(config_obj.profile, "batch-2").clinvar_submission
+    assert imported.clinvar_accession == record.clinvar_accession
+    assert imported.record_status == models.RecordStatus.UPDATE
+
+    batches.reindex(config_obj)
+    batch_index = batches._batch_index(config_obj.profile)
+    assert batch_index.lookup_accessions(["KEY"]) == {"KEY": record.clinvar_accession}
+
+
+def test_reindex_keeps_registered_accessions(share_dir, config_obj, fake_server, tmp_path):
+    data_path = tmp_path / "data.tsv"
+    header, row = (DATA_DIR / "example.tsv").read_text().splitlines()[:2]
+    data_path.write_text(
+        "\n".join([header] + [row.replace("\tKEY\t", f"\tKEY{i}\t") for i in range(10)]) + "\n"
+    )
+    keys = [f"KEY{i}" for i in range(10)]
+    fake_server.state.config = attrs.evolve(fake_server.state.config, record_error_rate=0.5)
+    fake_server.state.rng = random.Random(0)
+    batches.import_(config_obj, "batch-1", str(data_path), ())
+    batches.submit(config_obj, "batch-1")
+    assert batches.retrieve(config_obj, "batch-1") == "error"
+    batch_index = batches._batch_index(config_obj.profile)
+    registered = batch_index.lookup_accessions(keys)
+    assert 0 < len(registered) < len(keys)
+
+    batches.reindex(config_obj)
+    assert batch_index.lookup_accessions(keys) == registered
+
+
+def test_record_store_batch(share_dir, config_obj, tmp_path):
+    config_obj = attrs.evolve(config_obj, storage_format="jsonl")
+    batches.import_(config_obj, "batch-1", str(DATA_DIR / "example.tsv"), ())
+    batch_dir = share_dir / "default" / "batch-1"
+    assert list(batch_dir.glob("payload*.json")) == []
+    assert (batch_dir / "records" / "records.jsonl").exists()
+    payload = batches._load_latest_payload(config_obj.profile, "batch-1")
+    (record,) = payload.clinvar_submission
+    batches._write_payload(
+        attrs.evolve(
+            payload, clinvar_submission=[attrs.evolve(record, clinvar_accession="SCV000000001")]
+        ),
+        config_obj,
+        "batch-1",
+        previous=payload,
+    )
+    assert len((batch_dir / "records" / "records.jsonl").read_text().splitlines()) == 2
+
+    batches.reindex(config_obj)
+    (info,) = batches._batch_index(config_obj.profile).list_batch_infos()
+    assert info.record_count == 1
+    output_path = tmp_path / "out.tsv"
+    batches.export_(config_obj, "batch-1", str(output_path))
+    assert "SCV000000001" in output_path.read_text()
+
+
+def test_record_store_reimport(share_dir, config_obj, tmp_path):
+    config_obj = attrs.evolve(config_obj, storage_format="jsonl")
+    batches.import_(config_obj, "batch-1", str(DATA_DIR / "example.tsv"), ())
+    payload = batches._load_latest_payload(config_obj.profile, "batch-1")
+    (record,) = payload.clinvar_submission
+    batches._write_payload(
+        attrs.evolve(
+            payload, clinvar_submission=[attrs.evolve(record, clinvar_accession="SCV000000001")]
+        ),
+        config_obj,
+        "batch-1",
+        previous=payload,
+    )
+
+    batches.import_(config_obj, "batch-1", str(DATA_DIR / "example.tsv"), ())
+    payload = batches._load_latest_payload(config_obj.profile, "batch-1")
+    assert [(r.local_key, r.clinvar_accession) for r in payload.clinvar_submission] == [
+        ("KEY", "SCV000000001")
+    ]
+
+    other_path = tmp_path / "other.tsv"
+    other_path.write_text(
+        (DATA_DIR / "example.tsv")
+        .read_text()
+        .replace("not provided\tKEY\t", "not provided\tKEY2\t")
+    )
+    batches.import_(config_obj, "batch-1", str(other_path), ())
+    payload = batches._load_latest_payload(config_obj.profile, "batch-1")
+    assert [(r.local_key, r.clinvar_accession) for r in payload.clinvar_submission] == [
+        ("KEY", "SCV000000001"),
+        ("KEY2", None),
+    ]
+
+
+def test_retrieve_store_response_changes(share_dir, config_obj, fake_server):
+    batches.import_(config_obj, "batch-1", str(DATA_DIR / "example.tsv"), ())
+    payload = batches._load_latest_payload(config_obj.profile, "batch-1")
+    client_config = client.Config(auth_token=config_obj.auth_token)
+    created = client.submit_data(payload, client_config)
+    status_result = client.retrieve_status(created.id, client_config, spool_dir=share_dir)
+
+    changes = batches._retrieve_store_response(config_obj, "batch-1", status_result)
+    assert changes == batches.RetrieveChanges(
+        matched=1, unmatched=0, accession=1, status=1, error=0, records=1
+    )
+    batch_index = batches._batch_index(config_obj.profile)
+    num_files = len(batch_index.list_files("batch-1", storage.PAYLOAD_KINDS))
+    changes = batches._retrieve_store_response(config_obj, "batch-1", status_result)
+    assert changes.matched == 1
+    assert changes.records == 0
+    assert len(batch_index.list_files("batch-1", storage.PAYLOAD_KINDS)) == num_files
+
+
+def test_collect_all(share_dir, config_obj):
+    for _ in range(3):
+        batches.import_(
+            config_obj, "batch-1", str(DATA_DIR / "example.tsv"), ("allele_origin=somatic",)
+        )
+        batches.update(config_obj, "batch-1", ("allele_origin=germline",))
+    results, reclaimed = batches.collect_all(
+        config_obj, ["batch-1", "missing"], retention.RetentionPolicy(keep_last=1)
+    )
+    assert [(result.name, result.ok) for result in results] == [
+        ("batch-1", True),
+        ("missing", False),
+    ]
+    assert reclaimed > 0
+    assert len(list((share_dir / "default" / "batch-1").glob("payload*.json"))) == 1
+    payload = batches._load_latest_payload(config_obj.profile, "batch-1")
+    assert (
+        payload.clinvar_submission[0].observed_in[0].allele_origin == models.AlleleOrigin.GERMLINE
+    )
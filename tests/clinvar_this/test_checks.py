@@ -0,0 +1,90 @@
+import attrs
+
+from clinvar_api import models
+from clinvar_this import checks
+from clinvar_this.io.fasta import IndexedFasta
+
+
+def rules(findings):
+    return [(finding.local_key, finding.rule) for finding in findings]
+
+
+def test_check_payload_valid(make_record, make_container):
+    assert checks.check_payload(make_container(make_record("a"), make_record("b"))) == []
+
+
+def test_check_records(make_record):
+    record = make_record("a")
+    findings = checks.check_records(
+        [
+            make_record("stop", stop=101),
+            make_record("alleles", ref="A", alt="A"),
+            make_record("invalid", ref="AX", stop=101),
+            attrs.evolve(record, local_key="update", record_status=models.RecordStatus.UPDATE),
+            attrs.evolve(
+                record,
+                local_key="condition",
+                condition_set=models.SubmissionConditionSet(condition=[]),
+            ),
+            attrs.evolve(record, local_key="variant", variant_set=None),
+            attrs.evolve(record, local_key="observed", observed_in=[]),
+        ]
+    )
+    assert rules(findings) == [
+        ("stop", "coordinates"),
+        ("alleles", "alleles"),
+        ("invalid", "alleles"),
+        ("update", "record_status"),
+        ("condition", "schema"),
+        ("condition", "schema"),
+        ("condition", "condition"),
+        ("variant", "schema"),
+        ("variant", "variant"),
+        ("observed", "schema"),
+        ("observed", "observed_in"),
+    ]
+    assert all(finding.severity == checks.ERROR for finding in findings)
+    assert findings[-4].message == "record: is not valid under any of the given schemas"
+
+
+def test_check_container(make_record, make_container):
+    container = attrs.evolve(
+        make_container(make_record("a"), make_record("a")), assertion_criteria=None
+    )
+    assert rules(checks.check_container(container)) == [
+        (None, "assertion_criteria"),
+        ("a", "local_key"),
+    ]
+    assert rules(checks.check_container(make_container())) == [(None, "container")]
+
+
+def test_check_payload_workers(monkeypatch, make_record, make_container):
+    monkeypatch.setattr(checks, "CHUNK_SIZE", 2)
+    records = [make_record(str(i), stop=100 + i % 2) for i in range(5)]
+    findings = checks.check_payload(make_container(*records), workers=2)
+    assert rules(findings) == [("1", "coordinates"), ("3", "coordinates")]
+    assert findings == checks.check_payload(make_container(*records))
+
+
+def test_check_reference(tmp_path, make_record, make_container):
+    path = tmp_path / "genome.fa"
+    path.write_text(">1\nACGTACGTAC\nGGGGG\n")
+    path.with_name("genome.fa.fai").write_text("1\t15\t3\t10\t11\n")
+    records = [
+        make_record("ok", start=10, stop=11, ref="CG"),
+        make_record("wrong", start=2, stop=2, ref="G", alt="T"),
+        make_record("past", start=20, stop=20, ref="A"),
+        attrs.evolve(make_record("other"), variant_set=None),
+    ]
+    with IndexedFasta(path) as fasta:
+        findings = checks.check_payload(make_container(*records), references={"GRCh37": fasta})
+        assert (
+            checks.check_payload(make_container(*records[:1]), references={"GRCh38": fasta}) == []
+        )
+    assert rules(findings) == [
+        ("other", "schema"),
+        ("other", "variant"),
+        ("wrong", "reference"),
+        ("past", "reference"),
+    ]
+    assert findings[2].message == "reference allele G does not match GRCh37 1:2 C"
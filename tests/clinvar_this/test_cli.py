@@ -2,8 +2,9 @@ from unittest.mock import MagicMock, patch
 
 from click.testing import CliRunner
 
+from clinvar_api import instrumentation
 import clinvar_this  # noqa
-from clinvar_this import cli, config, exceptions
+from clinvar_this import batches, checks, cli, config, exceptions, merge, retention
 
 
 def test_call_main_help():
@@ -69,3 +70,239 @@ def test_call_config_set_fail_invalid_name():
         result = runner.invoke(cli.cli, ["config", "set", "xxx", "xxx"])
     # assert b"Invalid value" in result.stderr_bytes
     assert result.exit_code != 0
+
+
+def test_call_batch_submit_compress():
+    mock_submit = MagicMock()
+    with patch(
+        "clinvar_this.cli.load_config",
+        MagicMock(return_value=config.Config(profile="default", auth_token="fake")),
+    ), patch("clinvar_this.cli.batches.submit", mock_submit):
+        runner = CliRunner()
+        result = runner.invoke(
+            cli.cli, ["batch", "submit", "--compress", "--compression-level", "9", "NAME"]
+        )
+    assert result.exit_code == 0
+    mock_submit.assert_called_once_with(
+        config.Config(profile="default", auth_token="fake"),
+        "NAME",
+        use_testing=False,
+        dry_run=False,
+        full=False,
+        compress_requests=True,
+        compression_level=9,
+        trace_dir=None,
+        max_retries=0,
+        hooks=[],
+    )
+
+
+def test_call_batch_retrieve_stats():
+    def fake_retrieve(*args, hooks, **kwargs):
+        hooks[0](
+            instrumentation.RequestRecord(
+                endpoint="status",
+                method="GET",
+                url="https://example.com/",
+                attempt=0,
+                request_bytes=0,
+                response_bytes=10,
+                ttfb=0.1,
+                total=0.1,
+                status_code=200,
+            )
+        )
+
+    with patch(
+        "clinvar_this.cli.load_config",
+        MagicMock(return_value=config.Config(profile="default", auth_token="fake")),
+    ), patch("clinvar_this.cli.batches.retrieve", fake_retrieve):
+        runner = CliRunner()
+        result = runner.invoke(cli.cli, ["--stats", "batch", "retrieve", "NAME"])
+    assert result.exit_code == 0
+    assert "status" in result.output
+    assert "200: 1" in result.output
+
+
+def test_call_batch_import_merge_options():
+    mock_import = MagicMock()
+    with patch(
+        "clinvar_this.cli.load_config",
+        MagicMock(return_value=config.Config(profile="default", auth_token="fake")),
+    ), patch("clinvar_this.cli.batches.import_", mock_import):
+        runner = CliRunner()
+        result = runner.invoke(
+            cli.cli,
+            [
+                "batch",
+                "import",
+                "--name",
+                "NAME",
+                "--delete-missing",
+                "--field-policy",
+                "clinvar_accession=overwrite",
+                "data.tsv",
+            ],
+        )
+        assert result.exit_code == 0
+        assert mock_import.call_args.args[4] == merge.MergeOptions(
+            delete_missing=True,
+            field_policies={"clinvar_accession": merge.FieldPolicy.OVERWRITE},
+        )
+        result = runner.invoke(
+            cli.cli, ["batch", "import", "--field-policy", "clinvar_accession", "data.tsv"]
+        )
+        assert result.exit_code != 0
+
+
+def test_call_batch_import_normalize():
+    mock_import = MagicMock()
+    with patch(
+        "clinvar_this.cli.load_config",
+        MagicMock(return_value=config.Config(profile="default", auth_token="fake")),
+    ), patch("clinvar_this.cli.batches.import_", mock_import):
+        runner = CliRunner()
+        result = runner.invoke(
+            cli.cli,
+            ["batch", "import", "--normalize", "--reference", "GRCh37=hs37.fa", "data.tsv"],
+        )
+        assert result.exit_code == 0
+        assert mock_import.call_args.kwargs["normalize"] is True
+        assert mock_import.call_args.kwargs["references"] == {"GRCh37": "hs37.fa"}
+        result = runner.invoke(cli.cli, ["batch", "import", "--normalize", "data.tsv"])
+        assert result.exit_code == 2
+
+
+def test_call_batch_retrieve_all():
+    mock_select = MagicMock(return_value=["batch-1"])
+    mock_retrieve_all = MagicMock(
+        return_value=[batches.BatchResult(name="batch-1", ok=False, message="failed")]
+    )
+    with patch(
+        "clinvar_this.cli.load_config",
+        MagicMock(return_value=config.Config(profile="default", auth_token="fake")),
+    ), patch("clinvar_this.cli.batches.select_batches", mock_select), patch(
+        "clinvar_this.cli.batches.retrieve_all", mock_retrieve_all
+    ):
+        runner = CliRunner()
+        result = runner.invoke(cli.cli, ["batch", "retrieve"])
+        assert result.exit_code != 0
+        result = runner.invoke(cli.cli, ["batch", "retrieve", "--all", "--pattern", "batch-*"])
+    assert result.exit_code == 1
+    assert "batch-1" in result.output
+    mock_select.assert_called_once_with(
+        config.Config(profile="default", auth_token="fake"), "batch-*", ("pending",)
+    )
+    assert mock_retrieve_all.call_args.args[1] == ["batch-1"]
+    assert mock_retrieve_all.call_args.kwargs["workers"] == 4
+
+
+def test_call_batch_gc():
+    mock_select = MagicMock(return_value=["batch-1"])
+    mock_collect_all = MagicMock(
+        return_value=([batches.BatchResult(name="batch-1", ok=True, message="10 bytes")], 10)
+    )
+    mock_prune = MagicMock(return_value=5)
+    with patch(
+        "clinvar_this.cli.load_config",
+        MagicMock(return_value=config.Config(profile="default", auth_token="fake")),
+    ), patch("clinvar_this.cli.batches.select_batches", mock_select), patch(
+        "clinvar_this.cli.batches.collect_all", mock_collect_all
+    ), patch(
+        "clinvar_this.cli.prune_backups", mock_prune
+    ):
+        runner = CliRunner()
+        result = runner.invoke(cli.cli, ["batch", "gc", "--keep-last", "2", "--dry-run"])
+    assert result.exit_code == 0
+    assert "Would reclaim 15 bytes" in result.output
+    assert mock_collect_all.call_args.args[1] == ["batch-1"]
+    assert mock_collect_all.call_args.args[2] == retention.RetentionPolicy(keep_last=2)
+    mock_prune.assert_called_once_with(5, dry_run=True)
+
+
+def test_call_find():
+    mock_find = MagicMock()
+    with patch(
+        "clinvar_this.cli.load_config",
+        MagicMock(return_value=config.Config(profile="default", auth_token="fake")),
+    ), patch("clinvar_this.cli.batches.find", mock_find):
+        runner = CliRunner()
+        result = runner.invoke(cli.cli, ["find", "chr7:117559590 G>A"])
+    assert result.exit_code == 0
+    mock_find.assert_called_once_with(
+        config.Config(profile="default", auth_token="fake"), "chr7:117559590 G>A"
+    )
+
+
+def test_call_batch_check():
+    mock_check = MagicMock(
+        return_value=[checks.Finding(checks.ERROR, "schema", "invalid", local_key="KEY")]
+    )
+    with patch(
+        "clinvar_this.cli.load_config",
+        MagicMock(return_value=config.Config(profile="default", auth_token="fake")),
+    ), patch("clinvar_this.cli.batches.check", mock_check):
+        runner = CliRunner()
+        result = runner.invoke(
+            cli.cli,
+            ["batch", "check", "--workers", "2", "--reference", "GRCh37=hs37.fa", "batch-1"],
+        )
+        assert result.exit_code == 1
+        mock_check.assert_called_once_with(
+            config.Config(profile="default", auth_token="fake"),
+            "batch-1",
+            workers=2,
+            references={"GRCh37": "hs37.fa"},
+        )
+        result = runner.invoke(cli.cli, ["batch", "check", "--reference", "hs37.fa", "batch-1"])
+        assert result.exit_code == 2
+
+
+def test_call_batch_import_liftover():
+    mock_import = MagicMock()
+    with patch(
+        "clinvar_this.cli.load_config",
+        MagicMock(return_value=config.Config(profile="default", auth_token="fake")),
+    ), patch("clinvar_this.cli.batches.import_", mock_import):
+        runner = CliRunner()
+        result = runner.invoke(
+            cli.cli,
+            [
+                "batch",
+                "import",
+                "--liftover-to",
+                "GRCh38",
+                "--chain",
+                "hg19ToHg38.over.chain.gz",
+                "--unmapped",
+                "unmapped.tsv",
+                "data.tsv",
+            ],
+        )
+        assert result.exit_code == 0
+        assert mock_import.call_args.kwargs["liftover_to"] == "GRCh38"
+        assert mock_import.call_args.kwargs["chain"] == "hg19ToHg38.over.chain.gz"
+        assert mock_import.call_args.kwargs["unmapped_path"] == "unmapped.tsv"
+        result = runner.invoke(cli.cli, ["batch", "import", "--liftover-to", "GRCh38", "data.tsv"])
+        assert result.exit_code == 2
+        result = runner.invoke(
+            cli.cli,
+            ["batch", "import", "--liftover-to", "NCBI36", "--chain", "x.chain", "data.tsv"],
+        )
+        assert result.exit_code == 2
+        result = runner.invoke(
+            cli.cli,
+            [
+                "batch",
+                "import",
+                "--liftover-to",
+                "GRCh38",
+                "--liftover-from",
+                "NCBI36",
+                "--chain",
+                "hg18ToHg38.over.chain.gz",
+                "data.tsv",
+            ],
+        )
+        assert result.exit_code == 0
+        assert mock_import.call_args.kwargs["liftover_from"] == "NCBI36"
@@ -12,9 +12,17 @@ auth_token = "MYTOKEN"
 
 def test_config():
     short_config = config.Config(profile="default", auth_token="123")
-    assert str(short_config) == "Config(profile='default', auth_token='***')"
+    assert str(short_config) == (
+        "Config(profile='default', auth_token='***', storage_compression='none', "
+        "storage_format='json', "
+        "lock_timeout=60.0)"
+    )
     long_config = config.Config(profile="default", auth_token="1234567890")
-    assert str(long_config) == "Config(profile='default', auth_token='12345*****')"
+    assert str(long_config) == (
+        "Config(profile='default', auth_token='12345*****', storage_compression='none', "
+        "storage_format='json', "
+        "lock_timeout=60.0)"
+    )
 
 
 def test_load_config_success(fs):
@@ -28,7 +36,11 @@ def test_load_config_success(fs):
         )
         config_obj = config.load_config(profile="default")
 
-    assert str(config_obj) == "Config(profile='default', auth_token='MYTOK**')"
+    assert str(config_obj) == (
+        "Config(profile='default', auth_token='MYTOK**', storage_compression='none', "
+        "storage_format='json', "
+        "lock_timeout=60.0)"
+    )
 
 
 def test_load_config_fail_invalid_toml(fs):
@@ -74,3 +86,56 @@ def test_save_config_overwrite(fs):
             config_str = inputf.read()
 
     assert config_str == CONFIG_CONTENT.replace("MYTOKEN", "xxx")
+
+
+def test_prune_backups(fs):
+    fake_pathlib = FakePathlibModule(fs)
+
+    with patch("clinvar_this.config.pathlib", fake_pathlib):
+        base_path = config.pathlib.Path.home() / ".config" / "clinvar-this"
+        for token in ("a", "b", "c", "d"):
+            config.save_config(config=config.Config("default", token))
+        assert len(list(base_path.glob("config.toml~*"))) == 3
+        assert config.prune_backups(1, dry_run=True) > 0
+        assert len(list(base_path.glob("config.toml~*"))) == 3
+        assert config.prune_backups(1) > 0
+        assert len(list(base_path.glob("config.toml~*"))) == 1
+        assert config.prune_backups(1) == 0
+
+
+def test_load_config_storage_compression(fs):
+    fake_pathlib = FakePathlibModule(fs)
+
+    with patch("clinvar_this.config.pathlib", fake_pathlib):
+        base_path = config.pathlib.Path.home() / ".config" / "clinvar-this"
+        fs.create_file(
+            (base_path / "config.toml"),
+            contents=CONFIG_CONTENT + 'storage_compression = "gzip"\n',
+            create_missing_dirs=True,
+        )
+        config_obj = config.load_config(profile="default")
+
+    assert config_obj.storage_compression == "gzip"
+
+
+def test_load_config_fail_invalid_value(fs):
+    fake_pathlib = FakePathlibModule(fs)
+
+    with patch("clinvar_this.config.pathlib", fake_pathlib):
+        base_path = config.pathlib.Path.home() / ".config" / "clinvar-this"
+        fs.create_file(
+            (base_path / "config.toml"),
+            contents=CONFIG_CONTENT + 'storage_compression = "rar"\n',
+            create_missing_dirs=True,
+        )
+        with pytest.raises(exceptions.ConfigException):
+            config.load_config(profile="default")
+
+
+def test_set_value():
+    config_obj = config.Config(profile="default", auth_token="x")
+    assert config.set_value(config_obj, "storage_compression", "gzip").storage_compression == "gzip"
+    with pytest.raises(exceptions.ConfigException):
+        config.set_value(config_obj, "storage_compression", "bzip2")
+    with pytest.raises(exceptions.ConfigException):
+        config.set_value(config_obj, "profile", "other")
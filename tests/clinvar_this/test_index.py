@@ -0,0 +1,226 @@
+import json
+
+import pytest
+
+from clinvar_this import index
+
+
+def test_batch_index_maintained(tmp_path):
+    batch_index = index.BatchIndex(tmp_path)
+    assert (tmp_path / index.INDEX_FILENAME).exists()
+    assert batch_index.list_batches() == []
+
+    batch_index.add_file(
+        "2022-12-01-000", "payload", "20221201120000", "payload.20221201120000.json"
+    )
+    batch_index.add_file(
+        "2022-12-01-000", "payload", "20221201130000", "payload.20221201130000.json"
+    )
+    batch_index.add_batch("2022-12-02-000")
+    batch_index.add_submission("2022-12-01-000", "20221201140000", "SUB000001")
+    batch_index.add_status("2022-12-01-000", "20221201150000", "processing", "SUB000001")
+    batch_index.add_status("2022-12-01-000", "20221201160000", "processed", "SUB000001")
+
+    assert batch_index.list_batches() == ["2022-12-01-000", "2022-12-02-000"]
+    assert batch_index.list_batches(prefix="2022-12-02") == ["2022-12-02-000"]
+    assert batch_index.has_batch("2022-12-02-000")
+    assert not batch_index.has_batch("2022-12-03-000")
+    assert batch_index.latest_file("2022-12-01-000", "payload") == (
+        tmp_path / "2022-12-01-000" / "payload.20221201130000.json"
+    )
+    assert batch_index.latest_file("2022-12-02-000", "payload") is None
+    info_1, info_2 = batch_index.list_batch_infos()
+    assert (info_1.submission_id, info_1.status) == ("SUB000001", "processed")
+    assert (info_2.submission_id, info_2.status) == (None, None)
+
+
+def test_batch_index_rebuild(tmp_path):
+    batch_dir = tmp_path / "2022-12-01-000"
+    batch_dir.mkdir()
+    (batch_dir / "payload.20221201120000.json").write_text("{}")
+    (batch_dir / "submission-response.20221201130000.json").write_text('{"id": "SUB000001"}')
+    (batch_dir / "retrieve-response.20221201140000.json").write_text(
+        json.dumps({"status": {"actions": [{"status": "processed"}]}, "summaries": {}})
+    )
+    (batch_dir / "notes.txt").write_text("ignored")
+    (tmp_path / "2022-12-02-000").mkdir()
+
+    batch_index = index.BatchIndex(tmp_path)
+
+    assert batch_index.list_batches() == ["2022-12-01-000", "2022-12-02-000"]
+    assert batch_index.latest_file("2022-12-01-000", "payload") == (
+        batch_dir / "payload.20221201120000.json"
+    )
+    (info,) = batch_index.list_batch_infos(names=["2022-12-01-000"])
+    assert (info.submission_id, info.status) == ("SUB000001", "processed")
+    # responses without submission ID belong to the latest submission before them
+    assert batch_index.list_statuses("2022-12-01-000") == [
+        ("20221201140000", "SUB000001", "processed")
+    ]
+
+
+def test_batch_index_rebuild_on_schema_change(tmp_path, monkeypatch):
+    index.BatchIndex(tmp_path)
+    (tmp_path / "2022-12-01-000").mkdir()
+    monkeypatch.setattr(index, "SCHEMA_VERSION", index.SCHEMA_VERSION + 1)
+    assert index.BatchIndex(tmp_path).list_batches() == ["2022-12-01-000"]
+
+
+def test_batch_index_infos(tmp_path):
+    batch_index = index.BatchIndex(tmp_path)
+    batch_index.add_file("b", "payload", "20221201120000", "payload.20221201120000.json")
+    batch_index.set_record_counts("b", 10, 2)
+    batch_index.add_file("a", "payload", "20221202120000", "payload.20221202120000.json")
+    batch_index.add_submission("a", "20221202130000", "SUB1")
+    batch_index.add_status("a", "20221202140000", "processed", "SUB1")
+    batch_index.add_submission("a", "20221202150000", "SUB2")
+
+    infos = batch_index.list_batch_infos()
+    assert [info.name for info in infos] == ["a", "b"]
+    assert infos[0] == index.BatchInfo(
+        name="a",
+        state="pending",
+        record_count=None,
+        error_count=None,
+        submission_id="SUB2",
+        status="processed",
+        created="20221202120000",
+        modified="20221202120000",
+    )
+    assert infos[1].state == "unsubmitted"
+    assert infos[1].record_count == 10
+    assert infos[1].error_count == 2
+
+    batch_index.add_status("a", "20221202160000", "error", "SUB2")
+    assert [info.name for info in batch_index.list_batch_infos(states=["error"])] == ["a"]
+    assert [info.name for info in batch_index.list_batch_infos(sort_by="records")] == ["a", "b"]
+    assert [
+        info.name for info in batch_index.list_batch_infos(sort_by="created", reverse=True)
+    ] == ["a", "b"]
+    with pytest.raises(ValueError):
+        batch_index.list_batch_infos(sort_by="size")
+
+
+def test_batch_index_infos_resubmitted_same_second(tmp_path):
+    batch_index = index.BatchIndex(tmp_path)
+    batch_index.add_batch("a")
+    batch_index.add_submission("a", "20221202130000", "SUB1")
+    batch_index.add_status("a", "20221202140000", "processed", "SUB1")
+    batch_index.add_submission("a", "20221202140000", "SUB2")
+
+    assert [info.name for info in batch_index.list_batch_infos(states=["pending"])] == ["a"]
+    batch_index.add_status("a", "20221202140001", "processed", "SUB2")
+    assert [info.name for info in batch_index.list_batch_infos(states=["processed"])] == ["a"]
+
+
+def test_batch_index_find_variants(tmp_path):
+    batch_index = index.BatchIndex(tmp_path)
+    batch_index.set_variants(
+        "batch-1",
+        "20221201120000",
+        [
+            ("KEY1", 0, "GRCh37", "7", 117559590, 117559590, "G", "A", "SCV000000001"),
+            ("KEY2", 0, "GRCh37", "7", 117559590, 117559590, "G", "T", None),
+            ("KEY2", 1, "GRCh37", "7", 117559600, 117559600, "C", "T", None),
+        ],
+    )
+    batch_index.set_variants(
+        "batch-2",
+        "20221202120000",
+        [
+            ("KEY1", 0, "GRCh37", "1", 100, 100, "C", "T", None),
+            ("KEY3", 0, "GRCh38", "7", 117559590, 117559590, "G", "A", None),
+        ],
+    )
+    batch_index.add_status("batch-1", "20221201160000", "processed", "SUB1")
+
+    (info,) = batch_index.find_variants(
+        assembly="GRCh37",
+        chromosome="7",
+        start=117559590,
+        reference_allele="G",
+        alternate_allele="A",
+    )
+    assert info.batch == "batch-1"
+    assert info.accession == "SCV000000001"
+    assert info.status == "processed"
+    assert len(batch_index.find_variants(chromosome="7", start=117559590)) == 3
+    assert len(batch_index.find_variants(assembly="GRCh37", chromosome="7", start=117559590)) == 2
+    (info2,) = batch_index.find_variants(chromosome="7", start=117559600)
+    assert (info2.local_key, info2.variant) == ("KEY2", 1)
+    assert [info.batch for info in batch_index.find_variants(local_key="KEY1")] == [
+        "batch-2",
+        "batch-1",
+    ]
+    assert batch_index.find_variants(accession="SCV000000001") == [info]
+
+    batch_index.set_variants("batch-1", "20221203120000", [])
+    assert batch_index.find_variants(accession="SCV000000001") == []
+
+
+def test_batch_index_accessions(tmp_path):
+    batch_index = index.BatchIndex(tmp_path)
+    assert batch_index.lookup_accessions(["KEY1"]) == {}
+    batch_index.add_accessions("batch-1", [("KEY1", "SCV000000001"), ("KEY2", "SCV000000002")])
+    batch_index.add_accessions("batch-2", [("KEY1", "SCV000000003")])
+    assert batch_index.lookup_accessions(["KEY1", "KEY3"]) == {"KEY1": "SCV000000003"}
+    keys = [f"KEY{i}" for i in range(1200)]
+    assert batch_index.lookup_accessions(keys) == {
+        "KEY1": "SCV000000003",
+        "KEY2": "SCV000000002",
+    }
+
+
+def write_processed_response(batch_dir, timestamp, local_key, accession):
+    """Write a processed retrieve response with a summary file to ``batch_dir``."""
+    (batch_dir / "summaries").mkdir(parents=True)
+    summary = {
+        "submissionName": "SUB000001",
+        "submissionDate": "2022-12-01",
+        "batchProcessingStatus": "Success",
+        "batchReleaseStatus": "Not released",
+        "totalCount": 1,
+        "totalErrors": 0,
+        "totalSuccess": 1,
+        "totalPublic": 0,
+        "submissions": [
+            {
+                "identifiers": {
+                    "clinvarLocalKey": local_key,
+                    "localKey": local_key,
+                    "clinvarAccession": accession,
+                },
+                "processingStatus": "Success",
+            }
+        ],
+    }
+    (batch_dir / "summaries" / f"{accession}.json").write_text(json.dumps(summary))
+    (batch_dir / f"retrieve-response.{timestamp}.json").write_text(
+        json.dumps(
+            {
+                "status": {"actions": [{"status": "processed"}]},
+                "summaries": {"https://example.com/": f"summaries/{accession}.json"},
+            }
+        )
+    )
+
+
+def test_batch_index_rebuild_accessions(tmp_path):
+    # the batch that is first in directory order has the latest response
+    write_processed_response(tmp_path / "a", "20221202120000", "KEY1", "SCV000000002")
+    write_processed_response(tmp_path / "b", "20221201120000", "KEY1", "SCV000000001")
+    (tmp_path / "c").mkdir()
+    (tmp_path / "c" / "payload.20221203120000.json").write_text(
+        json.dumps(
+            {
+                "clinvar_submission": [
+                    {"local_key": "KEY1", "clinvar_accession": "SCV000000003"},
+                    {"local_key": "KEY2", "clinvar_accession": "SCV000000004"},
+                ]
+            }
+        )
+    )
+
+    batch_index = index.BatchIndex(tmp_path)
+    batch_index.rebuild()
+    assert batch_index.lookup_accessions(["KEY1", "KEY2"]) == {"KEY1": "SCV000000002"}
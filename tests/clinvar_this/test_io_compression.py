@@ -0,0 +1,21 @@
+import pytest
+
+from clinvar_this import exceptions
+from clinvar_this.io import compression
+
+
+@pytest.mark.parametrize(
+    "name,magic", [("none", b"{"), ("gzip", b"\x1f\x8b"), ("zstd", b"\x28\xb5\x2f\xfd")]
+)
+def test_open_text_roundtrip(tmp_path, name, magic):
+    path = tmp_path / f"file.json{compression.suffix_for(name)}"
+    with compression.open_text(path, "wt") as outputf:
+        outputf.write('{"key": "välue"}')
+    with compression.open_text(path) as inputf:
+        assert inputf.read() == '{"key": "välue"}'
+    assert path.read_bytes().startswith(magic)
+
+
+def test_suffix_for_invalid():
+    with pytest.raises(exceptions.ConfigException):
+        compression.suffix_for("bzip2")
@@ -0,0 +1,52 @@
+import pytest
+
+from clinvar_this import exceptions
+from clinvar_this.io.fasta import IndexedFasta, read_fai
+
+#: Contigs of the test genome, written with 10 bases per line.
+CONTIGS = {"chr1": "ACGTACGTAC" "GGGGGCCCCC" "TTTTT", "chrM": "acgtn"}
+
+
+@pytest.fixture
+def fasta_path(tmp_path):
+    path = tmp_path / "genome.fa"
+    fai_lines = []
+    with path.open("wb") as outputf:
+        for name, seq in CONTIGS.items():
+            outputf.write(f">{name}\n".encode())
+            offset = outputf.tell()
+            for i in range(0, len(seq), 10):
+                outputf.write(seq[i : i + 10].encode() + b"\n")
+            fai_lines.append(f"{name}\t{len(seq)}\t{offset}\t10\t11\n")
+    path.with_name("genome.fa.fai").write_text("".join(fai_lines))
+    return path
+
+
+def test_read_fai(fasta_path, tmp_path):
+    index = read_fai(fasta_path.with_name("genome.fa.fai"))
+    assert list(index) == ["chr1", "chrM"]
+    assert index["chr1"].length == 25
+    (tmp_path / "bad.fai").write_text("chr1\tx\n")
+    with pytest.raises(exceptions.InvalidFormat):
+        read_fai(tmp_path / "bad.fai")
+
+
+def test_indexed_fasta_fetch(fasta_path):
+    with IndexedFasta(fasta_path) as fasta:
+        assert fasta.fetch("chr1", 1, 4) == "ACGT"
+        assert fasta.fetch("chr1", 9, 12) == "ACGG"
+        assert fasta.fetch("chr1", 20, 30) == "CTTTTT"
+        assert fasta.fetch("chr1", 26, 30) == ""
+        assert fasta.fetch("chrM", 1, 5) == "ACGTN"
+        with pytest.raises(KeyError):
+            fasta.fetch("chr2", 1, 1)
+        assert fasta.contig_name("1") == "chr1"
+        assert fasta.contig_name("chr1") == "chr1"
+        assert fasta.contig_name("MT") == "chrM"
+        assert fasta.contig_name("2") is None
+
+
+def test_indexed_fasta_missing_index(tmp_path):
+    (tmp_path / "genome.fa").write_text(">chr1\nACGT\n")
+    with pytest.raises(exceptions.IOException):
+        IndexedFasta(tmp_path / "genome.fa")
@@ -3,13 +3,21 @@ import pathlib
 import pytest
 
 from clinvar_api.msg import (
+    AlleleOrigin,
     Assembly,
     Chromosome,
     ClinicalSignificanceDescription,
     ModeOfInheritance,
+    ReleaseStatus,
 )
 from clinvar_this import exceptions
-from clinvar_this.io.tsv import TsvRecord, read_tsv
+from clinvar_this.io.tsv import (
+    TsvRecord,
+    apply_batch_metadata,
+    batch_metadata_from_mapping,
+    read_tsv,
+    tsv_records_to_submission_container,
+)
 
 DATA_DIR = pathlib.Path(__file__).parent / "data"
 
@@ -59,3 +67,21 @@ def test_read_tsv_path_bad():
 def test_read_tsv_error():
     with pytest.raises(TypeError):
         read_tsv()
+
+
+def test_apply_batch_metadata():
+    container = tsv_records_to_submission_container(
+        read_tsv(path=DATA_DIR / "example.tsv"),
+        batch_metadata_from_mapping((), use_defaults=True),
+    )
+    updated = apply_batch_metadata(
+        container, batch_metadata_from_mapping(("release_status=hold until published",))
+    )
+    assert updated.clinvar_submission_release_status == ReleaseStatus.HOLD_UNTIL_PUBLISHED
+    assert updated.clinvar_submission[0] is container.clinvar_submission[0]
+
+    updated = apply_batch_metadata(
+        container, batch_metadata_from_mapping(("allele_origin=somatic",))
+    )
+    assert updated.clinvar_submission[0].observed_in[0].allele_origin == AlleleOrigin.SOMATIC
+    assert updated.clinvar_submission_release_status == ReleaseStatus.PUBLIC
@@ -0,0 +1,185 @@
+import gzip
+import typing
+
+import attrs
+import pytest
+
+from clinvar_api.models import Assembly, Chromosome, ClinicalSignificanceDescription
+from clinvar_this import exceptions, liftover
+from clinvar_this.io.tsv import TsvRecord
+
+#: Chain file with a gapped chain on chr1, a reverse chain on chr2, and one to an alt contig.
+CHAIN = """\
+chain 1000 chr1 1000 + 100 300 chr1 2000 + 500 710 1
+100 10 20
+90
+
+chain 1000 chr2 1000 + 0 50 chr2 500 - 100 150 2
+50
+
+chain 10 chr3 1000 + 0 10 chr1_KI270706v1_random 100 + 0 10 3
+10
+"""
+
+
+@pytest.fixture
+def chain_path(tmp_path):
+    path = tmp_path / "hg19ToHg38.over.chain"
+    path.write_text(CHAIN)
+    return path
+
+
+def make_record(**kwargs) -> TsvRecord:
+    values: typing.Dict[str, typing.Any] = {
+        "assembly": Assembly.GRCH37,
+        "chromosome": Chromosome.CHR1,
+        "pos": 101,
+        "ref": "A",
+        "alt": "G",
+        "omim": [],
+        "inheritance": None,
+        "clinical_significance_description": ClinicalSignificanceDescription.PATHOGENIC,
+        "local_key": "KEY",
+    }
+    values.update(kwargs)
+    return TsvRecord(**values)
+
+
+def test_build_index(chain_path):
+    index = liftover.build_index(chain_path)
+    assert index.blocks["chr1"].starts == [100, 210]
+    assert index.blocks["chr1"].ends == [200, 300]
+    assert index.blocks["chr1"].query_starts == [500, 620]
+    assert index.blocks["chr2"].reverse == [True]
+    assert index.query_contigs == [("chr1", 2000), ("chr2", 500), ("chr1_KI270706v1_random", 100)]
+
+
+def test_build_index_gzip(chain_path, tmp_path):
+    gz_path = tmp_path / "chain.gz"
+    gz_path.write_bytes(gzip.compress(CHAIN.encode()))
+    assert liftover.build_index(gz_path) == liftover.build_index(chain_path)
+
+
+def test_build_index_invalid(tmp_path):
+    path = tmp_path / "invalid.chain"
+    path.write_text("chain 1000 chr1\n")
+    with pytest.raises(exceptions.InvalidFormat):
+        liftover.build_index(path)
+    path.write_text("100 10 20\n")
+    with pytest.raises(exceptions.InvalidFormat):
+        liftover.build_index(path)
+
+
+@pytest.mark.parametrize(
+    "contig,pos,length,expected",
+    [
+        ("chr1", 101, 1, liftover.Mapping("chr1", 501, False)),
+        ("chr1", 200, 1, liftover.Mapping("chr1", 600, False)),
+        ("chr1", 211, 2, liftover.Mapping("chr1", 621, False)),
+        ("chr1", 201, 1, None),  # in gap
+        ("chr1", 199, 3, None),  # spans gap
+        ("chr1", 100, 1, None),  # before chain
+        ("chr1", 301, 1, None),  # after chain
+        ("chr2", 1, 2, liftover.Mapping("chr2", 399, True)),
+        ("chr4", 1, 1, None),
+    ],
+)
+def test_chain_index_map(chain_path, contig, pos, length, expected):
+    assert liftover.build_index(chain_path).map(contig, pos, length) == expected
+
+
+def test_load_index_cached(chain_path, monkeypatch):
+    index = liftover.load_index(chain_path)
+    assert liftover.load_index(str(chain_path)) is index
+    assert chain_path.with_name(chain_path.name + liftover.INDEX_SUFFIX).exists()
+
+    liftover._load_index.cache_clear()
+    monkeypatch.setattr(liftover, "build_index", None)  # must be loaded from pickle
+    assert liftover.load_index(chain_path) == index
+
+    with pytest.raises(exceptions.IOException):
+        liftover.load_index(chain_path.with_name("missing.chain"))
+
+
+@pytest.mark.parametrize(
+    "record,expected,reason",
+    [
+        (
+            make_record(),
+            make_record(assembly=Assembly.GRCH38, pos=501),
+            None,
+        ),
+        (
+            make_record(chromosome=Chromosome.CHR2, pos=1, ref="AC", alt="GT"),
+            make_record(
+                assembly=Assembly.GRCH38, chromosome=Chromosome.CHR2, pos=399, ref="GT", alt="AC"
+            ),
+            None,
+        ),
+        (make_record(chromosome=Chromosome.CHR2, pos=1, ref="A", alt="AT"), None, "reverse"),
+        (make_record(pos=199, ref="ACG"), None, "ungapped"),
+        (make_record(chromosome=Chromosome.CHR3, pos=1), None, "contig"),
+        (make_record(chromosome=Chromosome.CHR4), None, "not in chain file"),
+    ],
+)
+def test_lift_record(chain_path, record, expected, reason):
+    lifted, message = liftover.lift_record(
+        liftover.build_index(chain_path), record, Assembly.GRCH38
+    )
+    if reason is None:
+        assert (lifted, message) == (expected, None)
+    else:
+        assert lifted == record
+        assert message and reason in message
+
+
+@pytest.mark.parametrize(
+    "first,second,expected",
+    [
+        (Assembly.GRCH38, Assembly.GRCH38, True),
+        (Assembly.GRCH38, Assembly.HG38, True),
+        (Assembly.HG19, Assembly.GRCH37, True),
+        (Assembly.HG18, Assembly.NCBI36, True),
+        (Assembly.GRCH37, Assembly.GRCH38, False),
+        (Assembly.HG19, Assembly.HG38, False),
+    ],
+)
+def test_same_assembly(first, second, expected):
+    assert liftover.same_assembly(first, second) is expected
+
+
+def test_lift_tsv_records(chain_path):
+    records = [
+        make_record(local_key="MAPPED"),
+        make_record(assembly=Assembly.HG19, local_key="HG19"),
+        make_record(assembly=Assembly.GRCH38, local_key="GRCH38"),
+        make_record(assembly=Assembly.HG38, local_key="HG38"),
+        make_record(chromosome=Chromosome.CHR4, local_key="UNMAPPED"),
+        make_record(assembly=Assembly.NCBI36, local_key="NCBI36"),
+    ]
+    lifted, unmapped = liftover.lift_tsv_records(
+        records, liftover.build_index(chain_path), Assembly.GRCH38
+    )
+    assert lifted == [
+        attrs.evolve(records[0], assembly=Assembly.GRCH38, pos=501),
+        attrs.evolve(records[1], assembly=Assembly.GRCH38, pos=501),
+        records[2],
+        records[3],
+    ]
+    assert [record.local_key for record in unmapped] == ["UNMAPPED", "NCBI36"]
+    assert unmapped[0].extra_data[liftover.UNMAPPED_REASON] == "chromosome 4 not in chain file"
+    assert (
+        unmapped[1].extra_data[liftover.UNMAPPED_REASON]
+        == "assembly NCBI36 is not the chain's source GRCh37"
+    )
+
+
+def test_lift_tsv_records_source(chain_path):
+    records = [make_record(local_key="GRCH37"), make_record(assembly=Assembly.NCBI36)]
+    lifted, unmapped = liftover.lift_tsv_records(
+        records, liftover.build_index(chain_path), Assembly.GRCH38, Assembly.NCBI36
+    )
+    assert lifted == [attrs.evolve(records[1], assembly=Assembly.GRCH38, pos=501)]
+    assert [record.local_key for record in unmapped] == ["GRCH37"]
+    with pytest.raises(exceptions.ArgumentsError):
+        liftover.lift_tsv_records(records, liftover.build_index(chain_path), Assembly.NCBI36)
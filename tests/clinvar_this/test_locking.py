@@ -0,0 +1,32 @@
+import multiprocessing
+import time
+
+import pytest
+
+from clinvar_this import exceptions, locking
+
+
+def hold_lock(batch_dir, locked, release):
+    with locking.batch_lock(batch_dir, timeout=1):
+        locked.set()
+        release.wait(5)
+
+
+def test_batch_lock(tmp_path):
+    with locking.batch_lock(tmp_path, timeout=0):
+        pass
+    locked, release = multiprocessing.Event(), multiprocessing.Event()
+    process = multiprocessing.Process(target=hold_lock, args=(tmp_path, locked, release))
+    process.start()
+    try:
+        assert locked.wait(5)
+        start = time.monotonic()
+        with pytest.raises(exceptions.LockTimeout):
+            with locking.batch_lock(tmp_path, timeout=0.2):
+                pass
+        assert time.monotonic() - start >= 0.2
+    finally:
+        release.set()
+        process.join()
+    with locking.batch_lock(tmp_path, timeout=1):
+        pass
@@ -0,0 +1,71 @@
+import attrs
+import pytest
+
+from clinvar_api import models
+from clinvar_this import merge
+
+
+def local_keys(container):
+    return [record.local_key for record in container.clinvar_submission]
+
+
+def test_merge_add_update_keep(make_record, make_container):
+    base = make_container(make_record("a", accession="SCV1"), make_record("b"), make_record("c"))
+    patch = make_container(
+        make_record("d", start=400), make_record("b", significance="Benign"), make_record("a")
+    )
+    result, summary = merge.merge_submission_containers(base, patch)
+    assert local_keys(result) == ["a", "b", "c", "d"]
+    assert result.clinvar_submission[0].clinvar_accession == "SCV1"
+    assert (
+        result.clinvar_submission[1].clinical_significance.clinical_significance_description
+        == models.ClinicalSignificanceDescription.BENIGN
+    )
+    assert summary.added == ["d"]
+    assert summary.updated == ["b"]
+    assert summary.unchanged == ["a"]
+    assert summary.kept == ["c"]
+    assert summary.deleted == []
+
+
+def test_merge_delete_missing(make_record, make_container):
+    base = make_container(make_record("a"), make_record("b"))
+    result, summary = merge.merge_submission_containers(
+        base, make_container(make_record("b")), merge.MergeOptions(delete_missing=True)
+    )
+    assert local_keys(result) == ["b"]
+    assert summary.deleted == ["a"]
+
+
+def test_merge_match_variants(make_record, make_container):
+    base = make_container(make_record("a", accession="SCV1"))
+    patch = make_container(make_record("x", significance="Benign"))
+    result, summary = merge.merge_submission_containers(base, patch)
+    assert local_keys(result) == ["a", "x"]
+    result, summary = merge.merge_submission_containers(
+        base, patch, merge.MergeOptions(match_variants=True)
+    )
+    assert local_keys(result) == ["a"]
+    assert summary.updated == ["a"]
+
+
+def test_merge_field_policies(make_record, make_container):
+    base = make_container(make_record("a"))
+    patch = make_container(attrs.evolve(make_record("a", significance="Benign"), local_id="other"))
+    options = merge.MergeOptions(
+        field_policies=merge.parse_field_policies(
+            ["clinical_significance=keep", "local_id=overwrite"]
+        )
+    )
+    result, summary = merge.merge_submission_containers(base, patch, options)
+    assert result.clinvar_submission[0].local_id == "other"
+    assert (
+        result.clinvar_submission[0].clinical_significance
+        == base.clinvar_submission[0].clinical_significance
+    )
+
+
+@pytest.mark.parametrize("value", ["clinical_significance", "unknown=keep", "local_id=replace"])
+def test_parse_field_policies_invalid(value):
+    with pytest.raises(ValueError):
+        merge.parse_field_policies([value])
@@ -0,0 +1,64 @@
+import attrs
+import pytest
+
+from clinvar_api.models import Assembly, Chromosome, ClinicalSignificanceDescription
+from clinvar_this import normalize
+from clinvar_this.io.fasta import IndexedFasta
+from clinvar_this.io.tsv import TsvRecord
+
+#: Sequence of chromosome 1 of the test genome.
+CHR1 = "GATTACACACAGTTTTTTG"
+
+
+@pytest.fixture
+def fasta(tmp_path):
+    path = tmp_path / "genome.fa"
+    path.write_text(f">1\n{CHR1}\n")
+    path.with_name("genome.fa.fai").write_text(f"1\t{len(CHR1)}\t3\t{len(CHR1)}\t{len(CHR1) + 1}\n")
+    with IndexedFasta(path) as result:
+        yield result
+
+
+def test_window_reader(fasta):
+    reader = normalize.WindowReader(fasta, window_size=4, max_windows=2)
+    assert reader.fetch("1", 1, 19) == CHR1
+    assert reader.reads == 5
+    assert reader.fetch("1", 3, 6) == "TTAC"
+    assert reader.fetch("1", 18, 25) == "TG"
+    assert reader.reads == 8
+    assert reader.fetch("1", 18, 19) == "TG"
+    assert reader.reads == 8
+
+
+@pytest.mark.parametrize(
+    "variant,expected",
+    [
+        ((2, "A", "G"), (2, "A", "G")),  # SNV
+        ((9, "ACA", "A"), (4, "TAC", "T")),  # deletion of repeat unit
+        ((11, "A", "ACA"), (4, "T", "TAC")),  # insertion into repeat
+        ((12, "GT", "GTT"), (12, "G", "GT")),  # insertion into T stretch
+        ((11, "AGT", "AGC"), (13, "T", "C")),  # shared prefix trimmed
+        ((5, "ACA", "ACA"), (5, "ACA", "ACA")),  # no change
+    ],
+)
+def test_normalize_variant(fasta, variant, expected):
+    reader = normalize.WindowReader(fasta)
+    assert normalize.normalize_variant(reader, "1", *variant) == expected
+
+
+def test_normalize_tsv_records(fasta):
+    record = TsvRecord(
+        assembly=Assembly.GRCH37,
+        chromosome=Chromosome.CHR1,
+        pos=9,
+        ref="ACA",
+        alt="A",
+        omim=[],
+        inheritance=None,
+        clinical_significance_description=ClinicalSignificanceDescription.PATHOGENIC,
+        local_key="KEY",
+    )
+    mismatch = attrs.evolve(record, ref="GG", local_key="MISMATCH")
+    other = attrs.evolve(record, assembly=Assembly.GRCH38, local_key="OTHER")
+    result = normalize.normalize_tsv_records([record, mismatch, other], {"GRCh37": fasta})
+    assert result == [attrs.evolve(record, pos=4, ref="TAC", alt="T"), mismatch, other]
@@ -0,0 +1,73 @@
+import pytest
+
+from clinvar_this import exceptions
+from clinvar_this.recordstore import RecordStore
+
+
+def make_payload(*records, **fields):
+    return {**fields, "clinvar_submission": list(records)}
+
+
+def test_record_store_write_load(tmp_path):
+    store = RecordStore(tmp_path / "records")
+    assert not RecordStore.exists(store.path)
+    assert store.load() is None
+
+    a, b, c = {"local_key": "a"}, {"local_key": "b"}, {"local_key": "c"}
+    assert store.write("20221201000000", make_payload(a, b, c, name="x")) == 3
+    assert RecordStore.exists(store.path)
+    b2 = {"local_key": "b", "accession": "SCV1"}
+    d = {"local_key": "d"}
+    assert store.write("20221202000000", make_payload(a, b2, d, name="x")) == 3
+    assert store.write("20221203000000", make_payload(a, b2, d, name="y")) == 0
+
+    assert store.load() == make_payload(a, b2, d, name="y")
+    assert store.load(upto="20221201000000") == make_payload(a, b, c, name="x")
+    assert store.load(upto="20221202120000") == make_payload(a, b2, d, name="x")
+    assert store.load(upto="20221130000000") is None
+    assert store.latest_timestamp() == "20221203000000"
+
+
+def test_record_store_recovers_from_partial_write(tmp_path):
+    store = RecordStore(tmp_path)
+    store.write("20221201000000", make_payload({"local_key": "a"}, {"local_key": "b"}))
+    with store.records_path.open("ab") as outputf:
+        outputf.write(b'{"ts": "20221202000000", "local_key": "a", "rec')
+    assert store.load() == make_payload({"local_key": "a"}, {"local_key": "b"})
+    assert store.latest_timestamp() == "20221201000000"
+
+
+def test_record_store_order(tmp_path):
+    store = RecordStore(tmp_path)
+    a, b, c = {"local_key": "a"}, {"local_key": "b"}, {"local_key": "c"}
+    c2 = {"local_key": "c", "n": 2}
+    store.write("20221201000000", make_payload(a, b, c))
+    store.write("20221202000000", make_payload(a, c))
+    store.write("20221203000000", make_payload(a, b, c2))
+    assert store.load() == make_payload(a, c2, b)
+
+
+def test_record_store_requires_unique_keys(tmp_path):
+    store = RecordStore(tmp_path)
+    with pytest.raises(exceptions.InvalidFormat):
+        store.write("20221201000000", make_payload({"local_key": "a"}, {"local_key": "a"}))
+
+
+def test_record_store_compact(tmp_path):
+    store = RecordStore(tmp_path / "records")
+    a, b, c = {"local_key": "a"}, {"local_key": "b"}, {"local_key": "c"}
+    store.write("20221201000000", make_payload(a, b, c, name="x"))
+    a2, a3 = {"local_key": "a", "n": 2}, {"local_key": "a", "n": 3}
+    store.write("20221202000000", make_payload(a2, b, c, name="y"))
+    store.write("20221203000000", make_payload(a3, b, name="z"))
+    assert store.versions() == ["20221201000000", "20221202000000", "20221203000000"]
+
+    size = store.records_path.stat().st_size
+    keep = ["20221201000000", "20221203000000"]
+    assert store.compact(keep, dry_run=True) > 0
+    assert store.records_path.stat().st_size == size
+    assert store.compact(keep) > 0
+    assert store.versions() == keep
+    assert store.load() == make_payload(a3, b, name="z")
+    assert store.load(upto="20221201000000") == make_payload(a, b, c, name="x")
+    assert store.compact(keep) == 0
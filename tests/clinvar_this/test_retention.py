@@ -0,0 +1,114 @@
+import datetime
+import json
+
+import attrs
+import pytest
+
+from clinvar_this import retention, storage
+from clinvar_this.index import BatchIndex
+
+
+@pytest.fixture
+def write_versions(make_record, make_container):
+    """Factory writing ``count`` payload versions that each change one of four records."""
+
+    def write(batch_index, count):
+        records = [make_record(key) for key in "abcd"]
+        containers = []
+        for i in range(count):
+            records[i % 4] = attrs.evolve(records[i % 4], clinvar_accession=f"SCV{i:09d}")
+            containers.append(make_container(*records))
+            storage.write_payload(batch_index, "batch", containers[-1])
+        return containers
+
+    return write
+
+
+def test_collect_batch_payloads(tmp_path, write_versions):
+    batch_index = BatchIndex(tmp_path)
+    containers = write_versions(batch_index, 6)
+    files = batch_index.list_files("batch", storage.PAYLOAD_KINDS)
+    assert [kind for _, kind, _ in files] == ["payload"] + ["payload-delta"] * 5
+    submitted = files[1][0]
+    batch_index.add_submission("batch", submitted, "SUB000001")
+
+    policy = retention.RetentionPolicy(keep_last=2)
+    reclaimed = retention.collect_batch(batch_index, "batch", policy, dry_run=True)
+    assert reclaimed > 0
+    assert len(batch_index.list_files("batch", storage.PAYLOAD_KINDS)) == 6
+    assert retention.collect_batch(batch_index, "batch", policy) > 0
+
+    files = batch_index.list_files("batch", storage.PAYLOAD_KINDS)
+    assert [(timestamp, kind) for timestamp, kind, _ in files][0] == (submitted, "payload")
+    assert [kind for _, kind, _ in files] == ["payload", "payload", "payload-delta"]
+    assert sorted(path.name for _, _, path in files) == sorted(
+        path.name for path in (tmp_path / "batch").glob("payload*")
+    )
+    assert storage.load_payload(batch_index, "batch") == containers[-1]
+    assert storage.load_payload(batch_index, "batch", upto=submitted) == containers[1]
+
+    batch_index.rebuild()
+    assert len(batch_index.list_files("batch", storage.PAYLOAD_KINDS)) == 3
+
+
+def test_collect_batch_keep_days(tmp_path, write_versions):
+    batch_index = BatchIndex(tmp_path)
+    write_versions(batch_index, 3)
+    policy = retention.RetentionPolicy(keep_last=1, keep_days=1)
+    assert retention.collect_batch(batch_index, "batch", policy) == 0
+    later = datetime.datetime.now() + datetime.timedelta(days=2)
+    assert retention.collect_batch(batch_index, "batch", policy, now=later) > 0
+    assert len(batch_index.list_files("batch", storage.PAYLOAD_KINDS)) == 1
+
+
+def test_collect_batch_orphan_deltas(tmp_path, write_versions):
+    batch_index = BatchIndex(tmp_path)
+    write_versions(batch_index, 3)
+    (base_timestamp, _, base_path), *deltas = batch_index.list_files("batch", storage.PAYLOAD_KINDS)
+    batch_index.remove_file("batch", "payload", base_timestamp, base_path.name)
+    base_path.unlink()
+
+    policy = retention.RetentionPolicy(keep_last=1)
+    assert retention.collect_batch(batch_index, "batch", policy) == 0
+    assert batch_index.list_files("batch", storage.PAYLOAD_KINDS) == deltas
+    assert all(path.exists() for _, _, path in deltas)
+
+
+def test_collect_batch_retrieve_responses(tmp_path, spool_summary, write_versions):
+    batch_index = BatchIndex(tmp_path)
+    write_versions(batch_index, 1)
+    timestamp, _ = storage.write_json(batch_index, "batch", "submission-response", {"id": "SUB1"})
+    batch_index.add_submission("batch", timestamp, "SUB1")
+    for i, status in enumerate(("submitted", "processing", "processed")):
+        timestamp, _ = storage.write_retrieve_response(
+            batch_index,
+            "batch",
+            "SUB1",
+            {"actions": [{"status": status}]},
+            {
+                f"https://example.com/{i}": spool_summary(
+                    json.dumps(
+                        {
+                            "submissionName": f"SUB{i}",
+                            "submissionDate": "2021-03-25",
+                            "batchProcessingStatus": "In processing",
+                            "batchReleaseStatus": "Not released",
+                            "totalCount": 0,
+                            "totalErrors": 0,
+                            "totalSuccess": 0,
+                            "totalPublic": 0,
+                        }
+                    ).encode("utf-8")
+                )
+            },
+        )
+        batch_index.add_status("batch", timestamp, status, "SUB1")
+
+    policy = retention.RetentionPolicy(keep_last=1)
+    assert retention.collect_batch(batch_index, "batch", policy) > 0
+    ((_, _, path),) = batch_index.list_files("batch", ("retrieve-response",))
+    assert storage.load_retrieve_response(path)["status"]["actions"][0]["status"] == "processed"
+    assert len(list((tmp_path / "batch" / storage.SUMMARIES_DIRNAME).iterdir())) == 1
+    assert batch_index.list_statuses("batch") == [(timestamp, "SUB1", "processed")]
+    assert batch_index.list_batch_infos(names=["batch"])[0].state == "processed"
+    assert len(batch_index.list_files("batch", ("submission-response",))) == 1
@@ -0,0 +1,235 @@
+import hashlib
+import json
+
+import attrs
+import pytest
+
+from clinvar_this import exceptions, storage
+from clinvar_this.index import BatchIndex
+
+
+def test_new_timestamp():
+    assert storage.new_timestamp("20991231235959") == "21000101000000"
+    assert storage.new_timestamp("20000101000000") > "20000101000000"
+
+
+def test_compute_apply_delta():
+    previous = {"clinvar_submission": [{"local_key": "a"}, {"local_key": "b", "x": 1}]}
+    current = {
+        "submission_name": "x",
+        "clinvar_submission": [{"local_key": "b", "x": 2}, {"local_key": "c"}],
+    }
+    delta = storage.compute_delta(previous, current)
+    assert delta == {
+        "container": {"submission_name": "x"},
+        "upsert": [{"local_key": "b", "x": 2}, {"local_key": "c"}],
+        "delete": ["a"],
+    }
+    assert storage.apply_delta(previous, delta) == current
+
+
+def test_compute_delta_duplicate_keys():
+    previous = {"clinvar_submission": [{"local_key": "a"}, {"local_key": "a"}]}
+    assert storage.compute_delta(previous, {"clinvar_submission": []}) is None
+
+
+def test_write_load_payload(tmp_path, make_record, make_container):
+    batch_index = BatchIndex(tmp_path)
+    assert storage.load_payload(batch_index, "batch") is None
+
+    records = [make_record(f"key-{i}") for i in range(10)]
+    first = make_container(*records)
+    storage.write_payload(batch_index, "batch", first)
+    second = make_container(*records[:9], attrs.evolve(records[9], clinvar_accession="SCV1"))
+    storage.write_payload(batch_index, "batch", second, previous=first)
+    third = make_container(*records[1:9], make_record("key-10"))
+    storage.write_payload(batch_index, "batch", third)
+
+    files = batch_index.list_files("batch", storage.PAYLOAD_KINDS)
+    assert [kind for _, kind, _ in files] == ["payload", "payload-delta", "payload-delta"]
+    assert storage.load_payload(batch_index, "batch") == attrs.evolve(
+        third, clinvar_submission=records[1:9] + [make_record("key-10")]
+    )
+    assert storage.load_payload(batch_index, "batch", upto=files[1][0]) == second
+    assert storage.load_payload(batch_index, "batch", upto=files[0][0]) == first
+
+
+def test_write_payload_compaction(tmp_path, monkeypatch, make_record, make_container):
+    monkeypatch.setattr(storage, "COMPACTION_INTERVAL", 2)
+    batch_index = BatchIndex(tmp_path)
+    records = [make_record(f"key-{i}") for i in range(10)]
+    for i in range(5):
+        records[i] = attrs.evolve(records[i], clinvar_accession=f"SCV{i}")
+        storage.write_payload(batch_index, "batch", make_container(*records))
+    files = batch_index.list_files("batch", storage.PAYLOAD_KINDS)
+    assert [kind for _, kind, _ in files] == [
+        "payload",
+        "payload-delta",
+        "payload-delta",
+        "payload",
+        "payload-delta",
+    ]
+    assert storage.load_payload(batch_index, "batch") == make_container(*records)
+
+
+def test_write_payload_large_change_is_full(tmp_path, make_record, make_container):
+    batch_index = BatchIndex(tmp_path)
+    storage.write_payload(batch_index, "batch", make_container(make_record("a"), make_record("b")))
+    storage.write_payload(batch_index, "batch", make_container(make_record("c"), make_record("d")))
+    files = batch_index.list_files("batch", storage.PAYLOAD_KINDS)
+    assert [kind for _, kind, _ in files] == ["payload", "payload"]
+
+
+def test_load_payload_missing_base(tmp_path):
+    batch_index = BatchIndex(tmp_path)
+    batch_index.add_file("batch", "payload-delta", "20221201120000", "x.json")
+    with pytest.raises(exceptions.IOException):
+        storage.load_payload(batch_index, "batch")
+
+
+def test_load_payload_cache(tmp_path, monkeypatch, make_record, make_container):
+    batch_index = BatchIndex(tmp_path)
+    container = make_container(*[make_record(f"key-{i}") for i in range(3)])
+    storage.write_payload(batch_index, "batch", container)
+    assert (tmp_path / "batch" / storage.PAYLOAD_CACHE_FILENAME).exists()
+
+    def fail(*args, **kwargs):
+        raise AssertionError("payload JSON should not be read")
+
+    with monkeypatch.context() as m:
+        m.setattr(storage, "read_json", fail)
+        assert storage.load_payload(batch_index, "batch") == container
+
+    # a changed snapshot file invalidates the cache
+    (path,) = [path for _, _, path in batch_index.list_files("batch", storage.PAYLOAD_KINDS)]
+    path.write_text(path.read_text().replace("key-0", "key-x"))
+    assert storage.load_payload(batch_index, "batch").clinvar_submission[0].local_key == "key-x"
+
+
+def test_load_payload_corrupt_cache(tmp_path, make_record, make_container):
+    batch_index = BatchIndex(tmp_path)
+    container = make_container(make_record("a"))
+    storage.write_payload(batch_index, "batch", container)
+    (tmp_path / "batch" / storage.PAYLOAD_CACHE_FILENAME).write_bytes(b"garbage")
+    assert storage.load_payload(batch_index, "batch") == container
+
+
+def test_write_json_atomic(tmp_path, monkeypatch):
+    batch_index = BatchIndex(tmp_path)
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("disk full")
+
+    monkeypatch.setattr(storage.json, "dump", fail)
+    with pytest.raises(RuntimeError):
+        storage.write_json(batch_index, "batch", "submission-response", {"id": "SUB1"})
+    assert list((tmp_path / "batch").iterdir()) == []
+    assert batch_index.list_files("batch", ("submission-response",)) == []
+
+
+def make_summary(name: str) -> bytes:
+    return json.dumps(
+        {
+            "submissionName": name,
+            "submissionDate": "2021-03-25",
+            "batchProcessingStatus": "Success",
+            "batchReleaseStatus": "Not released",
+            "totalCount": 0,
+            "totalErrors": 0,
+            "totalSuccess": 0,
+            "totalPublic": 0,
+        }
+    ).encode("utf-8")
+
+
+def test_write_load_retrieve_response(tmp_path, spool_summary):
+    batch_index = BatchIndex(tmp_path)
+    url = "https://example.com/summary.json"
+    body = make_summary("SUB1")
+    status = {"actions": [{"status": "processed", "updated": "2021-03-25T10:00:00"}]}
+    raw_summary = spool_summary(body)
+    timestamp, path = storage.write_retrieve_response(
+        batch_index, "batch", "SUB1", status, {url: raw_summary}
+    )
+    assert not raw_summary.path.exists()
+    summary_paths = list((tmp_path / "batch" / storage.SUMMARIES_DIRNAME).iterdir())
+    assert [p.name for p in summary_paths] == [f"{hashlib.sha256(body).hexdigest()}.json"]
+    assert summary_paths[0].read_bytes() == body
+    response = storage.load_retrieve_response(path)
+    assert response["status"] == status
+    assert response["summaries"][url]["submission_name"] == "SUB1"
+
+    polled = {"actions": [{"status": "processed", "updated": "2021-03-25T11:00:00"}]}
+    raw_summary = spool_summary(body)
+    assert (
+        storage.write_retrieve_response(batch_index, "batch", "SUB1", polled, {url: raw_summary})
+        is None
+    )
+    assert not raw_summary.path.exists()
+
+    storage.write_json(batch_index, "batch", "submission-response", {"id": "SUB2"})
+    assert storage.write_retrieve_response(
+        batch_index, "batch", "SUB2", status, {url: spool_summary(body)}
+    )
+    changed = {"actions": [{"status": "error"}]}
+    _, changed_path = storage.write_retrieve_response(
+        batch_index, "batch", "SUB2", changed, {url: spool_summary(body)}
+    )
+    assert len(batch_index.list_files("batch", ("retrieve-response",))) == 3
+    assert len(list((tmp_path / "batch" / storage.SUMMARIES_DIRNAME).iterdir())) == 1
+    assert storage.load_retrieve_response(changed_path)["status"] == changed
+
+    _, other_path = storage.write_retrieve_response(
+        batch_index, "batch", "SUB2", changed, {url: spool_summary(make_summary("SUB2"))}
+    )
+    assert len(list((tmp_path / "batch" / storage.SUMMARIES_DIRNAME).iterdir())) == 2
+    response = storage.load_retrieve_response(other_path)
+    assert response["summaries"][url]["submission_name"] == "SUB2"
+
+
+def test_write_retrieve_response_compressed(tmp_path, spool_summary):
+    batch_index = BatchIndex(tmp_path)
+    url = "https://example.com/summary.json"
+    _, path = storage.write_retrieve_response(
+        batch_index,
+        "batch",
+        "SUB1",
+        {"actions": [{"status": "processed"}]},
+        {url: spool_summary(make_summary("SUB1"))},
+        compression="gzip",
+    )
+    (summary_path,) = (tmp_path / "batch" / storage.SUMMARIES_DIRNAME).iterdir()
+    assert summary_path.name.endswith(".json.gz")
+    response = storage.load_retrieve_response(path)
+    assert response["summaries"][url]["submission_name"] == "SUB1"
+
+
+def test_load_retrieve_response_inline(tmp_path):
+    batch_index = BatchIndex(tmp_path)
+    response = {"status": {"actions": []}, "summaries": {"https://example.com/": {"n": 1}}}
+    _, path = storage.write_json(batch_index, "batch", "retrieve-response", response)
+    assert storage.load_retrieve_response(path) == response
+
+
+def test_variant_rows():
+    coords = {"assembly": "GRCh37", "chromosome": "7", "start": 100, "stop": 100}
+    payload = {
+        "clinvar_submission": [
+            {
+                "local_key": "KEY1",
+                "variant_set": {
+                    "variant": [
+                        {"chromosome_coordinates": coords},
+                        {"chromosome_coordinates": {**coords, "start": 200, "stop": 200}},
+                    ]
+                },
+            },
+            {"local_key": "KEY2", "clinvar_accession": "SCV000000001"},
+            {"variant_set": {"variant": [{"chromosome_coordinates": coords}]}},
+        ]
+    }
+    assert storage.variant_rows(payload) == [
+        ("KEY1", 0, "GRCh37", "7", 100, 100, None, None, None),
+        ("KEY1", 1, "GRCh37", "7", 200, 200, None, None, None),
+        ("KEY2", 0, None, None, None, None, None, None, "SCV000000001"),
+    ]
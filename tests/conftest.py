@@ -0,0 +1,75 @@
+import typing
+
+import pytest
+
+from clinvar_api import models
+
+
+def _make_record(
+    local_key: str,
+    *,
+    accession: typing.Optional[str] = None,
+    significance: str = "Pathogenic",
+    start: int = 100,
+    stop: typing.Optional[int] = None,
+    ref: str = "A",
+    alt: str = "G",
+) -> models.SubmissionClinvarSubmission:
+    return models.SubmissionClinvarSubmission(
+        local_id=local_key,
+        local_key=local_key,
+        clinvar_accession=accession,
+        record_status=models.RecordStatus.NOVEL,
+        condition_set=models.SubmissionConditionSet(
+            condition=[models.SubmissionCondition(name="not provided")]
+        ),
+        observed_in=[
+            models.SubmissionObservedIn(
+                affected_status=models.AffectedStatus.YES,
+                allele_origin=models.AlleleOrigin.GERMLINE,
+                collection_method=models.CollectionMethod.CLINICAL_TESTING,
+            )
+        ],
+        clinical_significance=models.SubmissionClinicalSignificance(
+            clinical_significance_description=models.ClinicalSignificanceDescription(significance)
+        ),
+        variant_set=models.SubmissionVariantSet(
+            variant=[
+                models.SubmissionVariant(
+                    chromosome_coordinates=models.SubmissionChromosomeCoordinates(
+                        assembly=models.Assembly.GRCH37,
+                        chromosome=models.Chromosome.CHR1,
+                        start=start,
+                        stop=start if stop is None else stop,
+                        reference_allele=ref,
+                        alternate_allele=alt,
+                    )
+                )
+            ]
+        ),
+    )
+
+
+def _make_container(
+    *records: models.SubmissionClinvarSubmission, **fields: typing.Any
+) -> models.SubmissionContainer:
+    values: typing.Dict[str, typing.Any] = {
+        "assertion_criteria": models.SubmissionAssertionCriteria(
+            db=models.CitationDb.PUBMED, id="25741868"
+        ),
+        "clinvar_submission_release_status": models.ReleaseStatus.PUBLIC,
+    }
+    values.update(fields)
+    return models.SubmissionContainer(clinvar_submission=list(records), **values)
+
+
+@pytest.fixture
+def make_record():
+    """Factory for records of a pathogenic germline SNV on chromosome 1 of GRCh37."""
+    return _make_record
+
+
+@pytest.fixture
+def make_container():
+    """Factory for submission containers with the given records and container-level fields."""
+    return _make_container